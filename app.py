@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort,Response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort,Response, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
@@ -13,7 +13,7 @@ import pandas as pd
 import requests # Import requests for API calls
 import json # Import json for API responses and handling
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import Index, create_engine, text, func, cast,or_  # Import func and cast for dashboard queries
+from sqlalchemy import Index, create_engine, text, func, or_  # Import func for dashboard queries
 from dotenv import load_dotenv
 from flask import current_app
 from extensions import db, migrate # ADD THIS LINE AND REMOVE OLD DB/MIGRATE DEFINITIONS
@@ -21,6 +21,40 @@ import io
 from sqlalchemy.orm import joinedload
 import logging
 from sync_api import sync_api
+from stock_valuation import compute_stock_valuation, stocks_by_category as stocks_by_category_from_valuation
+from sales_rollups import record_sale, record_return, rollup_revenue, rollup_sales_by_person, sales_rollups_cli, day_bounds
+from sales_timeseries import sales_timeseries, serialize_timeseries
+from cogs import COST_KEY, compute_cogs, unit_cost_for_item
+from period_cache import get_period_aggregates
+from dashboard_metrics import DASHBOARD_WIDGETS, dashboard_cache, sales_series
+from stock_checkout import base_units, checkout_quantities, decrement_stock, lock_products, restock
+from history_search import SEARCH_PAGE_SIZE, history_search_cli, search_records
+from keyset import keyset_paginate
+from catalog import catalog_changes, catalog_cli
+from product_search import DEFAULT_LIMIT as PRODUCT_SEARCH_LIMIT, matching_items, product_search_cli, search_products
+from sales_ingest import MAX_SALES_PER_REQUEST, ingest_sales
+from barcodes import (
+    MAX_CODES_PER_REQUEST as MAX_BARCODES_PER_REQUEST, BarcodeInUse, barcode_owner, find_item, find_items,
+    item_barcodes, parse_barcodes, set_item_barcodes
+)
+from inventory_import import InvalidInventoryCsv, error_report_path, import_inventory_csv, prune_error_reports
+from inventory_serializers import (
+    detail_view, invoice_form_view, item_picker_view, json_response, sale_form_view, scanner_view, sync_view
+)
+from daily_reports import (
+    build_daily_report, daily_reports_cli, daily_report_sms, init_app as init_daily_reports, parse_closing_time,
+    stored_daily_report
+)
+from sms_outbox import enqueue_sms, init_app as init_sms_outbox, serialize_sms, sms_outbox_cli
+from sales_lines import (
+    QUANTITY_TOLERANCE, category_sales, product_quantity_summary, product_sales, returned_quantities, sales_lines_cli,
+    take_returned_quantities, write_sale_lines
+)
+from low_stock import low_stock_cli, low_stock_query, low_stock_row, on_low_stock_crossing, parse_reorder_point
+from expiry_buckets import (
+    BUCKETS, EXPIRED, EXPIRING_SOON_BUCKETS, EXPIRY_SOON_DAYS, ensure_expiry_buckets_current, expiry_bucket_counts,
+    expiry_buckets_cli, expiry_lookup, expiry_thresholds, items_in_buckets, sale_line_expiry_flag
+)
 from dataclasses import dataclass, asdict
 from typing import Optional, Dict, Any
 import time
@@ -35,8 +69,6 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # --- Global Configuration (if needed for constants) ---
 # Example: Placeholder for external API keys/URLs if they are truly global
 ARKESEL_API_KEY = os.getenv('ARKESEL_API_KEY')
-ARKESEL_SENDER_ID = os.getenv('ARKESEL_SENDER_ID', 'BizApp')  # Max 11 chars
-ARKESEL_SMS_URL = "https://sms.arkesel.com/sms/api" # Correct Arkesel SMS API URL
 REMOTE_SERVER_URL = os.getenv('ONLINE_FLASK_APP_BASE_URL', 'http://localhost:5000')
 # These should ideally come from Business info, but as fallback for SMS or defaults
 ENTERPRISE_NAME = os.getenv('ENTERPRISE_NAME', 'Your Enterprise Name')
@@ -171,12 +203,23 @@ def create_app():
     login_manager.login_message_category = 'info'
     
     # Import models after the extensions have been initialized
-    from models import User, Business, SalesRecord, InventoryItem, HirableItem, RentalRecord, Creditor, Debtor, CompanyTransaction, FutureOrder, Company, Customer, ReturnRecord,Invoice, InvoicePayment
+    from models import User, Business, SalesRecord, InventoryItem, HirableItem, RentalRecord, Creditor, CompanyTransaction, FutureOrder, Company, ReturnRecord,Invoice, InvoicePayment, SmsMessage
     @login_manager.user_loader
     def load_user(user_id):
         # This function is called after tables are created, so it will work.
         return db.session.get(User, user_id)
 
+    app.cli.add_command(sales_rollups_cli)
+    app.cli.add_command(expiry_buckets_cli)
+    app.cli.add_command(low_stock_cli)
+    app.cli.add_command(sales_lines_cli)
+    app.cli.add_command(history_search_cli)
+    app.cli.add_command(product_search_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(sms_outbox_cli)
+    app.cli.add_command(daily_reports_cli)
+    init_sms_outbox(app)
+    init_daily_reports(app)
 
     
 
@@ -380,85 +423,6 @@ def create_app():
 
         # Then replace the problematic line with:
         print(safe_currency_print(total_displayed_sales, "DEBUG: Total displayed sales"))
-    def serialize_inventory_item(item):
-        """
-        Serializes an InventoryItem object to a dictionary for JSON conversion.
-        Uses getattr for robust attribute access and safe_convert for type handling.
-        Includes comprehensive error logging for debugging.
-        """
-        try:
-            # Use getattr() for robust attribute access.
-            # If an attribute is missing on the 'item' object, getattr returns None.
-            _id = getattr(item, 'id', None)
-            _product_name = getattr(item, 'product_name', None)
-            _category = getattr(item, 'category', None)
-            _purchase_price = getattr(item, 'purchase_price', None)
-            _sale_price = getattr(item, 'sale_price', None)
-            _current_stock = getattr(item, 'current_stock', None)
-            _last_updated = getattr(item, 'last_updated', None)
-            _batch_number = getattr(item, 'batch_number', None)
-            _number_of_tabs = getattr(item, 'number_of_tabs', None)
-            _unit_price_per_tab = getattr(item, 'unit_price_per_tab', None)
-            _item_type = getattr(item, 'item_type', None)
-            _expiry_date = getattr(item, 'expiry_date', None)
-            _is_fixed_price = getattr(item, 'is_fixed_price', None)
-            _fixed_sale_price = getattr(item, 'fixed_sale_price', None)
-            _is_active = getattr(item, 'is_active', None)
-            _barcode = getattr(item, 'barcode', None)
-
-            # Handle dates more defensively:
-            # Check if it's actually a date/datetime object before calling isoformat().
-            last_updated_iso = None
-            if isinstance(_last_updated, (datetime, date)):
-                last_updated_iso = _last_updated.isoformat()
-
-            expiry_date_iso = None
-            if isinstance(_expiry_date, (datetime, date)):
-                expiry_date_iso = _expiry_date.isoformat()
-
-            return {
-                'id': safe_convert(_id, str, ''),
-                'product_name': safe_convert(_product_name, str, 'N/A'),
-                'category': safe_convert(_category, str, 'N/A'),
-                'purchase_price': safe_convert(_purchase_price, float, 0.0),
-                'sale_price': safe_convert(_sale_price, float, 0.0),
-                'current_stock': safe_convert(_current_stock, float, 0.0),
-                'last_updated': last_updated_iso, # Use processed ISO string or None
-                'batch_number': safe_convert(_batch_number, str, 'N/A'),
-                'number_of_tabs': safe_convert(_number_of_tabs, float, 1.0),
-                'unit_price_per_tab': safe_convert(_unit_price_per_tab, float, 0.0),
-                'item_type': safe_convert(_item_type, str, 'N/A'),
-                'expiry_date': expiry_date_iso, # Use processed ISO string or None
-                'is_fixed_price': safe_convert(_is_fixed_price, bool, False),
-                'fixed_sale_price': safe_convert(_fixed_sale_price, float, 0.0),
-                'is_active': safe_convert(_is_active, bool, False),
-                'barcode': safe_convert(_barcode, str, '')
-            }
-        except Exception as e:
-            # Log the specific exception type and message for powerful debugging
-            error_id = getattr(item, 'id', 'UNKNOWN_ID_ERROR')
-            error_product_name = getattr(item, 'product_name', 'UNKNOWN_PRODUCT_NAME_ERROR')
-            print(f"CRITICAL: Serialization failed for item '{error_product_name}' (ID: {error_id}). "
-                f"Exception Type: {e.__class__.__name__}, Message: {str(e)}")
-            # Return a minimal, error-safe dictionary that won't crash the JavaScript.
-            return {
-                "id": "serialization_error_" + str(error_id)[:8], # Unique ID for error items
-                "product_name": f"Serialization Error (ID: {str(error_id)[:8]})",
-                "current_stock": 0.0,
-                "sale_price": 0.0,
-                "unit_price_per_tab": 0.0,
-                "number_of_tabs": 1.0,
-                "is_fixed_price": False,
-                "fixed_sale_price": 0.0,
-                "expiry_date": None,
-                "barcode": "",
-                "item_type": "N/A",
-                "category": "N/A",
-                "purchase_price": 0.0,
-                "last_updated": None,
-                "batch_number": "N/A",
-                "is_active": False
-            }
     def serialize_hirable_item(item):
         """
         Serializes a HirableItem object to a dictionary for JSON conversion.
@@ -603,42 +567,6 @@ def create_app():
             'last_updated': business.last_updated.isoformat() if business.last_updated else None
         }
 
-    def serialize_inventory_item_api(item):
-        """Converts an InventoryItem SQLAlchemy object to a JSON-serializable dictionary for API."""
-        return {
-            'id': str(item.id),
-            'business_id': str(item.business_id),
-            'product_name': str(item.product_name),
-            'category': str(item.category),
-            'purchase_price': float(item.purchase_price),
-            'sale_price': float(item.sale_price),
-            'current_stock': float(item.current_stock),
-            'last_updated': item.last_updated.isoformat() if item.last_updated else None,
-            'batch_number': str(item.batch_number) if item.batch_number else None,
-            'number_of_tabs': int(item.number_of_tabs),
-            'unit_price_per_tab': float(item.unit_price_per_tab),
-            'item_type': str(item.item_type),
-            'expiry_date': item.expiry_date.isoformat() if item.expiry_date else None,
-            'is_fixed_price': bool(item.is_fixed_price),
-            'fixed_sale_price': float(item.fixed_sale_price),
-            'is_active': bool(item.is_active)
-        }
-        item_data = {
-            'id': item.id,
-            'product_name': item.product_name,
-            'category': item.category,
-            'purchase_price': item.purchase_price,
-            'sale_price': item.sale_price,
-            'current_stock': item.current_stock,
-            'is_fixed_price': item.is_fixed_price,
-            'fixed_sale_price': item.fixed_sale_price,
-            # NEW: Add price range fields
-            'use_price_range': getattr(item, 'use_price_range', False),
-            'min_sale_price': getattr(item, 'min_sale_price', 0.0),
-            'preferred_sale_price': getattr(item, 'preferred_sale_price', item.sale_price),
-            'max_sale_price': getattr(item, 'max_sale_price', 0.0)
-        }
-        return item_data
     def serialize_sale_record_api(sale):
         """Converts a SaleRecord SQLAlchemy object to a JSON-serializable dictionary for API."""
         return {
@@ -1591,8 +1519,7 @@ def create_app():
             except ValueError:
                 return jsonify({'message': 'Invalid last_synced_at format. Use ISO 8601.'}), 400
         
-        inventory_items = inventory_query.all()
-        return jsonify([serialize_inventory_item_api(item) for item in inventory_items])
+        return json_response(sync_view.rows(inventory_query))
 
 
     @app.route('/api/v1/inventory', methods=['POST'])
@@ -1766,6 +1693,17 @@ def create_app():
         recorded_count = 0
         errors = []
 
+        # Snapshot purchase costs for every product in the batch with one query
+        batch_product_ids = {sale_data.get('product_id') for sale_data in sales_data if isinstance(sale_data, dict) and sale_data.get('product_id')}
+        products_by_id = {}
+        if batch_product_ids:
+            products_by_id = {
+                product.id: product for product in InventoryItem.query.filter(
+                    InventoryItem.business_id == business_id,
+                    InventoryItem.id.in_(batch_product_ids)
+                ).all()
+            }
+
         for sale_data in sales_data:
             try:
                 # Assuming a new sale record is always created, no 'upsert' for sales for now.
@@ -1805,6 +1743,9 @@ def create_app():
                     'price_at_time_per_unit_sold': price_at_time_per_unit_sold,
                     'total_amount': total_amount
                 }
+                product = products_by_id.get(product_id)
+                if product:
+                    item_data['cost_at_time_per_unit_sold'] = unit_cost_for_item(product, sale_unit_type)
                 
                 new_sale = SalesRecord(
                     id=sale_id, # Use provided ID for idempotency
@@ -1819,7 +1760,9 @@ def create_app():
                     is_synced=True,
                     synced_to_remote=True
                 )
+                write_sale_lines(new_sale)
                 db.session.add(new_sale)
+                record_sale(new_sale)
                 recorded_count += 1
             except Exception as e:
                 errors.append(f"Error processing sale for product '{sale_data.get('product_name', 'N/A')}': {str(e)}")
@@ -1832,6 +1775,35 @@ def create_app():
             'recorded_count': recorded_count,
             'errors': errors
         })
+    @app.route('/api/v1/sales/bulk', methods=['POST'])
+    @api_key_required
+    def api_ingest_sales():
+        """
+        Idempotent bulk push of whole sales from an offline terminal.
+        Expected data: {"sales": [{"idempotency_key", "receipt_number",
+        "transaction_date", "customer_phone", "sales_person_name",
+        "payment_method", "items": [add_sale cart lines]}, ...]}.
+        Returns a status per sale; retrying the same keys is safe.
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business ID is required to record sales.'}), 400
+        if session.get('role') not in ['admin', 'sales']:
+            return jsonify({'success': False, 'message': 'Access denied: Insufficient role to record sales.'}), 403
+
+        data = request.get_json(silent=True) or {}
+        sales = data.get('sales') if isinstance(data, dict) else None
+        if not isinstance(sales, list):
+            return jsonify({'success': False, 'message': 'Request body must be an object with a "sales" array.'}), 400
+        if len(sales) > MAX_SALES_PER_REQUEST:
+            return jsonify({'success': False, 'message': f'At most {MAX_SALES_PER_REQUEST} sales per request; split the push.'}), 413
+
+        results = ingest_sales(business_id, sales, default_sales_person=session.get('username'))
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return jsonify({'success': True, 'counts': counts, 'results': results})
+
     # ... (existing imports and other code) ...
 
     @app.route('/api/get_product_by_barcode', methods=['POST'])
@@ -1840,94 +1812,74 @@ def create_app():
     def get_product_by_barcode():
         """
         API endpoint to fetch product details by barcode or product name.
-        Ensures robust search (case-insensitive, trimmed) and
-        correct, consistent data formatting for frontend consumption.
+        A scanned code must match a product's barcode (or one of its extra
+        barcodes) exactly, see barcodes.py; text that matches no barcode goes
+        to the product search (product_search.py).
         """
         business_id = get_current_business_id()
-        print(f"DEBUG: get_product_by_barcode - business_id: {business_id}")
         if not business_id:
             return jsonify({'success': False, 'message': 'Business context not found.'}), 400
 
-        data = request.get_json()
-        query_string = data.get('barcode', '').strip() # Strip whitespace from input
-        print(f"DEBUG: get_product_by_barcode - Received query_string: '{query_string}'")
+        data = request.get_json(silent=True) or {}
+        query_string = str(data.get('barcode') or '').strip() # Strip whitespace from input
 
         if not query_string:
             return jsonify({'success': False, 'message': 'Barcode or product name not provided.'}), 400
 
-        # 1. Try searching by exact barcode first.
-        # We explicitly handle cases where the barcode might be empty or None in the database.
-        product = InventoryItem.query.filter(
-            InventoryItem.business_id == business_id,
-            (InventoryItem.barcode == query_string) | (InventoryItem.barcode == None) | (InventoryItem.barcode == ''),
-            InventoryItem.is_active == True
-        ).first()
-        print(f"DEBUG: get_product_by_barcode - Product found by exact barcode: {product.product_name if product else 'None'}")
+        # 1. Exact barcode, from the in-process code map
+        product = find_item(business_id, query_string)
 
         if not product:
-            # 2. If not found by exact barcode, try searching by product name
-            # (case-insensitive, partial match on product_name)
-            product = InventoryItem.query.filter(
-                InventoryItem.business_id == business_id,
-                InventoryItem.is_active == True,
-                func.lower(InventoryItem.product_name).ilike(f'%{query_string.lower()}%') # Case-insensitive partial match
-            ).first()
-            print(f"DEBUG: get_product_by_barcode - Product found by product name: {product.product_name if product else 'None'}")
+            # 2. Not a barcode: the best product search match
+            product = next(iter(search_products(business_id, query_string, limit=1)), None)
 
-        if product:
-            # Check stock before returning
-            if product.current_stock <= 0:
-                print(f"DEBUG: Product '{product.product_name}' is out of stock.")
-                return jsonify({
-                    'success': False,
-                    'message': f"Product '{product.product_name}' is out of stock."
-                }), 400
-
-            # Prepare product data for JSON response, ensuring correct types and defaults
-            # This structure ensures all expected keys are always present for the frontend
-            product_data = {
-                'id': str(product.id), # Ensure ID is string for consistency with UUIDs
-                'product_name': product.product_name,
-                'current_stock': float(product.current_stock or 0.0), # Ensure float, default 0.0
-                'is_fixed_price': product.is_fixed_price,
-                'barcode': product.barcode,
-                'number_of_tabs': float(product.number_of_tabs or 1.0), # Ensure float, default 1.0
-                'unit_price_per_tab': float(product.unit_price_per_tab or 0.0), # Ensure float, default 0.0
-                'item_type': product.item_type,
-                'expiry_date': product.expiry_date.strftime('%Y-%m-%d') if product.expiry_date else None,
-                'batch_number': product.batch_number,
-                'purchase_price': float(product.purchase_price or 0.0),
-                'sale_price': float(product.sale_price or 0.0), # Always include regular sale price
-                'fixed_sale_price': float(product.fixed_sale_price or 0.0), # Always include fixed sale price
-                'markup_percentage_pharmacy': float(product.markup_percentage_pharmacy or 0.0) # Always include markup
-            }
-
-            print(f"DEBUG: Product found and returning: {product_data}")
-            return jsonify({'success': True, 'product': product_data})
-        else:
-            # If no product found by barcode or name, suggest similar products if any exist
-            similar_products = InventoryItem.query.filter(
-                InventoryItem.business_id == business_id,
-                InventoryItem.is_active == True,
-                func.lower(InventoryItem.product_name).ilike(f'%{query_string.lower()}%')
-            ).limit(5).all()
-
-            if similar_products:
-                suggestions = [p.product_name for p in similar_products]
-                message = f'Product not found. Did you mean: {", ".join(suggestions)}?'
-                print(f"DEBUG: Product not found, suggesting: {message}")
-                return jsonify({
-                    'success': False,
-                    'message': message
-                }), 404
-            
-            message = 'Product not found for this barcode or name.'
-            print(f"DEBUG: Product not found: {message}")
+        if not product:
             return jsonify({
                 'success': False,
-                'message': message
+                'message': 'Product not found for this barcode or name.'
             }), 404
 
+        # Check stock before returning
+        if product.current_stock <= 0:
+            return jsonify({
+                'success': False,
+                'message': f"Product '{product.product_name}' is out of stock."
+            }), 400
+
+        return jsonify({'success': True, 'product': scanner_view.item(product)})
+
+    @app.route('/api/v1/barcodes/resolve', methods=['POST'])
+    @api_key_required
+    def api_resolve_barcodes():
+        """
+        Resolves a list of scanned codes in one call. Body: {"barcodes": [...]}.
+        Returns one result per code, in order: {'barcode', 'status', 'product'}
+        with status found, out_of_stock (product included) or not_found (exact
+        barcode matches only; no name search).
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+
+        data = request.get_json(silent=True) or {}
+        codes = data.get('barcodes')
+        if not isinstance(codes, list) or not codes:
+            return jsonify({'success': False, 'message': "'barcodes' must be a non-empty list."}), 400
+        if len(codes) > MAX_BARCODES_PER_REQUEST:
+            return jsonify({'success': False, 'message': f'At most {MAX_BARCODES_PER_REQUEST} barcodes per request.'}), 413
+
+        codes = [str(code or '').strip() for code in codes]
+        products = find_items(business_id, codes)
+        results = []
+        for code in codes:
+            product = products.get(code)
+            if product is None:
+                results.append({'barcode': code, 'status': 'not_found', 'product': None})
+            else:
+                status = 'found' if product.current_stock > 0 else 'out_of_stock'
+                results.append({'barcode': code, 'status': status, 'product': scanner_view.item(product)})
+        return jsonify({'success': True, 'results': results})
+
   
 
     def create_database_if_not_exists(app):
@@ -2882,13 +2834,12 @@ def create_app():
                     'last_synced_at': biz.last_synced_at.isoformat() if biz.last_synced_at else None
                 })
             
-            inventory_items = InventoryItem.query.all()
-            inventory_data = [serialize_inventory_item_api(item) for item in inventory_items]
+            inventory_data = sync_view.rows(InventoryItem.query)
             
-            return jsonify({
+            return json_response({
                 'businesses': businesses_data,
                 'inventory': inventory_data
-            }), 200
+            })
         except Exception as e:
             logging.error(f"Error getting full sync data: {e}")
             return jsonify({'error': 'Internal server error'}), 500
@@ -3300,151 +3251,65 @@ def create_app():
         # Now that we've ensured login and business selection, proceed
         username = session.get('username')
         role = session.get('role')
-        business_id = get_current_business_id()
         business_type = get_current_business_type()
 
-        today = date.today()
-        three_months_from_now = today + timedelta(days=90)
-
-        # --- Initialize all dashboard variables to prevent UndefinedError in template ---
-        total_products = 0
-        total_customers = 0
-        total_sales_overall = 0.0
-        today_sales_revenue = 0.0
-        current_stock_value_at_cost = 0.0
-        current_stock_value_at_sale = 0.0
-        total_potential_gross_profit_stock = 0.0
-        overall_stock_profit_margin = 0.0
-        low_stock_items = []
-        expired_items = []
-        expiring_soon_items = []
-        overdue_rentals = []
-        recent_activity = []
-        sales_by_person_today = []
-        total_inventory_items = 0
-
-        # Common filters for queries
-        common_filter_items = InventoryItem.query.filter_by(business_id=business_id, is_active=True)
-
-        # --- Overall Business Metrics (Stock Valuation) ---
-        current_inventory_items = common_filter_items.all()
-        total_inventory_items = len(current_inventory_items)
-
-        for item in current_inventory_items:
-            current_stock = item.current_stock or 0.0
-            number_of_tabs = item.number_of_tabs or 1.0
-
-            # Calculate cost value
-            cost_per_base_unit = float(item.purchase_price / number_of_tabs) if number_of_tabs > 0 else 0.0
-            current_stock_value_at_cost += current_stock * cost_per_base_unit
-
-            # Calculate sale value
-            sale_value_per_base_unit = 0.0
-            if item.is_fixed_price:
-                sale_value_per_base_unit = float(item.fixed_sale_price / number_of_tabs) if number_of_tabs > 0 else 0.0
-            else:
-                if item.item_type == 'Pharmacy':
-                    sale_value_per_base_unit = float(item.purchase_price * (1 + (item.markup_percentage_pharmacy or 0) / 100) / number_of_tabs) if number_of_tabs > 0 else 0.0
-                elif item.item_type == 'Hardware Material':
-                    sale_value_per_base_unit = item.unit_price_per_tab or 0.0
-                else:
-                    sale_value_per_base_unit = float(item.sale_price / number_of_tabs) if number_of_tabs > 0 else 0.0
-            
-            current_stock_value_at_sale += current_stock * sale_value_per_base_unit
-
-        total_potential_gross_profit_stock = current_stock_value_at_sale - current_stock_value_at_cost
-        overall_stock_profit_margin = (total_potential_gross_profit_stock / current_stock_value_at_sale) * 100 if current_stock_value_at_sale > 0 else 0.0
-
-
-        # --- Sales Metrics ---
-        # Total Sales (overall for the business lifetime)
-        total_sales_overall = db.session.query(db.func.sum(SalesRecord.grand_total_amount)).filter_by(business_id=business_id).scalar() or 0.0
-
-        # Total Sales Today
-        today_sales_revenue = db.session.query(db.func.sum(SalesRecord.grand_total_amount)).filter(
-            SalesRecord.business_id == business_id,
-            cast(SalesRecord.transaction_date, db.Date) == today
-        ).scalar() or 0.0
-
-        # Sales by Sales Person Today
-        sales_by_person_today = db.session.query(
-            SalesRecord.sales_person_name,
-            func.sum(SalesRecord.grand_total_amount)
-        ).filter(
-            SalesRecord.business_id == business_id,
-            cast(SalesRecord.transaction_date, db.Date) == today
-        ).group_by(SalesRecord.sales_person_name).order_by(func.sum(SalesRecord.grand_total_amount).desc()).all()
-
-
-        # --- Inventory Management Metrics ---
-        # Low Stock Items
-        low_stock_threshold = 10
-        low_stock_items = common_filter_items.filter(
-            InventoryItem.current_stock <= low_stock_threshold,
-            InventoryItem.current_stock > 0
-        ).order_by(InventoryItem.current_stock).all()
-
-        total_products = total_inventory_items
-
-        # Total Customers
-        total_customers = Customer.query.filter_by(business_id=business_id, is_active=True).count() or 0
-
-        # --- Pharmacy Specific (Expiry Dates) ---
-        if business_type == 'Pharmacy':
-            expired_items = common_filter_items.filter(
-                InventoryItem.expiry_date != None,
-                InventoryItem.expiry_date < today
-            ).order_by(InventoryItem.expiry_date).all()
-
-            expiring_soon_items = common_filter_items.filter(
-                InventoryItem.expiry_date != None,
-                InventoryItem.expiry_date >= today,
-                InventoryItem.expiry_date <= three_months_from_now
-            ).order_by(InventoryItem.expiry_date).all()
-        
-        # --- Hardware Specific (Rental Records) ---
-        if business_type == 'Hardware':
-            overdue_rentals = RentalRecord.query.filter(
-                RentalRecord.business_id == business_id,
-                RentalRecord.return_date == None,
-                RentalRecord.due_date < today
-            ).order_by(RentalRecord.due_date).all()
-
-        # --- Recent Activity (e.g., last 5 sales records) ---
-        recent_activity = SalesRecord.query.filter_by(business_id=business_id).order_by(SalesRecord.transaction_date.desc()).limit(5).all()
-
-
+        # The page is only a shell; every widget is fetched separately from
+        # /api/v1/dashboard/widgets/<name> so a slow one doesn't hold up the rest.
         return render_template('dashboard.html',
                             title='Dashboard',
                             username=username,
                             user_role=role,
                             business_name=session.get('business_name'),
                             business_type=business_type,
-                            
-                            # Metrics (aligned with template expectations)
-                            total_products=total_products,
-                            total_customers=total_customers,
-                            total_sales_today=today_sales_revenue,
-                            low_stock_items=low_stock_items,
-                            total_inventory_items=total_inventory_items,
-                            sales_by_person_today=sales_by_person_today,
-
-                            # Comprehensive Stock Metrics
-                            current_stock_value_at_cost=current_stock_value_at_cost,
-                            current_stock_value_at_sale=current_stock_value_at_sale,
-                            total_potential_gross_profit_stock=total_potential_gross_profit_stock,
-                            overall_stock_profit_margin=overall_stock_profit_margin,
-                            total_sales_overall=total_sales_overall,
-
-                            # Type-specific reports
-                            expired_items=expired_items,
-                            expiring_soon_items=expiring_soon_items,
-                            overdue_rentals=overdue_rentals,
-                            
-                            # General
-                            recent_activity=recent_activity,
+                            dashboard_widgets=list(DASHBOARD_WIDGETS),
+                            expiry_soon_days=EXPIRY_SOON_DAYS,
+                            force_refresh=request.args.get('refresh') == '1',
                             current_year=datetime.now().year)
-    
+
+    @app.route('/api/v1/dashboard/widgets/<string:widget>', methods=['GET'])
+    @login_required
+    def dashboard_widget(widget):
+        """
+        JSON data for one dashboard widget (kpis, sales_series, low_stock, expiry,
+        overdue_rentals, recent_activity), served from the per-business cache.
+        Pass refresh=1 to recompute.
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        compute = DASHBOARD_WIDGETS.get(widget)
+        if not compute:
+            return jsonify({'success': False, 'message': f"Unknown dashboard widget '{widget}'."}), 404
+
+        business_type = get_current_business_type()
+        try:
+            # Any inventory or sales write bumps the business's version and forces a recompute.
+            data, from_cache = dashboard_cache.get_or_compute(
+                business_id,
+                widget,
+                lambda: compute(business_id, business_type),
+                force_refresh=request.args.get('refresh') == '1'
+            )
+        except Exception as e:
+            logging.error(f"Error computing dashboard widget '{widget}' for business {business_id}: {e}")
+            return jsonify({'success': False, 'message': f"Failed to load '{widget}'."}), 500
+
+        return jsonify({
+            'success': True,
+            'widget': widget,
+            'cached': from_cache,
+            'age_seconds': dashboard_cache.age_seconds(business_id, widget),
+            'data': data
+        })
+
+    @app.route('/api/v1/dashboard/cache_stats', methods=['GET'])
+    @login_required
+    def dashboard_cache_stats():
+        """Hit/miss counters of the dashboard metrics cache for this worker process."""
+        if session.get('role') not in ['admin', 'super_admin']:
+            return jsonify({'success': False, 'message': 'Access denied.'}), 403
+        return jsonify({'success': True, 'pid': os.getpid(), 'stats': dashboard_cache.stats()})
+
     # In your app.py file
     @app.route('/super_admin_dashboard')
     @login_required
@@ -3478,6 +3343,7 @@ def create_app():
             location = request.form.get('business_location', '').strip() # Changed from 'location' to 'business_location' for consistency
             contact = request.form.get('business_contact', '').strip() # Changed from 'contact' to 'business_contact' for consistency
             business_type = request.form.get('business_type', '').strip()
+            closing_time = request.form.get('closing_time', '').strip()
             
             admin_username = request.form.get('admin_username', '').strip()
             admin_password = request.form.get('admin_password', '').strip()
@@ -3518,6 +3384,7 @@ def create_app():
                     address=address,
                     location=location,
                     contact=contact,
+                    closing_time=closing_time if parse_closing_time(closing_time) else None,
                     # email=email, # Add email field to form if needed in the future
                     is_active=True,
                     # REMOVED: date_added=datetime.utcnow(),
@@ -3582,6 +3449,7 @@ def create_app():
             new_business_location = request.form.get('business_location', '').strip()
             new_business_contact = request.form.get('business_contact', '').strip()
             new_business_type = request.form.get('business_type', '').strip()
+            new_closing_time = request.form.get('closing_time', '').strip()
             
             # --- CORRECTED KEYS HERE (from 'initial_admin_username' to 'admin_username') ---
             admin_username_from_form = request.form.get('admin_username', '').strip()
@@ -3602,6 +3470,17 @@ def create_app():
                                     business=business_data_for_form, business_types=business_types, 
                                     current_year=datetime.now().year, user_role=current_user.role)
 
+            if new_closing_time and not parse_closing_time(new_closing_time):
+                flash('Closing time must be in HH:MM format.', 'danger')
+                business_data_for_form = {
+                    'name': new_business_name, 'address': new_business_address, 'location': new_business_location,
+                    'contact': new_business_contact, 'type': new_business_type, 'closing_time': new_closing_time,
+                    'initial_admin_username': admin_username_from_form,
+                }
+                return render_template('add_edit_business.html', title=f'Edit Business: {business_to_edit.name}', 
+                                    business=business_data_for_form, business_types=business_types, 
+                                    current_year=datetime.now().year, user_role=current_user.role)
+
             # Check for duplicate business name (excluding current business)
             if Business.query.filter(Business.name == new_business_name, Business.id != business_id).first():
                 flash('A business with this name already exists.', 'danger')
@@ -3621,6 +3500,7 @@ def create_app():
             business_to_edit.location = new_business_location
             business_to_edit.contact = new_business_contact
             business_to_edit.type = new_business_type
+            business_to_edit.closing_time = new_closing_time or None
             business_to_edit.last_updated = datetime.utcnow() # Update timestamp
 
             # Handle admin user updates (only if an initial admin exists)
@@ -3675,6 +3555,7 @@ def create_app():
             'location': business_to_edit.location,
             'contact': business_to_edit.contact,
             'type': business_to_edit.type,
+            'closing_time': business_to_edit.closing_time or '',
             # Pass the admin username to pre-fill the field (will be readonly in template if 'business' object exists)
             'initial_admin_username': initial_admin_user.username if initial_admin_user else '',
             # Password field is always empty for security on GET
@@ -4064,14 +3945,12 @@ def create_app():
     def get_business_inventory(business_id):
         """Return all inventory items for a specific business"""
         try:
-            inventory_items = InventoryItem.query.filter_by(
+            serialized_items = detail_view.rows(InventoryItem.query.filter_by(
                 business_id=business_id,
                 is_active=True
-            ).all()
+            ))
             
-            serialized_items = [serialize_inventory_item(item) for item in inventory_items]
-            
-            return jsonify({
+            return json_response({
                 'success': True,
                 'business_id': business_id,
                 'inventory_items': serialized_items,
@@ -4260,20 +4139,15 @@ def create_app():
         business_id = get_current_business_id()
         search_query = request.args.get('search', '').strip() # Get search query from URL parameters
 
-        inventory_items_query = InventoryItem.query.filter_by(business_id=business_id, is_active=True)
+        # Apply search filter if query exists (indexed, see product_search.py)
+        inventory_items_query = matching_items(business_id, search_query)
+        if inventory_items_query is None:
+            inventory_items_query = InventoryItem.query.filter_by(business_id=business_id, is_active=True)
 
-        # Apply search filter if query exists
-        if search_query:
-            inventory_items_query = inventory_items_query.filter(
-                InventoryItem.product_name.ilike(f'%{search_query}%') |
-                InventoryItem.category.ilike(f'%{search_query}%') |
-                InventoryItem.batch_number.ilike(f'%{search_query}%')
-            )
-        
-        inventory_items = inventory_items_query.all()
-        
-        today = date.today()
-        three_months_from_now = today + timedelta(days=90) # Define threshold for "expiring soon"
+        ensure_expiry_buckets_current(business_id)
+        inventory_page = keyset_paginate(inventory_items_query, InventoryItem.product_name, InventoryItem.id, request.args, descending=False)
+        inventory_items = inventory_page.items
+        total_items = inventory_items_query.order_by(None).with_entities(func.count(InventoryItem.id)).scalar()
 
         # Calculate profit margin and expiry flags for each item
         for item in inventory_items:
@@ -4281,20 +4155,15 @@ def create_app():
             if item.sale_price > 0:
                 item.profit_margin = ((item.sale_price - item.purchase_price) / item.sale_price) * 100
 
-            item.is_expiring_soon = False
-            item.is_expired = False
-            if item.expiry_date:
-                if item.expiry_date < today:
-                    item.is_expired = True
-                elif item.expiry_date >= today and item.expiry_date <= three_months_from_now:
-                    item.is_expiring_soon = True
+            item.is_expired = item.expiry_bucket == EXPIRED
+            item.is_expiring_soon = item.expiry_bucket in EXPIRING_SOON_BUCKETS
 
         business_type = get_current_business_type()
         if business_type == 'Pharmacy':
-            return render_template('pharmacy_inventory.html', inventory_items=inventory_items, user_role=session.get('role'), search_query=search_query, current_year=datetime.now().year)
+            return render_template('pharmacy_inventory.html', inventory_items=inventory_items, inventory_page=inventory_page, total_items=total_items, user_role=session.get('role'), search_query=search_query, current_year=datetime.now().year)
         elif business_type in ['Hardware', 'Supermarket', 'Provision Store']:
-            return render_template('hardware_inventory.html', inventory_items=inventory_items, user_role=session.get('role'), business_type=business_type, search_query=search_query, current_year=datetime.now().year) # Pass business_type
-        return render_template('inventory.html', inventory_items=inventory_items, user_role=session.get('role'), search_query=search_query, current_year=datetime.now().year)
+            return render_template('hardware_inventory.html', inventory_items=inventory_items, inventory_page=inventory_page, total_items=total_items, user_role=session.get('role'), business_type=business_type, search_query=search_query, current_year=datetime.now().year) # Pass business_type
+        return render_template('inventory.html', inventory_items=inventory_items, inventory_page=inventory_page, total_items=total_items, user_role=session.get('role'), search_query=search_query, current_year=datetime.now().year)
 
     # NEW ROUTE: Download CSV for current business's inventory
     @app.route('/inventory/download_current_csv')
@@ -4370,111 +4239,46 @@ def create_app():
                 return redirect(request.url)
             
             if file and file.filename.endswith('.csv'):
-                stream = io.StringIO(file.stream.read().decode("UTF8"))
-                csv_reader = csv.DictReader(stream)
-                
-                updated_count = 0
-                added_count = 0
-                errors = []
-
-                for row in csv_reader:
-                    try:
-                        product_name = row['product_name'].strip()
-                        category = row['category'].strip()
-                        purchase_price = float(row['purchase_price'])
-                        current_stock = float(row['current_stock'])
-                        batch_number = row.get('batch_number', '').strip()
-                        number_of_tabs = int(row.get('number_of_tabs', 1))
-                        item_type = row.get('item_type', session.get('business_type', 'Pharmacy')).strip() # Default to business type
-                        expiry_date_str = row.get('expiry_date', '').strip()
-                        expiry_date_obj = datetime.strptime(expiry_date_str, '%Y-%m-%d').date() if expiry_date_str else None
-                        is_fixed_price = row.get('is_fixed_price', 'False').lower() == 'true'
-                        fixed_sale_price = float(row.get('fixed_sale_price', 0.0))
-                        is_active = row.get('is_active', 'True').lower() == 'true' # Read is_active from CSV
-
-                        if number_of_tabs <= 0:
-                            errors.append(f"Skipping '{product_name}': 'Number of units/pieces per pack' must be greater than zero.")
-                            continue
-
-                        sale_price = 0.0
-                        unit_price_per_tab_with_markup = 0.0
-                        
-                        # Determine sale_price and unit_price_per_tab based on item_type and fixed_price status
-                        if is_fixed_price:
-                            sale_price = fixed_sale_price
-                            if number_of_tabs > 0:
-                                unit_price_per_tab = fixed_sale_price / number_of_tabs
-                        else:
-                            if item_type == 'Pharmacy':
-                                # For Pharmacy, assuming sale_price and unit_price_per_tab are derived from purchase_price + markup
-                                # If CSV provides them, use them directly. Otherwise, apply a default markup (e.g., 20%)
-                                sale_price = float(row.get('sale_price', purchase_price * 1.2)) # Default 20% markup
-                                unit_price_per_tab_with_markup = float(row.get('unit_price_per_tab', sale_price / number_of_tabs if number_of_tabs > 0 else sale_price))
-                            elif item_type in ['Hardware Material', 'Provision Store', 'Supermarket']:
-                                sale_price = float(row.get('sale_price', purchase_price * 1.2)) # Default 20% markup
-                                unit_price_per_tab_with_markup = float(row.get('unit_price_per_tab', sale_price / number_of_tabs if number_of_tabs > 0 else sale_price))
-                            else: # Fallback for unknown types, or if item_type is not explicitly provided in CSV
-                                sale_price = float(row.get('sale_price', purchase_price * 1.2))
-                                unit_price_per_tab_with_markup = float(row.get('unit_price_per_tab', sale_price / number_of_tabs if number_of_tabs > 0 else sale_price))
-
-                        existing_item = InventoryItem.query.filter_by(
-                            product_name=product_name, business_id=business_id
-                        ).first()
+                # Streamed and upserted in chunks, see inventory_import.py
+                prune_error_reports()
+                report_id = uuid.uuid4().hex
+                try:
+                    result = import_inventory_csv(
+                        business_id, file.stream, session.get('business_type', 'Pharmacy'),
+                        error_report_path(business_id, report_id)
+                    )
+                except InvalidInventoryCsv as e:
+                    flash(f'CSV upload failed: {e}', 'danger')
+                    return redirect(request.url)
 
-                        if existing_item:
-                            # Update existing item
-                            existing_item.category = category
-                            existing_item.purchase_price = purchase_price
-                            existing_item.sale_price = sale_price
-                            existing_item.current_stock = current_stock
-                            existing_item.last_updated = datetime.now()
-                            existing_item.batch_number = batch_number
-                            existing_item.number_of_tabs = number_of_tabs
-                            existing_item.unit_price_per_tab = unit_price_per_tab_with_markup
-                            existing_item.item_type = item_type
-                            existing_item.expiry_date = expiry_date_obj
-                            existing_item.is_fixed_price = is_fixed_price
-                            existing_item.fixed_sale_price = fixed_sale_price
-                            existing_item.is_active = is_active # Update is_active
-                            updated_count += 1
-                        else:
-                            # Add new item
-                            new_item = InventoryItem(
-                                business_id=business_id,
-                                product_name=product_name,
-                                category=category,
-                                purchase_price=purchase_price,
-                                sale_price=sale_price,
-                                current_stock=current_stock,
-                                batch_number=batch_number,
-                                number_of_tabs=number_of_tabs,
-                                unit_price_per_tab=unit_price_per_tab_with_markup,
-                                item_type=item_type,
-                                expiry_date=expiry_date_obj,
-                                is_fixed_price=is_fixed_price,
-                                fixed_sale_price=fixed_sale_price,
-                                is_active=is_active # Set is_active for new item
-                            )
-                            db.session.add(new_item)
-                            added_count += 1
-                    except Exception as e:
-                        errors.append(f"Error processing row for product '{row.get('product_name', 'N/A')}': {e}. Row data: {row}")
-                
-                db.session.commit()
-                
-                if errors:
-                    flash(f'CSV upload completed with {updated_count} updated, {added_count} added, and {len(errors)} errors. Check server console for details.', 'warning')
-                    for error in errors:
-                        print(f"CSV Upload Error: {error}")
-                else:
-                    flash(f'CSV inventory uploaded successfully! {updated_count} items updated, {added_count} items added.', 'success')
+                if result['errors']:
+                    session['inventory_import_report'] = report_id
+                    flash(f"CSV upload completed with {result['updated']} updated, {result['added']} added, and {result['errors']} errors. Download the error report for details.", 'warning')
+                    return redirect(request.url)
+                session.pop('inventory_import_report', None)
+                flash(f"CSV inventory uploaded successfully! {result['updated']} items updated, {result['added']} items added.", 'success')
                 
                 return redirect(url_for('inventory')) # Redirect to the inventory list
             else:
                 flash('Invalid file type. Please upload a CSV file.', 'danger')
                 return redirect(request.url)
         
-        return render_template('upload_current_inventory.html', business_name=business_name, user_role=session.get('role'), current_year=datetime.now().year)
+        report_path = error_report_path(business_id, session.get('inventory_import_report'))
+        error_report_url = url_for('download_inventory_import_report', report_id=session['inventory_import_report']) \
+            if report_path and os.path.exists(report_path) else None
+        return render_template('upload_current_inventory.html', business_name=business_name, error_report_url=error_report_url, user_role=session.get('role'), current_year=datetime.now().year)
+
+    @app.route('/inventory/upload_csv/errors/<report_id>', methods=['GET'])
+    def download_inventory_import_report(report_id):
+        """The per-row error report of an inventory CSV upload of the current business."""
+        if session.get('role') not in ['admin'] or not get_current_business_id():
+            flash('You do not have permission to upload inventory or no business selected.', 'danger')
+            return redirect(url_for('dashboard'))
+        report_path = error_report_path(get_current_business_id(), report_id)
+        if not report_path or not os.path.exists(report_path):
+            abort(404)
+        return send_file(report_path, mimetype='text/csv', as_attachment=True,
+                         download_name=f"inventory_upload_errors_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv")
 
 
     # app.py (your add_inventory_item route)
@@ -4493,29 +4297,6 @@ def create_app():
         business_id = get_current_business_id()
         business_type = get_current_business_type()
 
-        # Determine which item types are relevant for the current business type
-        relevant_item_types = []
-        if business_type == 'Pharmacy':
-            relevant_item_types = ['Pharmacy']
-        elif business_type == 'Hardware':
-            relevant_item_types = ['Hardware Material']
-        elif business_type in ['Supermarket', 'Provision Store']:
-            relevant_item_types = ['Provision Store']
-        elif business_type == 'Supermarket':
-            relevant_item_types = ['Supermarket']
-        elif business_type == 'Provision Store':
-            relevant_item_types = ['Provision Store']
-        else:
-            relevant_item_types = ['Pharmacy', 'Hardware Material', 'Supermarket', 'Provision Store']
-
-        available_inventory_items = InventoryItem.query.filter(
-            InventoryItem.business_id == business_id,
-            InventoryItem.is_active == True,
-            InventoryItem.item_type.in_(relevant_item_types)
-        ).all()
-        
-        serialized_inventory_items = [serialize_inventory_item_api(item) for item in available_inventory_items]
-        
         # Get pharmacy info for receipts
         raw_pharmacy_info = session.get('business_info', {})
         if isinstance(raw_pharmacy_info, dict):
@@ -4562,15 +4343,18 @@ def create_app():
                 purchase_price = float(request.form.get('purchase_price', 0.0))
                 current_stock = float(request.form.get('current_stock', 0.0))
                 number_of_tabs = int(request.form.get('number_of_tabs', 1))
+                reorder_point = parse_reorder_point(request.form.get('reorder_point'))
             except ValueError:
-                flash('Invalid input for numerical fields (Price, Stock, Units per Pack). Please enter valid numbers.', 'danger')
+                flash('Invalid input for numerical fields (Price, Stock, Units per Pack, Reorder Point). Please enter valid numbers.', 'danger')
                 item_data_for_form_on_error = {
                     'product_name': product_name, 'category': category,
                     'purchase_price': request.form.get('purchase_price', '0.00'),
                     'current_stock': request.form.get('current_stock', '0.00'),
                     'batch_number': request.form.get('batch_number', '').strip(),
                     'barcode': request.form.get('barcode', '').strip(),
+                    'barcode_aliases': request.form.get('barcode_aliases', '').strip(),
                     'number_of_tabs': request.form.get('number_of_tabs', '1'),
+                    'reorder_point': request.form.get('reorder_point', ''),
                     'item_type': request.form.get('item_type', business_type),
                     'expiry_date': request.form.get('expiry_date', ''),
                     'is_fixed_price': 'is_fixed_price' in request.form,
@@ -4589,21 +4373,17 @@ def create_app():
             batch_number = request.form.get('batch_number', '').strip()
             raw_barcode = request.form.get('barcode', '').strip()
             barcode_to_save = raw_barcode if raw_barcode else None
+            extra_barcodes = parse_barcodes(request.form.get('barcode_aliases'))
 
             # Validate required string fields
             if not product_name or not category:
                 flash('Product Name and Category are required fields.', 'danger')
                 return redirect(request.url)
 
-            # Check if barcode is unique if provided
-            if barcode_to_save:
-                existing_barcode_item = InventoryItem.query.filter_by(
-                    business_id=business_id,
-                    barcode=barcode_to_save
-                ).first()
-                if existing_barcode_item:
-                    flash('Barcode already in use for another product.', 'danger')
-                    return redirect(request.url)
+            # Check if barcode is unique if provided (extra barcodes of other products included)
+            if barcode_to_save and barcode_owner(business_id, barcode_to_save):
+                flash('Barcode already in use for another product.', 'danger')
+                return redirect(request.url)
             
             expiry_date_str = request.form.get('expiry_date', '').strip()
             expiry_date_obj = None 
@@ -4680,6 +4460,7 @@ def create_app():
                 barcode=barcode_to_save,
                 number_of_tabs=number_of_tabs,
                 unit_price_per_tab=unit_price_per_tab,
+                reorder_point=reorder_point,
                 item_type=request.form.get('item_type', business_type),
                 expiry_date=expiry_date_obj,
                 is_fixed_price=is_fixed_price,
@@ -4693,6 +4474,14 @@ def create_app():
             )
             
             db.session.add(new_item)
+            if extra_barcodes:
+                db.session.flush()
+                try:
+                    set_item_barcodes(new_item, extra_barcodes)
+                except BarcodeInUse as e:
+                    db.session.rollback()
+                    flash(str(e), 'danger')
+                    return redirect(request.url)
             db.session.commit()
             flash(f'Inventory item "{product_name}" added successfully!', 'success')
             return redirect(url_for('inventory'))
@@ -4744,6 +4533,7 @@ def create_app():
                 new_barcode = request.form.get('barcode', '').strip()
                 item_type = request.form['item_type']
                 number_of_tabs = int(request.form.get('number_of_tabs', 1))
+                reorder_point = parse_reorder_point(request.form.get('reorder_point'))
                 
                 # Validate price range logic
                 if use_price_range:
@@ -4754,15 +4544,10 @@ def create_app():
                         flash('Preferred price must be between minimum and maximum prices.', 'danger')
                         return redirect(request.url)
 
-                # Barcode uniqueness check
+                # Barcode uniqueness check (extra barcodes of other products included)
                 barcode_to_save = new_barcode if new_barcode else None
                 if barcode_to_save and barcode_to_save != item_to_edit.barcode:
-                    existing_barcode = InventoryItem.query.filter(
-                        InventoryItem.business_id == business_id,
-                        InventoryItem.barcode == barcode_to_save,
-                        InventoryItem.id != item_id
-                    ).first()
-                    if existing_barcode:
+                    if barcode_owner(business_id, barcode_to_save, exclude_item_id=item_id):
                         flash('Barcode already in use for another product.', 'danger')
                         return redirect(request.url)
                 
@@ -4793,6 +4578,7 @@ def create_app():
                 item_to_edit.batch_number = batch_number
                 item_to_edit.barcode = barcode_to_save 
                 item_to_edit.number_of_tabs = number_of_tabs
+                item_to_edit.reorder_point = reorder_point
                 item_to_edit.item_type = item_type
                 item_to_edit.expiry_date = expiry_date_obj
                 item_to_edit.is_fixed_price = is_fixed_price
@@ -4828,11 +4614,16 @@ def create_app():
 
                 item_to_edit.sale_price = sale_price
                 item_to_edit.unit_price_per_tab = unit_price_per_tab
+                set_item_barcodes(item_to_edit, parse_barcodes(request.form.get('barcode_aliases')))
 
                 db.session.commit()
                 flash(f'Inventory item "{product_name}" updated successfully!', 'success')
                 return redirect(url_for('inventory'))
-                
+
+            except BarcodeInUse as e:
+                db.session.rollback()
+                flash(str(e), 'danger')
+                return redirect(request.url)
             except ValueError as e:
                 db.session.rollback()
                 flash(f'Invalid input data. Please check your numbers and dates. Error: {e}', 'danger')
@@ -4852,7 +4643,9 @@ def create_app():
             'current_stock': item_to_edit.current_stock,
             'batch_number': item_to_edit.batch_number or '',
             'barcode': item_to_edit.barcode or '',
+            'barcode_aliases': ', '.join(item_barcodes(item_to_edit.id)),
             'number_of_tabs': item_to_edit.number_of_tabs,
+            'reorder_point': item_to_edit.reorder_point if item_to_edit.reorder_point is not None else '',
             'item_type': item_to_edit.item_type,
             'expiry_date': item_to_edit.expiry_date.strftime('%Y-%m-%d') if item_to_edit.expiry_date else '',
             'is_fixed_price': item_to_edit.is_fixed_price,
@@ -4889,53 +4682,10 @@ def create_app():
                     'error': 'No business selected'
                 }), 400
 
-            # Query active inventory items for current business
-            inventory_items = InventoryItem.query.filter_by(
-                business_id=business_id,
-                is_active=True
-            ).order_by(InventoryItem.product_name).all()
+            # Same list as a full /api/v1/catalog response
+            items_data = catalog_changes(business_id)['items']
 
-            # Serialize inventory data
-            items_data = []
-            for item in inventory_items:
-                try:
-                    # Calculate sale prices
-                    sale_price = float(item.sale_price) if item.sale_price else 0.0
-                    number_of_tabs = float(item.number_of_tabs) if item.number_of_tabs else 1.0
-                    unit_price_per_tab = sale_price / number_of_tabs if number_of_tabs > 0 else 0.0
-
-                    item_data = {
-                        'id': item.id,
-                        'product_name': item.product_name or '',
-                        'category': item.category or '',
-                        'current_stock': float(item.current_stock) if item.current_stock else 0.0,
-                        'sale_price': sale_price,
-                        'unit_price_per_tab': unit_price_per_tab,
-                        'number_of_tabs': number_of_tabs,
-                        'batch_number': item.batch_number or '',
-                        'barcode': item.barcode or '',
-                        'item_type': item.item_type or '',
-                        'purchase_price': float(item.purchase_price) if item.purchase_price else 0.0,
-                        
-                        # Legacy fixed price support
-                        'is_fixed_price': bool(item.is_fixed_price) if hasattr(item, 'is_fixed_price') else False,
-                        'fixed_sale_price': float(item.fixed_sale_price) if hasattr(item, 'fixed_sale_price') and item.fixed_sale_price else 0.0,
-                        
-                        # NEW: Price range support
-                        'use_price_range': bool(item.use_price_range) if hasattr(item, 'use_price_range') else False,
-                        'min_sale_price': float(item.min_sale_price) if hasattr(item, 'min_sale_price') and item.min_sale_price else 0.0,
-                        'preferred_sale_price': float(item.preferred_sale_price) if hasattr(item, 'preferred_sale_price') and item.preferred_sale_price else 0.0,
-                        'max_sale_price': float(item.max_sale_price) if hasattr(item, 'max_sale_price') and item.max_sale_price else 0.0,
-                    }
-                    
-                    items_data.append(item_data)
-                    
-                except Exception as item_error:
-                    # Log individual item errors but continue processing
-                    app.logger.warning(f"Error processing inventory item {item.id}: {str(item_error)}")
-                    continue
-
-            return jsonify({
+            return json_response({
                 'success': True,
                 'items': items_data,
                 'count': len(items_data)
@@ -5123,13 +4873,9 @@ def create_app():
             # Add other filter fields here if you uncomment them in sales.html
         }
 
-        # Apply filters based on direct columns
+        # Indexed search (receipt, phone in any format, sales person, product), best matches first
         if search_query:
-            sales_records_query = sales_records_query.filter(
-                (SalesRecord.customer_phone.ilike(f'%{search_query}%')) |
-                (SalesRecord.sales_person_name.ilike(f'%{search_query}%')) |
-                (SalesRecord.receipt_number.ilike(f'%{search_query}%'))
-            )
+            sales_records_query = search_records(SalesRecord, business_id, search_query)
 
         # Filter by date ranges using 'transaction_date'
         start_date_str = request.args.get('start_date')
@@ -5143,9 +4889,7 @@ def create_app():
             except ValueError:
                 flash('Invalid start date format.', 'warning')
                 print(f"DEBUG: Sales route - Invalid start_date format: {start_date_str}")
-                # If there's an error, we still need to render the page with current_filters
-                sales_records = sales_records_query.order_by(SalesRecord.transaction_date.desc()).all() # Fetch with current valid filters
-                # Proceed to process records and render template at the end
+                # The page is still one keyset page, just without this date bound
         if end_date_str:
             try:
                 end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
@@ -5154,51 +4898,65 @@ def create_app():
             except ValueError:
                 flash('Invalid end date format.', 'warning')
                 print(f"DEBUG: Sales route - Invalid end_date format: {end_date_str}")
-                # If there's an error, we still need to render the page with current_filters
-                sales_records = sales_records_query.order_by(SalesRecord.transaction_date.desc()).all() # Fetch with current valid filters
-                # Proceed to process records and render template at the end
+                # The page is still one keyset page, just without this date bound
 
 
-        # Order by 'transaction_date' descending for most recent sales first
-        sales_records = sales_records_query.order_by(SalesRecord.transaction_date.desc()).all()
+        # Order by 'transaction_date' descending for most recent sales first;
+        # search results keep their rank and are paged.
+        search_pagination = None
+        sales_page = None
+        if search_query:
+            search_pagination = sales_records_query.paginate(page=request.args.get('page', 1, type=int), per_page=SEARCH_PAGE_SIZE, error_out=False)
+            sales_records = search_pagination.items
+        else:
+            sales_page = keyset_paginate(sales_records_query, SalesRecord.transaction_date, SalesRecord.id, request.args)
+            sales_records = sales_page.items
+        # Count and amount across every page, from one aggregate over the same filters
+        sales_count, filtered_sales_total = sales_records_query.order_by(None).with_entities(
+            func.count(SalesRecord.id), func.coalesce(func.sum(SalesRecord.grand_total_amount), 0.0)
+        ).one()
         
         print(f"DEBUG: Sales route - Found {len(sales_records)} sales records after filtering.")
 
         transactions = {}
-        today = date.today() # Get today's date for expiry checks
+        ensure_expiry_buckets_current(business_id) # Expiry flags below read the stored bucket
+
+        # Parse every sale once and fetch the expiry data of all sold products
+        # in a few IN queries, rather than one query per sale line.
+        items_sold_by_sale = {sale.id: sale.get_items_sold() for sale in sales_records}
+        product_expiry = expiry_lookup(business_id, (
+            item_data.get('product_id') for items_sold_data in items_sold_by_sale.values() for item_data in items_sold_data
+        ))
+        # Returned quantity per sale line, from the maintained line aggregate
+        line_returns = returned_quantities(items_sold_by_sale)
 
         for sale in sales_records:
             transaction_id = sale.receipt_number if sale.receipt_number else str(sale.id) # Use receipt_number or ID
             
-            items_sold_data = sale.get_items_sold() # Get the list of items from the JSON column
+            items_sold_data = items_sold_by_sale[sale.id]
             print(f"DEBUG: Processing SalesRecord {sale.id} (Receipt: {transaction_id}) with {len(items_sold_data)} items.")
 
             sale_items_for_transaction = []
-            for item_data in items_sold_data:
+            for line_number, item_data in enumerate(items_sold_data):
                 # Each item_data is a dictionary from the JSON array
                 product_name = item_data.get('product_name', "Unknown Product")
                 product_id = item_data.get('product_id') # Get product_id from the item_data dictionary
 
-                # Fetch the associated InventoryItem to get expiry date if needed
-                product_item = None
-                if product_id:
-                    product_item = InventoryItem.query.filter_by(id=product_id, business_id=business_id).first()
-                
                 sale_item_expires_soon = False
-                sale_item_expiry_date = None
-                if product_item and product_item.expiry_date:
-                    sale_item_expiry_date = product_item.expiry_date
-                    time_to_expiry = product_item.expiry_date - today
-                    if time_to_expiry.days <= 180 and time_to_expiry.days >= 0:
-                        sale_item_expires_soon = True
-                    elif time_to_expiry.days < 0:
-                        sale_item_expires_soon = 'Expired'
+                sale_item_expiry_date, expiry_bucket = product_expiry.get(str(product_id) if product_id else None, (None, None))
+                if sale_item_expiry_date:
+                    sale_item_expires_soon = sale_line_expiry_flag(expiry_bucket)
+
+                quantity_sold = float(item_data.get('quantity_sold', 0.0))
+                quantity_returned = line_returns.get((sale.id, line_number), 0.0)
 
                 # Augment the sale item data
                 sale_items_for_transaction.append({
                     'product_id': str(product_id) if product_id else None,
                     'product_name': str(product_name),
-                    'quantity_sold': float(item_data.get('quantity_sold', 0.0)),
+                    'quantity_sold': quantity_sold,
+                    'quantity_returned': quantity_returned,
+                    'net_quantity': quantity_sold - quantity_returned,
                     'sale_unit_type': str(item_data.get('sale_unit_type', 'pack')),
                     'price_at_time_per_unit_sold': float(item_data.get('price_at_time_per_unit_sold', 0.0)),
                     'item_total_amount': float(item_data.get('item_total_amount', 0.0)),
@@ -5219,7 +4977,7 @@ def create_app():
                     }
 
         # Ensure sale_date is not None before using it for sorting
-        sorted_transactions = sorted(
+        sorted_transactions = list(transactions.values()) if search_query else sorted(
             list(transactions.values()), 
             key=lambda x: datetime.fromisoformat(x['sale_date']) if x['sale_date'] else datetime.min,
             reverse=True
@@ -5236,7 +4994,11 @@ def create_app():
                             search_query=search_query, 
                             total_displayed_sales=total_displayed_sales, 
                             current_year=datetime.now().year,
-                            current_filters=current_filters # Pass the dictionary consistently
+                            current_filters=current_filters, # Pass the dictionary consistently
+                            search_pagination=search_pagination,
+                            sales_page=sales_page,
+                            sales_count=sales_count,
+                            filtered_sales_total=float(filtered_sales_total)
         )
 
     @app.route('/sales/add', methods=['GET', 'POST'])
@@ -5255,45 +5017,9 @@ def create_app():
         print(f"DEBUG: Current business_type: {business_type}")
 
         
-        relevant_item_types = []
-        
-        # Check the business type from the session to filter relevant items
-        if business_type == 'Pharmacy':
-            relevant_item_types = ['Pharmacy']
-        elif business_type == 'Hardware':
-            # The item_type for hardware is 'Hardware Material'
-            relevant_item_types = ['Hardware Material']
-        elif business_type == 'Supermarket':
-            relevant_item_types = ['Supermarket', 'Provision Store']
-        else:
-            # Default to Pharmacy if business_type is not recognized or not yet set
-            relevant_item_types = ['Pharmacy']
-
-    
+        # The sale form loads its product list from /api/v1/catalog (cached in the browser).
         search_query = request.args.get('search', '').strip()
 
-        available_inventory_items_query = InventoryItem.query.filter(
-            InventoryItem.business_id == business_id,
-            InventoryItem.is_active == True,
-            InventoryItem.item_type.in_(relevant_item_types)
-        )
-
-        if search_query:
-            available_inventory_items_query = available_inventory_items_query.filter(
-                InventoryItem.product_name.ilike(f'%{search_query}%') |
-                InventoryItem.category.ilike(f'%{search_query}%') |
-                InventoryItem.batch_number.ilike(f'%{search_query}%')
-            )
-        
-        available_inventory_items = available_inventory_items_query.all()
-        
-        serialized_inventory_items = []
-        try:
-            serialized_inventory_items = [serialize_inventory_item_api(item) for item in available_inventory_items]
-        except Exception as e:
-            print(f"ERROR: Exception during serialization of available_inventory_items: {e}")
-            serialized_inventory_items = []
-
         raw_pharmacy_info = session.get('business_info', {})
         if isinstance(raw_pharmacy_info, dict):
             pharmacy_info = {
@@ -5381,7 +5107,6 @@ def create_app():
                 flash('No items in the cart to record a sale.', 'danger')
                 return render_template('add_edit_sale.html',
                                     title='Add Sale Record',
-                                    inventory_items=serialized_inventory_items,
                                     sale={'customer_phone': customer_phone_for_template, 'sales_person_name': sales_person_name_for_template, 'items': sale_for_template_items},
                                     user_role=session.get('role'),
                                     pharmacy_info=pharmacy_info,
@@ -5401,14 +5126,12 @@ def create_app():
             total_grand_amount = 0.0
             recorded_sale_details = [] # This will be stored in items_sold_json
             
-            # Validate stock and calculate total
+            # Validate the cart, then lock every cart product with one query
             errors = []
+            cart_lines = []
             for item_data in cart_items:
                 product_id = item_data.get('product_id')
                 quantity_sold = float(item_data.get('quantity_sold', 0.0))
-                price_at_time_per_unit_sold = float(item_data.get('price_at_time_per_unit_sold', 0.0))
-                item_total_amount = float(item_data.get('item_total_amount', 0.0))
-                sale_unit_type = item_data.get('sale_unit_type', 'pack')
                 product_name = item_data.get('product_name', 'Unknown Product')
 
                 if not product_id:
@@ -5417,50 +5140,47 @@ def create_app():
                 if quantity_sold <= 0:
                     errors.append(f"Quantity for '{product_name}' must be greater than zero.")
                     continue
+                cart_lines.append((str(product_id), quantity_sold, item_data))
+
+            products = lock_products(business_id, [product_id for product_id, _, _ in cart_lines]) if not errors else {}
+            for product_id, _, item_data in cart_lines:
+                if product_id not in products:
+                    errors.append(f"Product '{item_data.get('product_name', 'Unknown Product')}' (ID: {product_id}) not found in inventory.")
+
+            if not errors:
+                # Stock is checked and taken in base units for all lines at once
+                # (a product on several lines is summed), atomically against
+                # concurrent checkouts.
+                quantities = checkout_quantities(
+                    [(product_id, quantity_sold, item_data.get('sale_unit_type', 'pack')) for product_id, quantity_sold, item_data in cart_lines],
+                    products
+                )
+                for product_id in decrement_stock(business_id, quantities, products):
+                    product = products[product_id]
+                    errors.append(f"Insufficient stock for '{product.product_name}'. Available: {product.current_stock or 0.0} units. Tried to sell: {quantities[product_id]:.2f} units.")
 
-                product = InventoryItem.query.filter_by(id=product_id, business_id=business_id).first()
-
-                if not product:
-                    errors.append(f"Product '{product_name}' (ID: {product_id}) not found in inventory.")
-                    continue
-
-                # Convert quantity sold to base units for stock check
-                num_tabs_per_pack = float(product.number_of_tabs or 1.0)
-                if sale_unit_type == 'pack':
-                    quantity_in_base_units = quantity_sold * num_tabs_per_pack
-                elif sale_unit_type == 'piece' or sale_unit_type == 'tab':
-                    quantity_in_base_units = quantity_sold # quantity_sold is already in base units
-                else: # Fallback
-                    quantity_in_base_units = quantity_sold * num_tabs_per_pack 
-                
-                # Check stock
-                if quantity_in_base_units > (product.current_stock or 0.0):
-                    errors.append(f"Insufficient stock for '{product.product_name}'. Available: {product.current_stock or 0.0} units. Tried to sell: {quantity_in_base_units:.2f} units.")
-                    continue
-
-                # All good, add to recorded sale details and update total
+            for product_id, quantity_sold, item_data in cart_lines if not errors else []:
+                product = products[product_id]
+                sale_unit_type = item_data.get('sale_unit_type', 'pack')
+                item_total_amount = float(item_data.get('item_total_amount', 0.0))
                 recorded_sale_details.append({
                     'product_id': str(product.id),
                     'product_name': product.product_name,
                     'quantity_sold': quantity_sold,
                     'sale_unit_type': sale_unit_type,
-                    'price_at_time_per_unit_sold': price_at_time_per_unit_sold,
+                    'price_at_time_per_unit_sold': float(item_data.get('price_at_time_per_unit_sold', 0.0)),
                     'item_total_amount': item_total_amount,
+                    'cost_at_time_per_unit_sold': unit_cost_for_item(product, sale_unit_type),
                     # Add any other relevant details for the receipt
                 })
                 total_grand_amount += item_total_amount
 
-                # Update inventory stock
-                product.current_stock -= quantity_in_base_units # Decrement stock in base units
-                db.session.add(product) # Mark product for update
-
             if errors:
                 for error in errors:
                     flash(error, 'danger')
                 db.session.rollback() # Rollback any partial changes
                 return render_template('add_edit_sale.html',
                                     title='Add Sale Record',
-                                    inventory_items=serialized_inventory_items,
                                     sale={'customer_phone': customer_phone_for_template, 'sales_person_name': sales_person_name_for_template, 'items': sale_for_template_items},
                                     user_role=session.get('role'),
                                     pharmacy_info=pharmacy_info,
@@ -5494,7 +5214,9 @@ def create_app():
                     receipt_number=receipt_num,
                 )
                 new_sale.set_items_sold(recorded_sale_details) # Set the JSON data after object creation
+                write_sale_lines(new_sale)
                 db.session.add(new_sale)
+                record_sale(new_sale)
                 db.session.commit()
 
                 flash('Sale recorded successfully!', 'success')
@@ -5522,29 +5244,9 @@ def create_app():
                         f"From: {business_name_for_sms}"
                     )
                     
-                    # Check if online before attempting to send SMS
-                    if check_network_online():
-                        try:
-                            sms_payload = {
-                                'action': 'send-sms',
-                                'api_key': ARKESEL_API_KEY,
-                                'to': customer_phone_for_template,
-                                'from': ARKESEL_SENDER_ID,
-                                'sms': sms_message
-                            }
-                            sms_response = requests.get(ARKESEL_SMS_URL, params=sms_payload)
-                            sms_response.raise_for_status()
-                            sms_result = sms_response.json()
-
-                            if sms_result.get('status') == 'success':
-                                flash(f'SMS receipt sent to customer {customer_phone_for_template} successfully!', 'success')
-                            else:
-                                error_message = sms_result.get('message', 'Unknown error from SMS provider.')
-                                flash(f'Failed to send SMS receipt to customer. Error: {error_message}', 'danger')
-                        except Exception as e:
-                            flash(f'Error sending SMS receipt: {str(e)}', 'danger')
-                    else:
-                        flash("SMS receipt not sent: You are offline.", 'warning')
+                    enqueue_sms(business_id, customer_phone_for_template, sms_message, 'sale_receipt',
+                                dedupe_key=f'sale_receipt:{business_id}:{receipt_num}')
+                    flash(f'SMS receipt to {customer_phone_for_template} queued for sending.', 'success')
                 elif send_sms_receipt and not customer_phone_for_template:
                     flash(f'SMS receipt not sent: No customer phone number provided.', 'warning')
 
@@ -5564,7 +5266,6 @@ def create_app():
                 # Re-render the template with current form data and error
                 return render_template('add_edit_sale.html',
                                     title='Add Sale Record',
-                                    inventory_items=serialized_inventory_items,
                                     sale={'customer_phone': customer_phone_for_template, 'sales_person_name': sales_person_name_for_template, 'items': sale_for_template_items},
                                     user_role=session.get('role'),
                                     pharmacy_info=pharmacy_info,
@@ -5584,7 +5285,6 @@ def create_app():
         # GET request
         return render_template('add_edit_sale.html',
                                 title='Add Sale Record',
-                                inventory_items=serialized_inventory_items,
                                 sale={'customer_phone': customer_phone_for_template, 'sales_person_name': sales_person_name_for_template, 'items': sale_for_template_items},
                                 user_role=session.get('role'),
                                 pharmacy_info=pharmacy_info,
@@ -5621,22 +5321,16 @@ def create_app():
             return redirect(url_for('sales'))
 
         first_sale_record = sales_in_transaction[0]
+
+        # Returns restocked part of this sale and are tracked on its lines; an
+        # edit restocks the whole sale and rebuilds the lines, so it would count
+        # them twice and let them be returned again. Correct it with a return instead.
+        if db.session.query(ReturnRecord.query.filter_by(
+                business_id=business_id, original_receipt_number=transaction_id).exists()).scalar():
+            flash('This sale has returns and can no longer be edited. Record a return to correct it.', 'warning')
+            return redirect(url_for('sales'))
         
         business_type = get_current_business_type()
-        relevant_item_types = []
-        if business_type == 'Pharmacy':
-            relevant_item_types = ['Pharmacy']
-        elif business_type == 'Hardware':
-            relevant_item_types = ['Hardware Material']
-        elif business_type in ['Supermarket', 'Provision Store']:
-            relevant_item_types = ['Provision Store']
-        
-        available_inventory_items = InventoryItem.query.filter(
-            InventoryItem.business_id == business_id,
-            InventoryItem.is_active == True,
-            InventoryItem.item_type.in_(relevant_item_types)
-        ).all()
-        serialized_available_inventory_items = [serialize_inventory_item(item) for item in available_inventory_items]
         
         pharmacy_info = session.get('business_info', {})
 
@@ -5653,17 +5347,17 @@ def create_app():
 
             # --- Revert old stock and prepare for new stock deduction ---
             for old_sale_record in sales_in_transaction:
-                product = InventoryItem.query.filter_by(id=old_sale_record.product_id, business_id=business_id).first()
-                if product:
-                    quantity_to_return = old_sale_record.quantity_sold
-                    if old_sale_record.sale_unit_type == 'pack':
-                        original_product_for_tabs = InventoryItem.query.filter_by(id=old_sale_record.product_id, business_id=business_id).first()
-                        if original_product_for_tabs:
-                            quantity_to_return = old_sale_record.quantity_sold * original_product_for_tabs.number_of_tabs
-                    
-                    product.current_stock += quantity_to_return
-                    product.last_updated = datetime.now()
-                    db.session.add(product)
+                for old_item in old_sale_record.get_items_sold():
+                    product = InventoryItem.query.filter_by(id=old_item.get('product_id'), business_id=business_id).first()
+                    if product:
+                        quantity_to_return = float(old_item.get('quantity_sold', 0.0))
+                        if old_item.get('sale_unit_type') == 'pack':
+                            quantity_to_return = quantity_to_return * (product.number_of_tabs or 1)
+                        
+                        product.current_stock += quantity_to_return
+                        product.last_updated = datetime.now()
+                        db.session.add(product)
+                record_sale(old_sale_record, sign=-1)
                 db.session.delete(old_sale_record)
 
             # --- Validate and record new items ---
@@ -5680,7 +5374,6 @@ def create_app():
                     db.session.rollback()
                     return render_template('add_edit_sale.html',
                                         title='Edit Sale Record',
-                                        inventory_items=serialized_available_inventory_items,
                                         sale={'customer_phone': customer_phone, 'sales_person_name': sales_person_name, 'items': new_cart_items},
                                         user_role=session.get('role'),
                                         pharmacy_info=pharmacy_info,
@@ -5696,7 +5389,6 @@ def create_app():
                     db.session.rollback()
                     return render_template('add_edit_sale.html',
                                         title='Edit Sale Record',
-                                        inventory_items=serialized_available_inventory_items,
                                         sale={'customer_phone': customer_phone, 'sales_person_name': sales_person_name, 'items': new_cart_items},
                                         user_role=session.get('role'),
                                         pharmacy_info=pharmacy_info,
@@ -5720,6 +5412,8 @@ def create_app():
 
                 product.current_stock -= quantity_to_deduct
                 product.last_updated = datetime.now()
+                # Unit cost snapshot for COGS, as add_sale stores it
+                item_data[COST_KEY] = unit_cost_for_item(product, sale_unit_type)
 
                 total_grand_amount += item_total_amount
 
@@ -5744,7 +5438,9 @@ def create_app():
             )
             # Set the items_sold_json for this *single* new SalesRecord
             updated_transaction_record.set_items_sold(new_cart_items) 
+            write_sale_lines(updated_transaction_record)
             db.session.add(updated_transaction_record)
+            record_sale(updated_transaction_record)
 
 
             db.session.commit()
@@ -5766,7 +5462,6 @@ def create_app():
         return render_template('add_edit_sale.html', 
                             title=f'Edit Sale Transaction: {transaction_id[:8].upper()}', 
                             sale=sale_data_for_form, 
-                            inventory_items=serialized_available_inventory_items,
                             user_role=session.get('role'),
                             pharmacy_info=pharmacy_info,
                             print_ready=False,
@@ -5823,6 +5518,7 @@ def create_app():
                         db.session.add(product)
                         
             # Delete the sale record
+            record_sale(sale_record, sign=-1)
             db.session.delete(sale_record)
             db.session.commit()
             
@@ -5856,20 +5552,15 @@ def create_app():
 
         # Prepare items for the receipt by getting them from the JSON column
         receipt_items = []
-        today = date.today()
+        ensure_expiry_buckets_current(business_id)
+        items_sold = sales_record.get_items_sold()
+        product_expiry = expiry_lookup(business_id, (item.get('product_id') for item in items_sold))
 
-        for item in sales_record.get_items_sold():
-            product_item = InventoryItem.query.filter_by(id=item['product_id'], business_id=business_id).first()
-            
+        for item in items_sold:
             sale_item_expires_soon = False
-            sale_item_expiry_date = None
-            if product_item and product_item.expiry_date:
-                sale_item_expiry_date = product_item.expiry_date
-                time_to_expiry = product_item.expiry_date - today
-                if time_to_expiry.days <= 180 and time_to_expiry.days >= 0:
-                    sale_item_expires_soon = True
-                elif time_to_expiry.days < 0:
-                    sale_item_expires_soon = 'Expired'
+            sale_item_expiry_date, expiry_bucket = product_expiry.get(str(item.get('product_id')), (None, None))
+            if sale_item_expiry_date:
+                sale_item_expires_soon = sale_line_expiry_flag(expiry_bucket)
 
             receipt_items.append({
                 'product_name': item['product_name'],
@@ -5998,19 +5689,13 @@ def create_app():
     Thank you for your business!
     """.strip()
             
-            # Send SMS using Arkesel API (similar to your existing SMS functionality)
-            sms_success = send_sms_via_arkesel(phone_number, sms_message)
-            
-            if sms_success:
-                return jsonify({
-                    'success': True,
-                    'message': f'Return receipt sent to {phone_number}'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'message': 'Failed to send SMS. Please check phone number and try again.'
-                }), 500
+            sms, created = enqueue_sms(business_id, phone_number, sms_message, 'return_receipt',
+                                       dedupe_key=f'return_receipt:{return_record.id}:{phone_number.strip()}')
+            return jsonify({
+                'success': True,
+                'message': f'Return receipt queued for {phone_number}' if created else f'Return receipt to {phone_number} was already queued',
+                'sms': serialize_sms(sms)
+            })
                 
         except Exception as e:
             logging.error(f"Error sending return SMS: {str(e)}")
@@ -6019,36 +5704,32 @@ def create_app():
                 'message': 'Internal server error'
             }), 500
 
-    def send_sms_via_arkesel(phone_number, message):
-        """Send SMS using Arkesel API - reuse your existing SMS function"""
-        try:
-            # Clean phone number
-            phone = phone_number.strip()
-            if phone.startswith('0'):
-                phone = '233' + phone[1:]
-            elif not phone.startswith('233'):
-                phone = '233' + phone
-            
-            # Prepare SMS payload
-            sms_payload = {
-                'key': ARKESEL_API_KEY,
-                'to': phone,
-                'msg': message,
-                'sender': ARKESEL_SENDER_ID
-            }
-            
-            # Send SMS
-            response = requests.post(ARKESEL_SMS_URL, data=sms_payload, timeout=30)
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                return response_data.get('code') == '200'
-            else:
-                return False
-                
-        except Exception as e:
-            logging.error(f"Arkesel SMS error: {str(e)}")
-            return False
+    @on_low_stock_crossing
+    def send_low_stock_sms_alerts(crossings):
+        """Texts the business contact when items drop to their reorder point (LOW_STOCK_SMS_ALERTS=true)."""
+        if os.getenv('LOW_STOCK_SMS_ALERTS', 'false').lower() != 'true' or not ARKESEL_API_KEY:
+            return
+        entered = {}
+        for crossing in crossings:
+            if crossing['entered']:
+                entered.setdefault(crossing['business_id'], []).append(crossing)
+        if not entered:
+            return
+
+        def queue_alerts():
+            with app.app_context():
+                for business_id, items in entered.items():
+                    business = db.session.get(Business, business_id)
+                    if not business or not business.contact:
+                        continue
+                    names = ', '.join(f"{item['product_name']} ({item['current_stock']:.0f} left)" for item in items[:5])
+                    more = f" and {len(items) - 5} more" if len(items) > 5 else ''
+                    item_ids = ','.join(sorted(item['item_id'] for item in items))
+                    enqueue_sms(business_id, business.contact, f"{business.name}: low stock - {names}{more}. Please reorder.",
+                                'low_stock', dedupe_key=f"low_stock:{business_id}:{date.today().isoformat()}:{uuid.uuid5(uuid.NAMESPACE_OID, item_ids)}")
+
+        # Queued from a thread: the crossing is reported after commit, when the session cannot write.
+        threading.Thread(target=queue_alerts, daemon=True).start()
     # Returns Processing Route
     @app.route('/sales/add_return', methods=['GET', 'POST'])
     @csrf.exempt
@@ -6071,9 +5752,19 @@ def create_app():
                     business_id=business_id
                 ).first()
             
+            # Quantity already returned per line, so the form offers only the rest
+            line_returns = returned_quantities([sale_record.id]) if sale_record else {}
+            already_returned = {line_number: quantity for (_, line_number), quantity in line_returns.items()}
+            previous_returns = ReturnRecord.query.filter_by(
+                business_id=business_id,
+                original_receipt_number=sale_record.receipt_number
+            ).order_by(ReturnRecord.return_date).all() if sale_record and sale_record.receipt_number else []
+            
             return render_template('add_edit_return.html', 
                                  title='Process Return',
                                  sale_record=sale_record,
+                                 already_returned=already_returned,
+                                 previous_returns=previous_returns,
                                  current_year=datetime.now().year)
         
         elif request.method == 'POST':
@@ -6091,10 +5782,6 @@ def create_app():
                 # Get selected items for return
                 return_items = request.form.getlist('return_items')
                 return_quantities = request.form.getlist('return_quantities')
-                item_names = request.form.getlist('item_names')
-                original_quantities = request.form.getlist('original_quantities')
-                unit_prices = request.form.getlist('unit_prices')
-                sale_unit_types = request.form.getlist('sale_unit_types')
                 
                 if not return_items:
                     flash('Please select at least one item to return.', 'danger')
@@ -6114,54 +5801,50 @@ def create_app():
                     flash('Original sale record not found.', 'danger')
                     return redirect(url_for('add_return'))
                 
-                # Process returned items and calculate refund
+                # Quantities, prices and products come from the sale's own lines;
+                # what is left to return is the line quantity less earlier returns.
+                if not original_sale.line_items and original_sale.get_items_sold():
+                    write_sale_lines(original_sale)  # Sale predating sales_line_items
+                    db.session.flush()
+                lines_by_number = {line.line_number: line for line in original_sale.line_items}
+
                 returned_items = []
                 total_refund = 0.0
                 
-                for i, item_index in enumerate(return_items):
+                for item_index in return_items:
                     item_idx = int(item_index)
                     return_quantity = float(return_quantities[item_idx])
                     
                     if return_quantity <= 0:
                         continue
                     
-                    # Get item details
-                    item_name = item_names[item_idx]
-                    original_quantity = float(original_quantities[item_idx])
-                    unit_price = float(unit_prices[item_idx])
-                    unit_type = sale_unit_types[item_idx]
+                    line = lines_by_number.get(item_idx)
+                    if line is None:
+                        flash('A selected item is not part of this sale.', 'danger')
+                        return redirect(url_for('add_return', receipt_number=original_receipt_number))
                     
-                    # Validate return quantity
-                    if return_quantity > original_quantity:
-                        flash(f'Return quantity for {item_name} cannot exceed original quantity of {original_quantity}.', 'danger')
+                    # Validate against what has not been returned yet
+                    remaining_quantity = line.quantity - (line.quantity_returned or 0.0)
+                    if return_quantity > remaining_quantity + QUANTITY_TOLERANCE:
+                        flash(f'Return quantity for {line.product_name} cannot exceed the {remaining_quantity:g} {line.sale_unit_type} not yet returned '
+                              f'(sold {line.quantity:g}, already returned {line.quantity_returned or 0.0:g}).', 'danger')
                         return redirect(url_for('add_return', receipt_number=original_receipt_number))
                     
                     # Calculate refund for this item
-                    item_refund = return_quantity * unit_price
+                    item_refund = return_quantity * line.unit_price
                     total_refund += item_refund
                     
                     # Add to returned items list
                     returned_items.append({
-                        'product_name': item_name,
+                        'line_number': item_idx,
+                        'product_id': line.product_id,
+                        'product_name': line.product_name,
                         'return_quantity': return_quantity,
-                        'original_quantity': original_quantity,
-                        'unit_price': unit_price,
-                        'sale_unit_type': unit_type,
+                        'original_quantity': line.quantity,
+                        'unit_price': line.unit_price,
+                        'sale_unit_type': line.sale_unit_type,
                         'refund_amount': item_refund
                     })
-                    
-                    # Update inventory - Add returned items back to stock
-                    inventory_item = InventoryItem.query.filter_by(
-                        product_name=item_name,
-                        business_id=business_id
-                    ).first()
-                    
-                    if inventory_item:
-                        inventory_item.current_stock += return_quantity
-                        inventory_item.last_updated = datetime.now()
-                        print(f"DEBUG: Added {return_quantity} {unit_type} of {item_name} back to inventory. New stock: {inventory_item.current_stock}")
-                    else:
-                        print(f"WARNING: Could not find inventory item '{item_name}' to update stock")
                 
                 if total_refund <= 0:
                     flash('No valid items selected for return.', 'danger')
@@ -6188,8 +5871,37 @@ def create_app():
                 # Set returned items as JSON
                 return_record.set_returned_items(returned_items)
                 
+                # Count the return against the sale lines first: the guarded
+                # update fails if a concurrent return already took the quantity.
+                if take_returned_quantities(original_sale, returned_items):
+                    db.session.rollback()
+                    flash('These items were returned by another return in the meantime. Please review the remaining quantities.', 'danger')
+                    return redirect(url_for('add_return', receipt_number=original_receipt_number))
+                
+                # Put the stock back in base units, as checkout took it: one
+                # inventory fetch by product id (by name for old lines without
+                # one) and one batched update.
+                products = lock_products(business_id, [item['product_id'] for item in returned_items if item['product_id']])
+                unlinked_names = {item['product_name'] for item in returned_items if not item['product_id']}
+                products_by_name = {
+                    product.product_name: product for product in InventoryItem.query.filter(
+                        InventoryItem.business_id == business_id,
+                        InventoryItem.product_name.in_(unlinked_names)
+                    )
+                } if unlinked_names else {}
+                restock_quantities = {}
+                for item in returned_items:
+                    product = products.get(item['product_id']) if item['product_id'] else products_by_name.get(item['product_name'])
+                    if product is None:
+                        print(f"WARNING: Could not find inventory item '{item['product_name']}' to update stock")
+                        continue
+                    restock_quantities[product.id] = restock_quantities.get(product.id, 0.0) + base_units(
+                        item['return_quantity'], item['sale_unit_type'], product.number_of_tabs)
+                restock(business_id, restock_quantities)
+                
                 # Save to database
                 db.session.add(return_record)
+                record_return(return_record)
                 db.session.commit()
                 
                 print(f"DEBUG: Return processed successfully. Return receipt: {return_receipt_number}, Total refund: GHS{total_refund:.2f}")
@@ -6218,32 +5930,30 @@ def create_app():
         # Get search parameters
         search_query = request.args.get('search', '').strip()
         
-        # Base query for returns
-        returns_query = ReturnRecord.query.filter_by(business_id=business_id)
-        
-        # Apply search filter if provided
+        # Indexed search, best matches first and paged; otherwise most recent first
+        search_pagination = None
+        returns_page = None
         if search_query:
-            returns_query = returns_query.filter(
-                db.or_(
-                    ReturnRecord.return_receipt_number.ilike(f'%{search_query}%'),
-                    ReturnRecord.original_receipt_number.ilike(f'%{search_query}%'),
-                    ReturnRecord.customer_phone.ilike(f'%{search_query}%'),
-                    ReturnRecord.customer_name.ilike(f'%{search_query}%'),
-                    ReturnRecord.processed_by.ilike(f'%{search_query}%')
-                )
-            )
-        
-        # Order by most recent first
-        returns = returns_query.order_by(ReturnRecord.return_date.desc()).all()
-        
-        # Calculate total refunds
-        total_refunds = sum(return_record.total_refund_amount for return_record in returns)
+            returns_query = search_records(ReturnRecord, business_id, search_query)
+            search_pagination = returns_query.paginate(page=request.args.get('page', 1, type=int), per_page=SEARCH_PAGE_SIZE, error_out=False)
+            returns = search_pagination.items
+        else:
+            returns_query = ReturnRecord.query.filter_by(business_id=business_id)
+            returns_page = keyset_paginate(returns_query, ReturnRecord.return_date, ReturnRecord.id, request.args)
+            returns = returns_page.items
+        # Count and refund total across every page, not just this one
+        total_returns, total_refunds = returns_query.order_by(None).with_entities(
+            db.func.count(ReturnRecord.id), db.func.coalesce(db.func.sum(ReturnRecord.total_refund_amount), 0.0)
+        ).one()
         
         return render_template('returns_history.html', 
                              title='Returns History',
                              returns=returns,
                              total_refunds=total_refunds,
                              search_query=search_query,
+                             search_pagination=search_pagination,
+                             returns_page=returns_page,
+                             total_returns=total_returns,
                              current_year=datetime.now().year)
     
     # --- Reports Route ---
@@ -6308,143 +6018,74 @@ def create_app():
         # --- NEW: Total Number of Stocks Available ---
         total_inventory_count = 0
 
-        inventory_items_for_stock_val = InventoryItem.query.filter_by(business_id=business_id, is_active=True).all()
-        
-        # Calculate total stock quantities (sum of all current_stock)
-        total_inventory_count = sum(item.current_stock or 0 for item in inventory_items_for_stock_val)
-        
-        # Calculate stock quantities by category
-        stocks_by_category = {}
-        for item in inventory_items_for_stock_val:
-            category = item.category or 'Uncategorized'
-            current_stock = item.current_stock or 0
-            if category in stocks_by_category:
-                stocks_by_category[category] += current_stock
-            else:
-                stocks_by_category[category] = current_stock
-        
-        for item in inventory_items_for_stock_val:
-            current_stock = item.current_stock or 0.0
-            number_of_tabs = item.number_of_tabs or 1.0 # Ensure it's not zero for division
+        stock_valuation = compute_stock_valuation(business_id)
 
-            # Calculate cost value
-            cost_per_base_unit = float(item.purchase_price / number_of_tabs) if number_of_tabs > 0 else 0.0
-            total_cost_of_stock += current_stock * cost_per_base_unit
+        # Calculate total stock quantities (sum of all current_stock)
+        total_inventory_count = stock_valuation['total_stock']
 
-            # Calculate sale value (potential revenue from current stock)
-            item_type = item.item_type
-            sale_price_per_pack = item.sale_price or 0.0
-            fixed_sale_price = item.fixed_sale_price or 0.0
-            unit_price_per_tab = item.unit_price_per_tab or 0.0
-            
-            sale_value_per_base_unit = 0.0
-            if item.is_fixed_price:
-                sale_value_per_base_unit = float(fixed_sale_price / number_of_tabs) if number_of_tabs > 0 else 0.0
-            else:
-                if item_type == 'Pharmacy': 
-                    # Pharmacy items price based on markup on purchase price
-                    sale_value_per_base_unit = float(item.purchase_price * (1 + (item.markup_percentage_pharmacy or 0) / 100) / number_of_tabs) if number_of_tabs > 0 else 0.0
-                elif item_type == 'Hardware Material': 
-                    # Hardware might sell by piece, so unit_price_per_tab (which is per-piece) is relevant
-                    sale_value_per_base_unit = unit_price_per_tab 
-                else: 
-                    # Default or other types, consider sale_price for packs, convert to per base unit
-                    sale_value_per_base_unit = float(sale_price_per_pack / number_of_tabs) if number_of_tabs > 0 else 0.0
-            
-            total_sale_value_of_stock += current_stock * sale_value_per_base_unit
+        # Calculate stock quantities by category
+        stocks_by_category = stocks_by_category_from_valuation(stock_valuation)
 
-        total_potential_gross_profit = total_sale_value_of_stock - total_cost_of_stock
-        overall_stock_profit_margin = (total_potential_gross_profit / total_sale_value_of_stock) * 100 if total_sale_value_of_stock > 0 else 0.0
+        total_cost_of_stock = stock_valuation['cost_value']
+        total_sale_value_of_stock = stock_valuation['sale_value']
+        total_potential_gross_profit = stock_valuation['potential_gross_profit']
+        overall_stock_profit_margin = stock_valuation['profit_margin']
 
         # --- Total Actual Sales Revenue (overall for the business) ---
         # Using grand_total_amount as the correct column
-        total_sales_amount = db.session.query(db.func.sum(SalesRecord.grand_total_amount)).filter(
-            SalesRecord.business_id == business_id
-        ).scalar() or 0.0
+        total_sales_amount = rollup_revenue(business_id)
 
         # --- Sales by Sales Person (Last 30 days) ---
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        sales_by_person = db.session.query(
-            SalesRecord.sales_person_name,
-            db.func.sum(SalesRecord.grand_total_amount)
-        ).filter(
-            SalesRecord.business_id == business_id,
-            SalesRecord.transaction_date >= thirty_days_ago
-        ).group_by(SalesRecord.sales_person_name).order_by(db.func.sum(SalesRecord.grand_total_amount).desc()).all()
+        thirty_days_ago = date.today() - timedelta(days=30)
+        sales_by_person = rollup_sales_by_person(business_id, thirty_days_ago)
 
-        # --- Weekly Sales Data (Real Data) ---
-        # Get current week start (Monday)
+        # --- Weekly and Monthly Sales Data (Real Data) ---
+        # Get current week start (Monday) and current month start and end
         today = datetime.now().date()
         week_start = today - timedelta(days=today.weekday())
         week_end = week_start + timedelta(days=6)
-        
+        month_start = today.replace(day=1)
+        if month_start.month == 12:
+            month_end = month_start.replace(year=month_start.year+1, month=1) - timedelta(days=1)
+        else:
+            month_end = month_start.replace(month=month_start.month+1) - timedelta(days=1)
+
+        # One grouped query covers both the week and the month
+        daily_sales = {
+            point['bucket_start'].date(): point['amount']
+            for point in sales_timeseries(business_id, min(week_start, month_start), max(week_end, month_end) + timedelta(days=1), 'day')
+        }
+
         weekly_sales_data = []
         days_of_week = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        
         for i in range(7):
             current_day = week_start + timedelta(days=i)
-            day_sales = db.session.query(
-                db.func.sum(SalesRecord.grand_total_amount)
-            ).filter(
-                SalesRecord.business_id == business_id,
-                db.func.date(SalesRecord.transaction_date) == current_day
-            ).scalar() or 0.0
-            
             weekly_sales_data.append({
                 'day': days_of_week[i],
                 'date': current_day.strftime('%Y-%m-%d'),
-                'amount': day_sales
+                'amount': daily_sales.get(current_day, 0.0)
             })
 
-        # --- Monthly Sales Data (Real Data) ---
-        # Get current month start and end
-        month_start = today.replace(day=1)
-        if month_start.month == 12:
-            month_end = month_start.replace(year=month_start.year+1, month=1) - timedelta(days=1)
-        else:
-            month_end = month_start.replace(month=month_start.month+1) - timedelta(days=1)
-        
         monthly_sales_data = []
         current_date = month_start
-        
         while current_date <= month_end:
-            day_sales = db.session.query(
-                db.func.sum(SalesRecord.grand_total_amount)
-            ).filter(
-                SalesRecord.business_id == business_id,
-                db.func.date(SalesRecord.transaction_date) == current_date
-            ).scalar() or 0.0
-            
             monthly_sales_data.append({
                 'date': current_date.strftime('%Y-%m-%d'),
-                'amount': day_sales
+                'amount': daily_sales.get(current_date, 0.0)
             })
             current_date += timedelta(days=1)
 
         # --- Inventory Stock Summary (all active items) ---
+        ensure_expiry_buckets_current(business_id)
         inventory_summary = InventoryItem.query.filter_by(business_id=business_id, is_active=True).order_by(InventoryItem.product_name).all()
 
-        # --- Pharmacy specific reports ---
+        # --- Pharmacy specific reports (from the stored expiry buckets of the summary above) ---
         expired_items = []
         expiring_soon_items = []
         if business_type == 'Pharmacy':
-            today_date = date.today()
-            three_months_from_now = today_date + timedelta(days=90)
-            
-            expired_items = InventoryItem.query.filter(
-                InventoryItem.business_id == business_id,
-                InventoryItem.is_active == True,
-                InventoryItem.expiry_date != None,
-                InventoryItem.expiry_date < today_date
-            ).order_by(InventoryItem.expiry_date).all()
-
-            expiring_soon_items = InventoryItem.query.filter(
-                InventoryItem.business_id == business_id,
-                InventoryItem.is_active == True,
-                InventoryItem.expiry_date != None,
-                InventoryItem.expiry_date >= today_date,
-                InventoryItem.expiry_date <= three_months_from_now
-            ).order_by(InventoryItem.expiry_date).all()
+            by_expiry = sorted((item for item in inventory_summary if item.expiry_date), key=lambda item: item.expiry_date)
+            expired_items = [item for item in by_expiry if item.expiry_bucket == EXPIRED]
+            expiring_soon_items = [item for item in by_expiry if item.expiry_bucket in EXPIRING_SOON_BUCKETS]
 
         # --- Hardware specific reports ---
         company_balances = []
@@ -6489,6 +6130,242 @@ def create_app():
                             end_date=end_date_str      # Passed for filter persistence
         )
 
+    @app.route('/api/v1/reports/stock_valuation', methods=['GET'])
+    @login_required
+    def api_stock_valuation():
+        """
+        JSON stock valuation (totals, per category and per item type) for the
+        current business, computed by the same engine as dashboard() and reports().
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        try:
+            return jsonify({'success': True, 'valuation': compute_stock_valuation(business_id)})
+        except Exception as e:
+            logging.error(f"Error computing stock valuation for business {business_id}: {e}")
+            return jsonify({'success': False, 'message': 'Failed to compute stock valuation.'}), 500
+
+    @app.route('/api/v1/inventory/low_stock', methods=['GET'])
+    @login_required
+    def api_low_stock():
+        """The maintained low-stock set: active items at or below their reorder point."""
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        items = [low_stock_row(item) for item in low_stock_query(business_id)]
+        return jsonify({'success': True, 'count': len(items), 'items': items})
+
+    @app.route('/api/v1/inventory/expiry_buckets', methods=['GET'])
+    @login_required
+    def api_expiry_bucket_counts():
+        """Number of active items per expiry bucket, with the configured thresholds."""
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        ensure_expiry_buckets_current(business_id)
+        return jsonify({
+            'success': True,
+            'thresholds': expiry_thresholds(),
+            'counts': expiry_bucket_counts(business_id)
+        })
+
+    @app.route('/api/v1/inventory/expiry_buckets/<string:bucket>', methods=['GET'])
+    @login_required
+    def api_expiry_bucket_items(bucket):
+        """Paged list of the active items in one expiry bucket. Query args: page, per_page (max 200)."""
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        if bucket not in BUCKETS:
+            return jsonify({'success': False, 'message': f"Unknown expiry bucket '{bucket}'. Use one of: {', '.join(BUCKETS)}."}), 404
+
+        page = request.args.get('page', 1, type=int)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+        ensure_expiry_buckets_current(business_id)
+        pagination = items_in_buckets(business_id, [bucket]).paginate(page=page, per_page=per_page, error_out=False)
+        return jsonify({
+            'success': True,
+            'bucket': bucket,
+            'page': pagination.page,
+            'per_page': pagination.per_page,
+            'total': pagination.total,
+            'items': [{
+                'id': item.id,
+                'product_name': item.product_name,
+                'batch_number': item.batch_number,
+                'current_stock': item.current_stock,
+                'expiry_date': item.expiry_date.isoformat() if item.expiry_date else None
+            } for item in pagination.items]
+        })
+
+    @app.route('/api/v1/reports/sales_timeseries', methods=['GET'])
+    @login_required
+    def api_sales_timeseries():
+        """
+        Zero-filled sales totals per hour/day/week/month for the current business.
+        Query args: start_date, end_date (YYYY-MM-DD, inclusive) and granularity.
+        Defaults to the last 30 days by day.
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+
+        granularity = request.args.get('granularity', 'day')
+        try:
+            end_day = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else date.today()
+            start_day = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else end_day - timedelta(days=29)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Dates must use the YYYY-MM-DD format.'}), 400
+        if start_day > end_day:
+            return jsonify({'success': False, 'message': 'start_date must not be after end_date.'}), 400
+
+        try:
+            series = sales_timeseries(business_id, start_day, end_day + timedelta(days=1), granularity)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        return jsonify({
+            'success': True,
+            'granularity': granularity,
+            'start_date': start_day.isoformat(),
+            'end_date': end_day.isoformat(),
+            'total_amount': sum(point['amount'] for point in series),
+            'series': serialize_timeseries(series, granularity)
+        })
+
+    @app.route('/api/v1/reports/product_sales', methods=['GET'])
+    @login_required
+    def api_product_sales():
+        """
+        Units, returns, revenue and cost per product and per category, aggregated
+        in SQL over sales_line_items. Query args: start_date, end_date
+        (YYYY-MM-DD, inclusive; default the last 30 days) and limit.
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+
+        try:
+            end_day = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else date.today()
+            start_day = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else end_day - timedelta(days=29)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Dates must use the YYYY-MM-DD format.'}), 400
+        if start_day > end_day:
+            return jsonify({'success': False, 'message': 'start_date must not be after end_date.'}), 400
+        limit = request.args.get('limit', type=int)
+
+        start, end = day_bounds(start_day, end_day)
+        return jsonify({
+            'success': True,
+            'start_date': start_day.isoformat(),
+            'end_date': end_day.isoformat(),
+            'products': product_sales(business_id, start, end, limit=limit),
+            'categories': category_sales(business_id, start, end)
+        })
+
+    @app.route('/api/v1/catalog', methods=['GET'])
+    @login_required
+    def api_catalog():
+        """
+        Sale-form product catalog with delta sync. Without `since` (or with an
+        expired one) returns the whole active catalog; with the `version` of an
+        earlier response returns only the items changed since and the ids removed.
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        changes = catalog_changes(business_id, request.args.get('since'))
+        return json_response({'success': True, **changes})
+
+    @app.route('/api/v1/products/search', methods=['GET'])
+    @login_required
+    def api_search_products():
+        """
+        Typeahead product search: the active items best matching `q` (name
+        prefix first, then similarity, then recent sales), at most `limit`,
+        in the catalog's item format.
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        query_string = request.args.get('q', '').strip()
+        limit = request.args.get('limit', PRODUCT_SEARCH_LIMIT, type=int) or PRODUCT_SEARCH_LIMIT
+        items = search_products(business_id, query_string, limit=limit)
+        return jsonify({'success': True, 'query': query_string, 'items': [sale_form_view.item(item) for item in items]})
+
+    @app.route('/api/v1/sms', methods=['GET'])
+    @login_required
+    def api_sms_outbox():
+        """Recently queued SMS of the business with their delivery status. Query args: status, limit (max 200)."""
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        query = SmsMessage.query.filter_by(business_id=business_id)
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args['status'])
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        messages = query.order_by(SmsMessage.created_at.desc()).limit(limit).all()
+        return jsonify({'success': True, 'messages': [serialize_sms(sms) for sms in messages]})
+
+    @app.route('/api/v1/sms/<string:message_id>', methods=['GET'])
+    @login_required
+    def api_sms_status(message_id):
+        """Delivery status of one queued SMS."""
+        sms = SmsMessage.query.filter_by(id=message_id, business_id=get_current_business_id()).first()
+        if not sms:
+            return jsonify({'success': False, 'message': 'SMS not found.'}), 404
+        return jsonify({'success': True, 'sms': serialize_sms(sms)})
+
+    @app.route('/api/v1/search/<string:kind>', methods=['GET'])
+    @login_required
+    def api_search_history(kind):
+        """
+        Ranked, paged search of sales or returns history. Query args: q, page and
+        per_page (max 200). Phone numbers match in local or +233 form.
+        """
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'success': False, 'message': 'Business context not found.'}), 400
+        model = {'sales': SalesRecord, 'returns': ReturnRecord}.get(kind)
+        if model is None:
+            return jsonify({'success': False, 'message': "Unknown search kind. Use 'sales' or 'returns'."}), 404
+        query = search_records(model, business_id, request.args.get('q', ''))
+        if query is None:
+            return jsonify({'success': False, 'message': 'Search text (q) is required.'}), 400
+
+        page = request.args.get('page', 1, type=int)
+        per_page = min(max(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), 1), 200)
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        if model is SalesRecord:
+            results = [{
+                'id': sale.id,
+                'receipt_number': sale.receipt_number,
+                'transaction_date': sale.transaction_date.isoformat() if sale.transaction_date else None,
+                'customer_phone': sale.customer_phone,
+                'sales_person_name': sale.sales_person_name,
+                'grand_total_amount': sale.grand_total_amount,
+            } for sale in pagination.items]
+        else:
+            results = [{
+                'id': return_record.id,
+                'return_receipt_number': return_record.return_receipt_number,
+                'original_receipt_number': return_record.original_receipt_number,
+                'return_date': return_record.return_date.isoformat() if return_record.return_date else None,
+                'customer_name': return_record.customer_name,
+                'customer_phone': return_record.customer_phone,
+                'processed_by': return_record.processed_by,
+                'total_refund_amount': return_record.total_refund_amount,
+            } for return_record in pagination.items]
+        return jsonify({
+            'success': True,
+            'kind': kind,
+            'page': pagination.page,
+            'per_page': pagination.per_page,
+            'total': pagination.total,
+            'results': results
+        })
+
     @app.route('/gra_tax_report')
     def gra_tax_report():
         """Ghana Revenue Authority Tax Report for Medium and Small Enterprises"""
@@ -6532,66 +6409,38 @@ def create_app():
                 end_date = datetime(current_year, 12, 31, 23, 59, 59)
                 flash('Invalid end date format. Using December 31st of current year.', 'warning')
 
-        # Calculate total revenue for the business within the date range
-        total_revenue = db.session.query(
-            db.func.sum(SalesRecord.grand_total_amount)
-        ).filter(
-            SalesRecord.business_id == business_id,
-            SalesRecord.transaction_date >= start_date,
-            SalesRecord.transaction_date <= end_date
-        ).scalar() or 0.0
-
-        # Calculate total costs (using purchase prices from inventory)
-        total_costs = 0.0
-        # Get all sales in the period and calculate their costs
-        sales_in_period = SalesRecord.query.filter(
-            SalesRecord.business_id == business_id,
-            SalesRecord.transaction_date >= start_date,
-            SalesRecord.transaction_date <= end_date
-        ).all()
-        
-        for sale in sales_in_period:
-            # Find the inventory item to get purchase price
-            # Handle different possible field names for product identification
-            product_identifier = None
-            
-            # Try different field names that might exist
-            if hasattr(sale, 'product_name'):
-                product_identifier = sale.product_name
-            elif hasattr(sale, 'item_name'):
-                product_identifier = sale.item_name
-            elif hasattr(sale, 'product_id'):
-                # If we have a product_id, find by ID instead
-                inventory_item = InventoryItem.query.filter_by(
-                    business_id=business_id,
-                    id=sale.product_id
-                ).first()
+        # Quarterly periods. Closed quarters are served from the period
+        # aggregate cache; only the open quarter is computed live.
+        quarter_periods = []
+        for quarter in range(1, 5):
+            if quarter == 1:
+                q_start = start_date.replace(month=1, day=1)
+                q_end = start_date.replace(month=3, day=31, hour=23, minute=59, second=59)
+            elif quarter == 2:
+                q_start = start_date.replace(month=4, day=1)
+                q_end = start_date.replace(month=6, day=30, hour=23, minute=59, second=59)
+            elif quarter == 3:
+                q_start = start_date.replace(month=7, day=1)
+                q_end = start_date.replace(month=9, day=30, hour=23, minute=59, second=59)
             else:
-                # Skip this sale if we can't identify the product
-                continue
-            
-            if product_identifier:
-                inventory_item = InventoryItem.query.filter_by(
-                    business_id=business_id,
-                    product_name=product_identifier
-                ).first()
+                q_start = start_date.replace(month=10, day=1)
+                q_end = start_date.replace(month=12, day=31, hour=23, minute=59, second=59)
             
-            if inventory_item:
-                # Calculate cost based on quantity sold and purchase price
-                purchase_price_per_unit = inventory_item.purchase_price or 0.0
-                if inventory_item.number_of_tabs and inventory_item.number_of_tabs > 0:
-                    purchase_price_per_unit = purchase_price_per_unit / inventory_item.number_of_tabs
-                
-                # Handle different possible field names for quantity
-                quantity_sold = 0.0
-                if hasattr(sale, 'quantity_sold'):
-                    quantity_sold = sale.quantity_sold or 0.0
-                elif hasattr(sale, 'quantity'):
-                    quantity_sold = sale.quantity or 0.0
-                elif hasattr(sale, 'amount_sold'):
-                    quantity_sold = sale.amount_sold or 0.0
-                
-                total_costs += quantity_sold * purchase_price_per_unit
+            # Ensure we don't go beyond the selected end date
+            q_end = min(q_end, end_date)
+            quarter_periods.append((quarter, q_start, q_end, get_period_aggregates(business_id, q_start.date(), q_end.date())))
+
+        # When the quarters exactly cover the selected range, the totals are their sum
+        if (start_date.month, start_date.day) == (1, 1) and end_date.year == start_date.year:
+            total_revenue = sum(aggregates['revenue'] for _, _, _, aggregates in quarter_periods)
+            total_costs = sum(aggregates['cost_of_goods_sold'] for _, _, _, aggregates in quarter_periods)
+        else:
+            # Calculate total revenue for the business within the date range
+            total_revenue = rollup_revenue(business_id, start_date.date(), end_date.date())
+
+            # Calculate total costs (purchase cost snapshotted on each sale line,
+            # falling back to current inventory prices for older sales)
+            total_costs = compute_cogs(business_id, start_date, datetime.combine(end_date.date() + timedelta(days=1), datetime.min.time()))['cost_of_goods_sold']
 
         # Calculate gross profit
         gross_profit = total_revenue - total_costs
@@ -6644,37 +6493,13 @@ def create_app():
         
         # Quarterly breakdown
         quarterly_data = []
-        for quarter in range(1, 5):
-            if quarter == 1:
-                q_start = start_date.replace(month=1, day=1)
-                q_end = start_date.replace(month=3, day=31, hour=23, minute=59, second=59)
-            elif quarter == 2:
-                q_start = start_date.replace(month=4, day=1)
-                q_end = start_date.replace(month=6, day=30, hour=23, minute=59, second=59)
-            elif quarter == 3:
-                q_start = start_date.replace(month=7, day=1)
-                q_end = start_date.replace(month=9, day=30, hour=23, minute=59, second=59)
-            else:
-                q_start = start_date.replace(month=10, day=1)
-                q_end = start_date.replace(month=12, day=31, hour=23, minute=59, second=59)
-            
-            # Ensure we don't go beyond the selected end date
-            q_end = min(q_end, end_date)
-            
-            q_revenue = db.session.query(
-                db.func.sum(SalesRecord.grand_total_amount)
-            ).filter(
-                SalesRecord.business_id == business_id,
-                SalesRecord.transaction_date >= q_start,
-                SalesRecord.transaction_date <= q_end
-            ).scalar() or 0.0
-            
+        for quarter, q_start, q_end, aggregates in quarter_periods:
             quarterly_data.append({
                 'quarter': f'Q{quarter}',
                 'start_date': q_start.strftime('%Y-%m-%d'),
                 'end_date': q_end.strftime('%Y-%m-%d'),
-                'revenue': q_revenue,
-                'vat_due': q_revenue * 0.15 if vat_applicable else 0.0
+                'revenue': aggregates['revenue'],
+                'vat_due': aggregates['vat_amount'] if vat_applicable else 0.0
             })
         
         return render_template('gra_tax_report.html',
@@ -6706,8 +6531,10 @@ def create_app():
         today = date.today()
         
         # Get today's sales for debugging
+        today_start, tomorrow_start = day_bounds(today, today)
         today_sales = SalesRecord.query.filter_by(business_id=business_id).filter(
-            db.func.date(SalesRecord.transaction_date) == today
+            SalesRecord.transaction_date >= today_start,
+            SalesRecord.transaction_date < tomorrow_start
         ).limit(3).all()  # Just get first 3 for debugging
         
         debug_info = []
@@ -6722,117 +6549,6 @@ def create_app():
         
         return f"<pre>{json.dumps(debug_info, indent=2, default=str)}</pre>"
 
-    def parse_sales_item_data(item_dict):
-        """Robust parsing of sales item data with extensive fallback logic"""
-        if not isinstance(item_dict, dict):
-            return {
-                'name': 'Unknown Product',
-                'quantity': 1.0,
-                'unitType': 'piece',
-                'unitPrice': 0.0,
-                'totalPrice': 0.0
-            }
-        
-        # Extract product name with YOUR ACTUAL FIELD NAMES first
-        product_name = (
-            item_dict.get('product_name') or          # YOUR ACTUAL FIELD
-            item_dict.get('name') or
-            item_dict.get('productName') or
-            item_dict.get('item_name') or
-            'Unknown Product'
-        )
-        
-        # Extract quantity with YOUR ACTUAL FIELD NAMES first
-        quantity_raw = (
-            item_dict.get('quantity_sold') or         # YOUR ACTUAL FIELD
-            item_dict.get('quantity') or
-            item_dict.get('qty') or
-            1
-        )
-        
-        try:
-            quantity = float(str(quantity_raw).replace(',', ''))
-            if quantity <= 0:
-                quantity = 1.0
-        except (ValueError, TypeError, AttributeError):
-            quantity = 1.0
-        
-        # Extract unit type with YOUR ACTUAL FIELD NAMES first
-        unit_type = (
-            item_dict.get('sale_unit_type') or        # YOUR ACTUAL FIELD
-            item_dict.get('unitType') or
-            item_dict.get('unit_type') or
-            item_dict.get('unit') or
-            'piece'
-        )
-        
-        # Extract unit price with YOUR ACTUAL FIELD NAMES first
-        unit_price = 0.0
-        price_candidates = [
-            item_dict.get('price_at_time_per_unit_sold'),  # YOUR ACTUAL FIELD
-            item_dict.get('unitPrice'),
-            item_dict.get('unit_price'),
-            item_dict.get('price'),
-            item_dict.get('sale_price')
-        ]
-        
-        for price_value in price_candidates:
-            if price_value is not None:
-                try:
-                    unit_price = float(str(price_value).replace(',', '').replace('GH₵', '').replace('GHS', '').replace('₵', ''))
-                    if unit_price > 0:
-                        break
-                except (ValueError, TypeError, AttributeError):
-                    continue
-        
-        # Extract total price with YOUR ACTUAL FIELD NAMES first
-        total_price = 0.0
-        total_candidates = [
-            item_dict.get('item_total_amount'),        # YOUR ACTUAL FIELD
-            item_dict.get('totalPrice'),
-            item_dict.get('total_price'),
-            item_dict.get('total'),
-            item_dict.get('amount')
-        ]
-        
-        for total_value in total_candidates:
-            if total_value is not None:
-                try:
-                    total_price = float(str(total_value).replace(',', '').replace('GH₵', '').replace('GHS', '').replace('₵', ''))
-                    if total_price > 0:
-                        break
-                except (ValueError, TypeError, AttributeError):
-                    continue
-        
-        # Calculate missing values
-        if unit_price == 0.0 and total_price > 0.0 and quantity > 0.0:
-            unit_price = total_price / quantity
-        elif total_price == 0.0 and unit_price > 0.0:
-            total_price = unit_price * quantity
-        
-        # FALLBACK: Try inventory lookup if both prices are still 0
-        if unit_price == 0.0 and total_price == 0.0:
-            business_id = get_current_business_id()
-            if business_id and product_name != 'Unknown Product':
-                try:
-                    inventory_item = InventoryItem.query.filter(
-                        InventoryItem.business_id == business_id,
-                        InventoryItem.product_name.ilike(f'%{product_name.strip()}%')
-                    ).first()
-                    
-                    if inventory_item and inventory_item.sale_price:
-                        unit_price = float(inventory_item.sale_price)
-                        total_price = unit_price * quantity
-                except Exception:
-                    pass  # Silent fallback failure
-        
-        return {
-            'name': str(product_name).strip(),
-            'quantity': quantity,
-            'unitType': str(unit_type).strip(),
-            'unitPrice': round(unit_price, 2),
-            'totalPrice': round(total_price, 2)
-        }
     @app.route('/print_daily_sales_report')
     def print_daily_sales_report():
         # ACCESS CONTROL: Allows admin role
@@ -6842,54 +6558,15 @@ def create_app():
 
         business_id = get_current_business_id()
         today = date.today()
-        
-        today_sales = SalesRecord.query.filter_by(business_id=business_id).filter(
-            db.func.date(SalesRecord.transaction_date) == today
-        ).all()
-
-        total_sales_amount = sum(s.grand_total_amount for s in today_sales)
-        total_items_sold = 0.0
-        
-        product_sales_summary = {}
-        sales_details = []
-        
-        for sale in today_sales:
-            # Parse items from JSON with robust parsing
-            raw_items_sold = sale.get_items_sold()  # This returns the parsed JSON list
-            
-            # Process each item through our robust parser
-            processed_items = []
-            for raw_item in raw_items_sold:
-                parsed_item = parse_sales_item_data(raw_item)
-                processed_items.append(parsed_item)
-                
-                # Update totals
-                total_items_sold += parsed_item['quantity']
-                
-                # Update product summary
-                key = f"{parsed_item['name']} ({parsed_item['unitType']})"
-                product_sales_summary[key] = product_sales_summary.get(key, 0.0) + parsed_item['quantity']
-            
-            sale_detail = {
-                'receipt_number': sale.receipt_number or sale.id[:8],
-                'customer_phone': sale.customer_phone or 'N/A',
-                'sales_person': sale.sales_person_name,
-                'transaction_time': sale.transaction_date.strftime('%H:%M'),
-                'grand_total': sale.grand_total_amount,
-                'products': processed_items  # Use the processed items
-            }
-            sales_details.append(sale_detail)
+        # Stored by the end-of-day scheduler; built live before closing time
+        report = stored_daily_report(business_id, today) or build_daily_report(business_id, today)
 
         business_name = session.get('business_info', {}).get('name', ENTERPRISE_NAME)
         
         return render_template('print_daily_sales_report.html',
                              today=today,
                              business_name=business_name,
-                             total_sales_amount=total_sales_amount,
-                             total_items_sold=total_items_sold,
-                             product_sales_summary=product_sales_summary,
-                             sales_details=sales_details,
-                             total_transactions=len(today_sales))
+                             **report)
 
     @app.route('/send_daily_sales_sms_report')
     def send_daily_sales_sms_report():
@@ -6901,43 +6578,16 @@ def create_app():
         business_id = get_current_business_id()
         today = date.today()
         
-        today_sales = SalesRecord.query.filter_by(business_id=business_id).filter(
-            db.func.date(SalesRecord.transaction_date) == today
-        ).all()
-
-        total_sales_amount = sum(s.grand_total_amount for s in today_sales)
-        total_items_sold = 0.0
-        
-        product_sales_summary = {}
-        for sale in today_sales:
-            # Parse items from JSON with robust parsing
-            raw_items_sold = sale.get_items_sold()  # This returns the parsed JSON list
-            for raw_item in raw_items_sold:
-                parsed_item = parse_sales_item_data(raw_item)
-                
-                # Update totals
-                total_items_sold += parsed_item['quantity']
-                
-                # Update product summary
-                key = f"{parsed_item['name']} ({parsed_item['unitType']})"
-                product_sales_summary[key] = product_sales_summary.get(key, 0.0) + parsed_item['quantity']
+        report = stored_daily_report(business_id, today)
+        if report is None:
+            # Summed from sales_line_items in SQL instead of parsing every sale's JSON
+            product_sales_summary, total_items_sold = product_quantity_summary(business_id, *day_bounds(today, today))
+            report = {'total_sales_amount': rollup_revenue(business_id, today, today),
+                      'total_items_sold': total_items_sold, 'product_sales_summary': product_sales_summary}
 
         business_name_for_sms = session.get('business_info', {}).get('name', ENTERPRISE_NAME)
         business_contact = session.get('business_info', {}).get('contact', '')
-        
-        message = f"Daily Sales Report ({today.strftime('%Y-%m-%d')}):\n"
-        message += f"Total Revenue: GH₵{total_sales_amount:.2f}\n"
-        message += f"Total Items Sold (approx): {total_items_sold:.2f}\n"
-        
-        if product_sales_summary:
-            message += "Product Breakdown:\n"
-            for product_key, qty in product_sales_summary.items():
-                message += f"- {product_key}: {qty:.2f} units\n"
-        else:
-            message += "No sales recorded today."
-        
-        message += f"\nThank you for trading with us\n"
-        message += f"From: {business_name_for_sms}"
+        message = daily_report_sms(report, today, business_name_for_sms)
 
         # Use business contact or fallback to ADMIN_PHONE_NUMBER
         phone_to_send = business_contact or ADMIN_PHONE_NUMBER
@@ -6946,22 +6596,12 @@ def create_app():
             flash('Business contact phone number is not configured for SMS reports. Please update your business contact information.', 'danger')
             return redirect(url_for('reports'))
 
-        sms_payload = {
-            'action': 'send-sms', 'api_key': ARKESEL_API_KEY, 'to': phone_to_send,
-            'from': ARKESEL_SENDER_ID, 'sms': message
-        }
-        
-        try:
-            sms_response = requests.get(ARKESEL_SMS_URL, params=sms_payload)
-            sms_result = sms_response.json()
-            if sms_result.get('status') == 'success':
-                flash('Daily sales report SMS sent to admin successfully!', 'success')
-            else:
-                print(f"Arkesel SMS Error: {sms_result.get('message', 'Unknown error')}")
-                flash(f'Failed to send daily sales report SMS. Error: {sms_result.get("message", "Unknown error")}', 'danger')
-        except requests.exceptions.RequestException as e:
-            print(f'Network error sending SMS: {e}')
-            flash(f'Network error when trying to send daily sales report SMS: {e}', 'danger')
+        _, created = enqueue_sms(business_id, phone_to_send, message, 'daily_report',
+                                 dedupe_key=f"daily_report:{business_id}:{today.isoformat()}:{uuid.uuid5(uuid.NAMESPACE_OID, message)}")
+        if created:
+            flash('Daily sales report SMS queued for sending.', 'success')
+        else:
+            flash('This daily sales report has already been sent.', 'info')
         
         return redirect(url_for('reports'))
 
@@ -6994,29 +6634,31 @@ def create_app():
                 Company.address.ilike(f'%{search_query}%')
             )
 
-        companies = companies_query.all()
+        companies_page = keyset_paginate(companies_query, Company.name, Company.id, request.args, descending=False)
+        companies = companies_page.items
+        total_companies = companies_query.with_entities(func.count(Company.id)).scalar()
+
+        # Balances of this page's companies in one grouped query
+        page_balances = dict(db.session.query(CompanyTransaction.company_id, Company.balance_sum()).filter(
+            CompanyTransaction.company_id.in_([company.id for company in companies])
+        ).group_by(CompanyTransaction.company_id).all()) if companies else {}
+
+        # Creditor/debtor sums across every matching company, not just this page.
+        # A company is a creditor if its balance is negative (we owe them)
+        # and a debtor if its balance is positive (they owe us).
+        balances = db.session.query(Company.balance_sum().label('balance')).filter(
+            CompanyTransaction.company_id.in_(companies_query.with_entities(Company.id))
+        ).group_by(CompanyTransaction.company_id).subquery()
+        total_creditors_sum, total_debtors_sum = db.session.query(
+            func.coalesce(func.sum(db.case((balances.c.balance < 0, -balances.c.balance), else_=0.0)), 0.0),
+            func.coalesce(func.sum(db.case((balances.c.balance > 0, balances.c.balance), else_=0.0)), 0.0)
+        ).one()
 
         processed_companies = []
-        total_creditors_sum = 0.0 # Initialize sum for creditors
-        total_debtors_sum = 0.0   # Initialize sum for debtors
-
         for company in companies:
-            # Get the balance by calling the method on the Company object
-            # This assumes Company.calculate_current_balance() is correctly defined on the model
-            company_balance = company.calculate_current_balance()
-            
-            # Calculate total_creditors and total_debtors for each company based on balance
-            # A company is a creditor if its balance is negative (we owe them)
-            # A company is a debtor if its balance is positive (they owe us)
-            display_creditors = 0.0
-            display_debtors = 0.0
-
-            if company_balance < 0:
-                display_creditors = abs(company_balance) # Store as positive for display
-                total_creditors_sum += abs(company_balance)
-            elif company_balance > 0:
-                display_debtors = company_balance
-                total_debtors_sum += company_balance
+            company_balance = float(page_balances.get(company.id, 0.0))
+            display_creditors = abs(company_balance) if company_balance < 0 else 0.0 # Store as positive for display
+            display_debtors = company_balance if company_balance > 0 else 0.0
             
             # Create a dictionary for the company data to be passed to the template
             # This prevents directly adding attributes to SQLAlchemy model instances which can be problematic
@@ -7039,6 +6681,8 @@ def create_app():
                             user_role=session.get('role'), 
                             search_query=search_query, 
                             current_year=datetime.now().year,
+                            companies_page=companies_page,
+                            total_companies=total_companies,
                             total_creditors_sum=total_creditors_sum, # Pass the sum of creditors
                             total_debtors_sum=total_debtors_sum)     # Pass the sum of debtors
 
@@ -7117,25 +6761,25 @@ def create_app():
         if search_query:
             transactions_query = transactions_query.filter(
                 CompanyTransaction.description.ilike(f'%{search_query}%') |
-                CompanyTransaction.type.ilike(f'%{search_query}%') |
+                CompanyTransaction.transaction_type.ilike(f'%{search_query}%') |
                 CompanyTransaction.recorded_by.ilike(f'%{search_query}%')
             )
 
         if start_date_str:
             try:
                 start_date_obj = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                transactions_query = transactions_query.filter(cast(CompanyTransaction.date, db.Date) >= start_date_obj)
+                transactions_query = transactions_query.filter(CompanyTransaction.transaction_date >= start_date_obj)
             except ValueError:
                 flash('Invalid start date format. Please use YYYY-MM-DD.', 'danger')
         
         if end_date_str:
             try:
                 end_date_obj = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                transactions_query = transactions_query.filter(cast(CompanyTransaction.date, db.Date) <= end_date_obj)
+                transactions_query = transactions_query.filter(CompanyTransaction.transaction_date < end_date_obj + timedelta(days=1))
             except ValueError:
                 flash('Invalid end date format. Please use YYYY-MM-DD.', 'danger')
 
-        return transactions_query.order_by(CompanyTransaction.date.desc()).all()
+        return transactions_query.order_by(CompanyTransaction.transaction_date.desc()).all()
 
 
     @app.route('/companies/edit/<company_id>', methods=['GET', 'POST'])
@@ -7781,28 +7425,12 @@ def create_app():
             f"From: {business_name_for_sms}"
         )
         
-        sms_payload = {
-            'action': 'send-sms',
-            'api_key': ARKESEL_API_KEY,
-            'to': company.phone_number, # Corrected: Use company.phone_number
-            'from': ARKESEL_SENDER_ID,
-            'sms': sms_message
-        }
-        
-        try:
-            sms_response = requests.get(ARKESEL_SMS_URL, params=sms_payload)
-            sms_response.raise_for_status()
-            sms_result = sms_response.json()
-
-            if sms_result.get('status') == 'success':
-                flash(f'SMS receipt sent to {company.name} successfully!', 'success')
-            else:
-                error_message = sms_result.get('message', 'Unknown error from SMS provider.')
-                flash(f'Failed to send SMS receipt to {company.name}. Error: {error_message}', 'danger')
-        except requests.exceptions.RequestException as e:
-            flash(f'Network error sending SMS receipt: {e}', 'danger')
-        except json.JSONDecodeError:
-            flash('Failed to parse SMS provider response. The response might not be in JSON format.', 'danger')
+        _, created = enqueue_sms(business_id, company.phone_number, sms_message, 'company_transaction',
+                                 dedupe_key=f'company_transaction:{transaction.id}')
+        if created:
+            flash(f'SMS receipt to {company.name} queued for sending.', 'success')
+        else:
+            flash(f'The SMS receipt for this transaction was already sent to {company.name}.', 'info')
             
         return redirect(url_for('company_transaction', company_id=company.id))
 
@@ -7957,8 +7585,10 @@ def create_app():
             return redirect(url_for('dashboard'))
 
         business_id = get_current_business_id()
-        orders = FutureOrder.query.filter_by(business_id=business_id).order_by(FutureOrder.order_date.desc()).all()    
-        return render_template('future_order_list.html', orders=orders, user_role=session.get('role'), current_year=datetime.now().year)
+        orders_query = FutureOrder.query.filter_by(business_id=business_id)
+        orders_page = keyset_paginate(orders_query, FutureOrder.order_date, FutureOrder.id, request.args)
+        total_orders = orders_query.with_entities(func.count(FutureOrder.id)).scalar()
+        return render_template('future_order_list.html', orders=orders_page.items, orders_page=orders_page, total_orders=total_orders, user_role=session.get('role'), current_year=datetime.now().year)
 
 
     @app.route('/future_orders/add', methods=['GET', 'POST'])
@@ -7974,8 +7604,9 @@ def create_app():
 
         business_id = get_current_business_id()
         # Only show hardware items for future orders
-        available_inventory_items = InventoryItem.query.filter_by(business_id=business_id, is_active=True, item_type='Hardware Material').all()
-        serialized_inventory_items = [serialize_inventory_item(item) for item in available_inventory_items]
+        serialized_inventory_items = detail_view.rows(
+            InventoryItem.query.filter_by(business_id=business_id, is_active=True, item_type='Hardware Material')
+        )
 
 
         if request.method == 'POST':
@@ -8070,15 +7701,8 @@ def create_app():
                     f"Thank you for your order!\\n"
                     f"From: {business_name_for_sms}"
                 )
-                sms_payload = {
-                    'action': 'send-sms', 'api_key': ARKESEL_API_KEY, 'to': customer_phone,
-                    'from': ARKESEL_SENDER_ID, 'sms': message
-                }
-                try:
-                    requests.get(ARKESEL_SMS_URL, params=sms_payload)
-                except requests.exceptions.RequestException as e:
-                    print(f'Network error sending SMS for future order: {e}')
-                    flash(f'Network error when trying to send SMS order confirmation.', 'warning')
+                enqueue_sms(business_id, customer_phone, message, 'future_order',
+                            dedupe_key=f'future_order:{new_order.id}')
 
             return redirect(url_for('future_orders'))
 
@@ -8102,8 +7726,9 @@ def create_app():
         business_id = get_current_business_id()
         order_to_edit = FutureOrder.query.filter_by(id=order_id, business_id=business_id).first_or_404()
         
-        available_inventory_items = InventoryItem.query.filter_by(business_id=business_id, is_active=True, item_type='Hardware Material').all()
-        serialized_inventory_items = [serialize_inventory_item(item) for item in available_inventory_items]
+        serialized_inventory_items = detail_view.rows(
+            InventoryItem.query.filter_by(business_id=business_id, is_active=True, item_type='Hardware Material')
+        )
 
 
         if request.method == 'POST':
@@ -8300,15 +7925,8 @@ def create_app():
                     f"Thank you for your business!\\n"
                     f"From: {business_name_for_sms}"
                 )
-                sms_payload = {
-                    'action': 'send-sms', 'api_key': ARKESEL_API_KEY, 'to': order_to_collect.customer_phone,
-                    'from': ARKESEL_SENDER_ID, 'sms': message
-                }
-                try:
-                    requests.get(ARKESEL_SMS_URL, params=sms_payload)
-                except requests.exceptions.RequestException as e:
-                    print(f'Network error sending SMS for collection: {e}')
-                    flash(f'Network error when trying to send SMS collection confirmation.', 'warning')
+                enqueue_sms(business_id, order_to_collect.customer_phone, message, 'future_order_collected',
+                            dedupe_key=f'future_order_collected:{order_to_collect.id}')
         else:
             flash('Failed to mark order as collected.', 'danger')
 
@@ -8502,8 +8120,10 @@ def create_app():
             return redirect(url_for('dashboard'))
 
         business_id = get_current_business_id()
-        records = RentalRecord.query.filter_by(business_id=business_id).order_by(RentalRecord.date_recorded.desc()).all()
-        return render_template('rental_record_list.html', rental_records=records, user_role=session.get('role'), current_year=datetime.now().year)
+        records_query = RentalRecord.query.filter_by(business_id=business_id)
+        records_page = keyset_paginate(records_query, RentalRecord.date_recorded, RentalRecord.id, request.args)
+        total_records = records_query.with_entities(func.count(RentalRecord.id)).scalar()
+        return render_template('rental_record_list.html', rental_records=records_page.items, records_page=records_page, total_records=total_records, user_role=session.get('role'), current_year=datetime.now().year)
 
     @app.route('/rental_records/add', methods=['GET', 'POST'])
     @csrf.exempt
@@ -8644,16 +8264,9 @@ def create_app():
                     f"Thank you for your business!\n"
                     f"From: {business_name_for_sms}"
                 )
-                sms_payload = {
-                    'action': 'send-sms', 'api_key': ARKESEL_API_KEY, 'to': new_record.customer_phone,
-                    'from': ARKESEL_SENDER_ID, 'sms': sms_message
-                }
-                try:
-                    requests.get(ARKESEL_SMS_URL, params=sms_payload)
-                    flash(f'SMS receipt sent to {new_record.customer_name} successfully!', 'success')
-                except requests.exceptions.RequestException as e:
-                    print(f'Network error sending SMS for rental: {e}')
-                    flash(f'Network error when trying to send SMS rental confirmation.', 'warning')
+                enqueue_sms(business_id, new_record.customer_phone, sms_message, 'rental_receipt',
+                            dedupe_key=f'rental_receipt:{new_record.id}')
+                flash(f'SMS receipt to {new_record.customer_name} queued for sending.', 'success')
             elif send_sms and not new_record.customer_phone:
                 flash(f'SMS receipt not sent: No phone number configured for the customer.', 'warning')
 
@@ -9115,42 +8728,12 @@ def create_app():
         print(f"Attempting to send payment due SMS to {business.contact} for business {business.name}.")
         print(f"SMS Message: {sms_message}")
         
-        # Prepare SMS payload for Arkesel API
-        sms_payload = {
-            'action': 'send-sms',
-            'api_key': os.getenv('ARKESEL_API_KEY'), # Still get API key from env (secure practice)
-            'to': business.contact,
-            'from': os.getenv('ARKESEL_SENDER_ID', 'uniquebence'), # Still get Sender ID from env
-            'sms': sms_message
-        }
-        
-        try:
-            # CORRECTED LINE: Use the global ARKESEL_SMS_URL variable directly
-            sms_response = requests.get(ARKESEL_SMS_URL, params=sms_payload)
-            sms_response.raise_for_status()
-            sms_result = sms_response.json()
-            print(f"Arkesel SMS API Response: {sms_result}")
-
-            if sms_result.get('status') == 'success':
-                flash(f'Payment due SMS sent to {business.name} ({business.contact}) successfully!', 'success')
-            else:
-                error_message = sms_result.get('message', 'Unknown error from SMS provider.')
-                flash(f'Failed to send SMS to {business.name}. Error: {error_message}', 'danger')
-        except requests.exceptions.HTTPError as http_err:
-            flash(f'HTTP error sending SMS: {http_err}. Please check API key or sender ID.', 'danger')
-            print(f"HTTP Error: {http_err}")
-        except requests.exceptions.ConnectionError as conn_err:
-            flash(f'Network error sending SMS: {conn_err}. Please check your internet connection.', 'danger')
-            print(f"Connection Error: {conn_err}")
-        except requests.exceptions.Timeout as timeout_err:
-            flash(f'SMS request timed out: {timeout_err}. Please try again later.', 'danger')
-            print(f"Timeout Error: {timeout_err}")
-        except json.JSONDecodeError:
-            flash('Failed to parse SMS provider response. The response might not be in JSON format.', 'danger')
-            print("JSON Decode Error: Response was not valid JSON.")
-        except Exception as e:
-            flash(f'An unexpected error occurred while sending SMS: {e}', 'danger')
-            print(f"Unexpected Error: {e}")
+        _, created = enqueue_sms(business.id, business.contact, sms_message, 'payment_reminder',
+                                 dedupe_key=f'payment_reminder:{business.id}:{date.today().isoformat()}')
+        if created:
+            flash(f'Payment due SMS to {business.name} ({business.contact}) queued for sending.', 'success')
+        else:
+            flash(f'A payment due SMS was already sent to {business.name} today.', 'info')
 
         return redirect(url_for('super_admin_dashboard'))
 
@@ -9171,30 +8754,8 @@ def create_app():
         if not business_id:
             return jsonify({'success': False, 'message': 'Business context not found.'}), 400
 
-        products = InventoryItem.query.filter_by(business_id=business_id, is_active=True).all()
-        
-        products_data = []
-        for product in products:
-            # Prepare product data, ensuring numerical values are floats and dates are formatted
-            # Ensure all fields expected by the frontend JavaScript are included and consistently named.
-            products_data.append({
-                'id': str(product.id), # Convert UUID to string
-                'product_name': product.product_name,
-                'current_stock': float(product.current_stock or 0.0),
-                'is_fixed_price': product.is_fixed_price,
-                'barcode': product.barcode,
-                'number_of_tabs': float(product.number_of_tabs or 1.0), # Default to 1.0 if None
-                'unit_price_per_tab': float(product.unit_price_per_tab or 0.0),
-                'item_type': product.item_type,
-                'expiry_date': product.expiry_date.strftime('%Y-%m-%d') if product.expiry_date else None,
-                'batch_number': product.batch_number,
-                'purchase_price': float(product.purchase_price or 0.0),
-                'sale_price': float(product.sale_price or 0.0), # Regular sale price
-                'fixed_sale_price': float(product.fixed_sale_price or 0.0), # Fixed sale price
-                'markup_percentage_pharmacy': float(product.markup_percentage_pharmacy or 0.0), # Markup percentage
-            })
-        
-        return jsonify({'success': True, 'products': products_data})
+        products_data = scanner_view.rows(InventoryItem.query.filter_by(business_id=business_id, is_active=True))
+        return json_response({'success': True, 'products': products_data})
 
 
     # with app.app_context():
@@ -9482,62 +9043,43 @@ def create_app():
     @app.route('/dashboard-data')
     @login_required
     def dashboard_data():
+        """Summary JSON for external dashboards; built from the same widgets as /dashboard."""
+        business_id = get_current_business_id()
+        if not business_id:
+            return jsonify({'error': 'Business context not found.'}), 400
         try:
-            business_id = current_user.business_id
             today = date.today()
-            
-            # Sales data
-            sales_today = db.session.query(func.sum(SalesRecord.amount)).filter(
-                SalesRecord.business_id == business_id,
-                cast(SalesRecord.transaction_date, date) == today
-            ).scalar() or 0
-
-            sales_last_7_days = db.session.query(func.sum(SalesRecord.amount)).filter(
-                SalesRecord.business_id == business_id,
-                cast(SalesRecord.transaction_date, date) >= today - timedelta(days=7)
-            ).scalar() or 0
-
-            # Inventory value
-            total_inventory_value = db.session.query(func.sum(InventoryItem.unit_price * InventoryItem.quantity_in_stock)).filter(
-                InventoryItem.business_id == business_id
-            ).scalar() or 0
-
-            # Outstanding debt
-            total_debt = db.session.query(func.sum(Debtor.amount)).filter(
-                Debtor.business_id == business_id,
-                Debtor.status == 'unpaid'
-            ).scalar() or 0
-
-            # Recent transactions
-            recent_sales = SalesRecord.query.filter_by(business_id=business_id).order_by(SalesRecord.transaction_date.desc()).limit(10).all()
-            recent_rentals = RentalRecord.query.filter_by(business_id=business_id).order_by(RentalRecord.rental_start_date.desc()).limit(10).all()
-
-            # Chart data (last 30 days of sales)
-            sales_history = db.session.query(
-                cast(SalesRecord.transaction_date, date),
-                func.sum(SalesRecord.amount)
-            ).filter(
-                SalesRecord.business_id == business_id,
-                cast(SalesRecord.transaction_date, date) >= today - timedelta(days=30)
-            ).group_by(
-                cast(SalesRecord.transaction_date, date)
-            ).order_by(
-                cast(SalesRecord.transaction_date, date)
-            ).all()
+            kpis = DASHBOARD_WIDGETS['kpis'](business_id, get_current_business_type())
+            sales_history = sales_series(business_id, days=30, today=today)
 
-            sales_dates = [d.strftime('%Y-%m-%d') for d, _ in sales_history]
-            sales_amounts = [a for _, a in sales_history]
+            recent_sales = SalesRecord.query.filter_by(business_id=business_id).order_by(SalesRecord.transaction_date.desc()).limit(10).all()
+            recent_rentals = RentalRecord.query.filter_by(business_id=business_id).order_by(RentalRecord.rent_date.desc()).limit(10).all()
 
             return jsonify({
-                'sales_today': sales_today,
-                'sales_last_7_days': sales_last_7_days,
-                'total_inventory_value': total_inventory_value,
-                'total_debt': total_debt,
-                'recent_sales': [s.to_dict() for s in recent_sales],
-                'recent_rentals': [r.to_dict() for r in recent_rentals],
+                'sales_today': kpis['total_sales_today'],
+                'sales_last_7_days': kpis['total_sales_last_7_days'],
+                'total_inventory_value': kpis['current_stock_value_at_cost'],
+                'total_debt': kpis['total_outstanding_debt'],
+                'recent_sales': [{
+                    'id': sale.id,
+                    'receipt_number': sale.receipt_number,
+                    'transaction_date': sale.transaction_date.isoformat(),
+                    'sales_person_name': sale.sales_person_name,
+                    'grand_total_amount': sale.grand_total_amount,
+                    'payment_method': sale.payment_method
+                } for sale in recent_sales],
+                'recent_rentals': [{
+                    'id': rental.id,
+                    'item_name': rental.item_name_at_rent,
+                    'customer_name': rental.customer_name,
+                    'rent_date': rental.rent_date.isoformat() if rental.rent_date else None,
+                    'due_date': rental.due_date.isoformat() if rental.due_date else None,
+                    'status': rental.status,
+                    'total_rental_amount': rental.total_rental_amount
+                } for rental in recent_rentals],
                 'sales_chart_data': {
-                    'labels': sales_dates,
-                    'data': sales_amounts
+                    'labels': [point['label'] for point in sales_history],
+                    'data': [point['amount'] for point in sales_history]
                 }
             })
         except Exception as e:
@@ -9575,13 +9117,16 @@ def create_app():
                 )
             )
         
-        # Order by creation date (newest first)
-        invoices = query.order_by(Invoice.created_at.desc()).all()
+        # Newest first, one page at a time
+        invoices_page = keyset_paginate(query, Invoice.created_at, Invoice.id, request.args)
+        invoices = invoices_page.items
         
-        # Calculate summary statistics
-        total_invoices = len(invoices)
-        total_amount = sum(inv.total_amount for inv in invoices)
-        paid_amount = sum(inv.total_amount for inv in invoices if inv.payment_status == 'Paid')
+        # Summary statistics over every matching invoice, in one aggregate query
+        total_invoices, total_amount, paid_amount = query.with_entities(
+            func.count(Invoice.id),
+            func.coalesce(func.sum(Invoice.total_amount), 0.0),
+            func.coalesce(func.sum(db.case((Invoice.payment_status == 'Paid', Invoice.total_amount), else_=0.0)), 0.0)
+        ).one()
         pending_amount = total_amount - paid_amount
         
         summary = {
@@ -9593,6 +9138,7 @@ def create_app():
         
         return render_template('invoices/list.html', 
                             invoices=invoices, 
+                            invoices_page=invoices_page,
                             summary=summary,
                             status_filter=status_filter,
                             payment_filter=payment_filter,
@@ -9755,26 +9301,12 @@ def create_app():
         # GET request - show the form
         try:
             # Get inventory items for the dropdown
-            inventory_items_raw = InventoryItem.query.filter_by(
+            inventory_items = invoice_form_view.rows(InventoryItem.query.filter_by(
                 business_id=business_id, 
                 is_active=True
-            ).all()
+            ))
             
-            print(f"DEBUG: Found {len(inventory_items_raw)} active inventory items")
-            
-            # Serialize inventory items for JSON
-            inventory_items = []
-            for item in inventory_items_raw:
-                try:
-                    inventory_items.append({
-                        'product_name': item.product_name,
-                        'sale_price': float(item.sale_price) if item.sale_price else 0,
-                        'category': item.category or '',
-                        'current_stock': item.current_stock if item.current_stock else 0
-                    })
-                except Exception as e:
-                    print(f"ERROR: Failed to serialize inventory item {item.product_name}: {e}")
-                    continue
+            print(f"DEBUG: Found {len(inventory_items)} active inventory items")
 
             return render_template('invoices/create.html', 
                                 business=business, 
@@ -10003,44 +9535,14 @@ def create_app():
             # Get search query parameter
             query = request.args.get('q', '').strip()
 
-            # Start with base query
-            items_query = InventoryItem.query.filter_by(business_id=business_id, is_active=True)
-
-            # Apply search filter if query provided
-            if query:
-                search_term = f"%{query}%"
-                items_query = items_query.filter(or_(
-                    InventoryItem.product_name.ilike(search_term),
-                    InventoryItem.category.ilike(search_term),
-                    InventoryItem.batch_number.ilike(search_term),
-                    InventoryItem.barcode.ilike(search_term)
-                ))
+            # Apply search filter if query provided (indexed, see product_search.py)
+            items_query = matching_items(business_id, query)
+            if items_query is None:
+                items_query = InventoryItem.query.filter_by(business_id=business_id, is_active=True)
 
-            # Execute query
-            items = items_query.all()
+            serialized_items = item_picker_view.rows(items_query.order_by(InventoryItem.product_name))
 
-            # Serialize items
-            serialized_items = []
-            for item in items:
-                serialized_items.append({
-                    'id': str(item.id),
-                    'product_name': item.product_name or '',
-                    'category': item.category or '',
-                    'current_stock': float(item.current_stock or 0.0),
-                    'sale_price': float(item.sale_price or 0.0),
-                    'unit_price_per_tab': float(item.unit_price_per_tab or 0.0),
-                    'number_of_tabs': float(item.number_of_tabs or 1.0),
-                    'is_fixed_price': item.is_fixed_price,
-                    'fixed_sale_price': float(item.fixed_sale_price or 0.0),
-                    'barcode': item.barcode or '',
-                    'batch_number': item.batch_number or '',
-                    'item_type': item.item_type or '',
-                    'purchase_price': float(item.purchase_price or 0.0),
-                    'markup_percentage_pharmacy': float(item.markup_percentage_pharmacy or 0.0),
-                    'expiry_date': item.expiry_date.strftime('%Y-%m-%d') if item.expiry_date else None,
-                })
-
-            return jsonify({
+            return json_response({
                 'success': True, 
                 'items': serialized_items, 
                 'has_more': False,
@@ -0,0 +1,277 @@
+# barcodes.py
+# Exact-match barcode resolution for the till scanner
+# (/api/get_product_by_barcode and POST /api/v1/barcodes/resolve).
+#
+# Each process keeps, per business, a dict of every active item's barcodes,
+# InventoryItem.barcode plus its extra codes in product_barcodes, mapped to
+# the item id. A scan is a dict hit followed by a primary-key read of the item
+# (for its live stock); a batch of scans is one IN query. Writes that can move
+# a code (barcode, is_active or business of an item, any alias row, inserts
+# and deletes, and bulk statements touching those) drop the business's map
+# when their transaction commits in this process. Other processes' writes are
+# caught at scan time: a code missing from the map, or mapped to an item that
+# no longer carries it, is looked up exactly in the database and the map
+# patched, and the whole map is reloaded after BARCODE_CACHE_TTL_SECONDS.
+
+import os
+import re
+import time
+import threading
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import InventoryItem, ProductBarcode
+
+CACHE_TTL_SECONDS = float(os.getenv('BARCODE_CACHE_TTL_SECONDS', 300))
+MAX_CODES_PER_REQUEST = int(os.getenv('BARCODE_RESOLVE_MAX_CODES', 500))
+
+# Item columns whose change can move a code to another item, or out of the map
+_KEY_COLUMNS = {'barcode', 'is_active', 'business_id'}
+_ALL = '*'
+
+
+class BarcodeInUse(ValueError):
+    pass
+
+
+def normalize_code(code):
+    return str(code or '').strip()
+
+
+def parse_barcodes(text):
+    """The distinct codes of a comma-, space- or newline-separated form field, in order."""
+    return list(dict.fromkeys(code for code in re.split(r'[\s,;]+', text or '') if code))
+
+
+# --- Per-business code map ---
+
+class _CodeMap:
+    def __init__(self, codes, aliases):
+        self.codes = codes  # {code: item id}
+        self.aliases = aliases  # The codes that come from product_barcodes
+        self.loaded_at = time.monotonic()
+
+
+_lock = threading.Lock()
+_maps = {}
+_generations = {}  # Bumped by each invalidation, so a load that raced one is not kept
+
+
+def invalidate(business_id=None):
+    """Drops the code map of one business, or of every business."""
+    with _lock:
+        if business_id is None:
+            for key in set(_maps) | set(_generations):
+                _generations[key] = _generations.get(key, 0) + 1
+            _maps.clear()
+        else:
+            _generations[business_id] = _generations.get(business_id, 0) + 1
+            _maps.pop(business_id, None)
+
+
+def _load(business_id):
+    aliases = dict(db.session.query(ProductBarcode.barcode, ProductBarcode.item_id).join(
+        InventoryItem, InventoryItem.id == ProductBarcode.item_id
+    ).filter(
+        ProductBarcode.business_id == business_id,
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_active == True
+    ))
+    primary = dict(db.session.query(InventoryItem.barcode, InventoryItem.id).filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_active == True,
+        InventoryItem.barcode != None,
+        InventoryItem.barcode != ''
+    ))
+    return _CodeMap({**aliases, **primary}, set(aliases) - set(primary))
+
+
+def _code_map(business_id):
+    with _lock:
+        code_map = _maps.get(business_id)
+        if code_map and time.monotonic() - code_map.loaded_at < CACHE_TTL_SECONDS:
+            return code_map
+        generation = _generations.get(business_id, 0)
+    code_map = _load(business_id)
+    with _lock:
+        if _generations.get(business_id, 0) == generation:
+            _maps[business_id] = code_map
+    return code_map
+
+
+def _items_by_id(item_ids):
+    if len(item_ids) == 1:
+        item = db.session.get(InventoryItem, next(iter(item_ids)))
+        return {item.id: item} if item else {}
+    return {item.id: item for item in InventoryItem.query.filter(InventoryItem.id.in_(item_ids))}
+
+
+def _lookup_in_database(business_id, codes):
+    """{code: (item, is_alias)} for the codes that belong to an active item of the business."""
+    found = {}
+    for item in InventoryItem.query.filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_active == True,
+        InventoryItem.barcode.in_(codes)
+    ):
+        found[item.barcode] = (item, False)
+    rest = [code for code in codes if code not in found]
+    if rest:
+        for code, item in db.session.query(ProductBarcode.barcode, InventoryItem).join(
+            InventoryItem, InventoryItem.id == ProductBarcode.item_id
+        ).filter(
+            ProductBarcode.business_id == business_id,
+            ProductBarcode.barcode.in_(rest),
+            InventoryItem.business_id == business_id,
+            InventoryItem.is_active == True
+        ):
+            found[code] = (item, True)
+    return found
+
+
+def find_items(business_id, codes):
+    """{code: InventoryItem} for the scanned codes that match an active item's barcode exactly."""
+    codes = list(dict.fromkeys(code for code in map(normalize_code, codes) if code))
+    if not business_id or not codes:
+        return {}
+    code_map = _code_map(business_id)
+    hits = {code: code_map.codes[code] for code in codes if code in code_map.codes}
+    items = _items_by_id(set(hits.values())) if hits else {}
+
+    found = {}
+    for code, item_id in hits.items():
+        item = items.get(item_id)
+        if (item is not None and item.business_id == business_id and item.is_active
+                and (item.barcode == code or code in code_map.aliases)):
+            found[code] = item
+
+    missing = [code for code in codes if code not in found]
+    if missing:
+        # Written by another process since the map was loaded, or not a barcode at all
+        looked_up = _lookup_in_database(business_id, missing)
+        with _lock:
+            if _maps.get(business_id) is code_map:
+                for code in missing:
+                    code_map.codes.pop(code, None)
+                    code_map.aliases.discard(code)
+                for code, (item, is_alias) in looked_up.items():
+                    code_map.codes[code] = item.id
+                    if is_alias:
+                        code_map.aliases.add(code)
+        found.update((code, item) for code, (item, _) in looked_up.items())
+    return found
+
+
+def find_item(business_id, code):
+    """The active item whose barcode (or one of its extra barcodes) is exactly `code`, or None."""
+    code = normalize_code(code)
+    return find_items(business_id, [code]).get(code)
+
+
+# --- Extra barcodes of an item ---
+
+def barcode_owner(business_id, code, exclude_item_id=None):
+    """The id of the item (active or not) that already carries `code` in the business, or None."""
+    owners = db.session.query(InventoryItem.id).filter(
+        InventoryItem.business_id == business_id, InventoryItem.barcode == code
+    ).union(
+        db.session.query(ProductBarcode.item_id).filter(
+            ProductBarcode.business_id == business_id, ProductBarcode.barcode == code
+        )
+    ).all()
+    return next((owner for (owner,) in owners if owner != exclude_item_id), None)
+
+
+def item_barcodes(item_id):
+    """The extra barcodes of an item, oldest first."""
+    return [code for (code,) in db.session.query(ProductBarcode.barcode).filter(
+        ProductBarcode.item_id == item_id
+    ).order_by(ProductBarcode.created_at, ProductBarcode.barcode)]
+
+
+def set_item_barcodes(item, codes):
+    """
+    Makes `codes` (less the item's own barcode) the item's extra barcodes.
+    Raises BarcodeInUse if another item of the business carries one. Does
+    not commit; the item must have been flushed.
+    """
+    codes = [code for code in dict.fromkeys(map(normalize_code, codes)) if code and code != item.barcode]
+    for code in codes:
+        if barcode_owner(item.business_id, code, exclude_item_id=item.id):
+            raise BarcodeInUse(f"Barcode '{code}' is already in use for another product.")
+    current = {alias.barcode: alias for alias in ProductBarcode.query.filter_by(item_id=item.id)}
+    for code, alias in current.items():
+        if code not in codes:
+            db.session.delete(alias)
+    for code in codes:
+        if code not in current:
+            db.session.add(ProductBarcode(business_id=item.business_id, item_id=item.id, barcode=code))
+
+
+# --- Invalidation ---
+
+def _mark(session, business_id):
+    if session is not None:
+        session.info.setdefault('barcodes_dirty', set()).add(business_id)
+
+
+@event.listens_for(InventoryItem, 'after_insert')
+@event.listens_for(InventoryItem, 'after_delete')
+@event.listens_for(ProductBarcode, 'after_insert')
+@event.listens_for(ProductBarcode, 'after_update')
+@event.listens_for(ProductBarcode, 'after_delete')
+def _code_row_written(mapper, connection, target):
+    _mark(object_session(target), target.business_id)
+
+
+@event.listens_for(InventoryItem, 'after_update')
+def _item_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[column].history.has_changes() for column in _KEY_COLUMNS):
+        for business_id in {target.business_id, *(state.attrs.business_id.history.deleted or ())}:
+            _mark(object_session(target), business_id)
+
+
+def _written_columns(orm_execute_state):
+    values = getattr(orm_execute_state.statement, '_values', None) or {}
+    names = {getattr(key, 'key', key) for key in values}
+    parameters = orm_execute_state.parameters
+    for row in parameters if isinstance(parameters, list) else [parameters or {}]:
+        names.update(row)
+    return names
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_write(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in (InventoryItem, ProductBarcode):
+        return
+    if orm_execute_state.is_select:
+        return
+    if orm_execute_state.is_update and mapper.class_ is InventoryItem:
+        columns = _written_columns(orm_execute_state)
+        if columns and not columns & _KEY_COLUMNS:
+            return  # Stock, prices, buckets: no code moves
+    # A bulk statement cannot name its businesses
+    _mark(orm_execute_state.session, _ALL)
+
+
+def _invalidate_marked(dirty):
+    if _ALL in dirty:
+        invalidate()
+    else:
+        for business_id in dirty:
+            invalidate(business_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    _invalidate_marked(session.info.pop('barcodes_dirty', None) or ())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_rolled_back(session):
+    # A savepoint rollback leaves the outer transaction's writes marked for its commit
+    _invalidate_marked(set(session.info.get('barcodes_dirty', ())))
@@ -0,0 +1,131 @@
+# bench_inventory_serializers.py
+# Micro-benchmark: serializing an inventory list the old way (load full ORM
+# objects, build each dict from attributes, encode with Flask's JSON provider)
+# against inventory_serializers (project the view's columns, build dicts from
+# tuples, encode with dumps()). Runs on an in-memory SQLite database.
+#
+#   python bench_inventory_serializers.py [--items 10000] [--repeat 5]
+
+import argparse
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import insert
+
+from extensions import db
+from models import Business, InventoryItem
+import inventory_serializers
+from inventory_serializers import dumps, scanner_view, sync_view
+
+
+# The serializers inventory_serializers replaced, as they were
+def legacy_scanner(product):
+    return {
+        'id': str(product.id),
+        'product_name': product.product_name,
+        'current_stock': float(product.current_stock or 0.0),
+        'is_fixed_price': product.is_fixed_price,
+        'barcode': product.barcode,
+        'number_of_tabs': float(product.number_of_tabs or 1.0),
+        'unit_price_per_tab': float(product.unit_price_per_tab or 0.0),
+        'item_type': product.item_type,
+        'expiry_date': product.expiry_date.strftime('%Y-%m-%d') if product.expiry_date else None,
+        'batch_number': product.batch_number,
+        'purchase_price': float(product.purchase_price or 0.0),
+        'sale_price': float(product.sale_price or 0.0),
+        'fixed_sale_price': float(product.fixed_sale_price or 0.0),
+        'markup_percentage_pharmacy': float(product.markup_percentage_pharmacy or 0.0),
+    }
+
+
+def legacy_sync(item):
+    return {
+        'id': str(item.id),
+        'business_id': str(item.business_id),
+        'product_name': str(item.product_name),
+        'category': str(item.category),
+        'purchase_price': float(item.purchase_price),
+        'sale_price': float(item.sale_price),
+        'current_stock': float(item.current_stock),
+        'last_updated': item.last_updated.isoformat() if item.last_updated else None,
+        'batch_number': str(item.batch_number) if item.batch_number else None,
+        'number_of_tabs': int(item.number_of_tabs),
+        'unit_price_per_tab': float(item.unit_price_per_tab),
+        'item_type': str(item.item_type),
+        'expiry_date': item.expiry_date.isoformat() if item.expiry_date else None,
+        'is_fixed_price': bool(item.is_fixed_price),
+        'fixed_sale_price': float(item.fixed_sale_price),
+        'is_active': bool(item.is_active),
+    }
+
+
+def _seed(business_id, count):
+    today = date.today()
+    db.session.execute(insert(InventoryItem), [{
+        'id': str(uuid.uuid4()),
+        'business_id': business_id,
+        'product_name': f'Product {n:06d}',
+        'category': f'Category {n % 40}',
+        'purchase_price': 10.0 + n % 100,
+        'sale_price': 12.5 + n % 100,
+        'current_stock': float(n % 250),
+        'last_updated': datetime.now(),
+        'batch_number': f'B{n % 997}',
+        'number_of_tabs': 1 + n % 10,
+        'unit_price_per_tab': 1.25,
+        'item_type': 'Pharmacy',
+        'expiry_date': today + timedelta(days=n % 720),
+        'is_fixed_price': n % 7 == 0,
+        'fixed_sale_price': 0.0,
+        'is_active': True,
+        'barcode': f'{600000000000 + n}',
+        'markup_percentage_pharmacy': 20.0,
+    } for n in range(count)])
+    db.session.commit()
+
+
+def _best(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        db.session.remove()  # Each run starts with an empty identity map, as a request does
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the inventory JSON serializers.')
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        business = Business(name='Benchmark', type='Pharmacy')
+        db.session.add(business)
+        db.session.commit()
+        business_id = business.id
+        _seed(business_id, args.items)
+
+        def query():
+            return InventoryItem.query.filter_by(business_id=business_id, is_active=True)
+
+        per_10k = 10000 / args.items
+        encoder = 'orjson' if inventory_serializers.orjson is not None else 'json (orjson not installed)'
+        print(f"{args.items} items, best of {args.repeat}, ms per 10k items; encoder: {encoder}")
+        print(f"{'view':<10}{'before':>10}{'after':>10}{'speedup':>10}")
+        for name, legacy, view in (('scanner', legacy_scanner, scanner_view), ('sync', legacy_sync, sync_view)):
+            before = _best(args.repeat, lambda: app.json.dumps([legacy(item) for item in query().all()]))
+            after = _best(args.repeat, lambda: dumps(view.rows(query())))
+            print(f"{name:<10}{before * 1000 * per_10k:>10.1f}{after * 1000 * per_10k:>10.1f}{before / after:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
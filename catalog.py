@@ -0,0 +1,125 @@
+# catalog.py
+# Versioned product catalog for the POS screen (/api/v1/catalog).
+#
+# The first request returns every active item plus a version token; later
+# requests send the token back and receive only the items written since
+# (InventoryItem.last_updated, bumped on every ORM or Core UPDATE by its
+# onupdate) and the ids to drop: items deactivated since, and items deleted
+# since, which leave a row in catalog_tombstones. A bulk delete of inventory
+# cannot name its rows, so it leaves a reset tombstone that sends every older
+# token back to a full reload, as does a token older than the tombstone
+# retention window.
+
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, insert, or_
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import CatalogTombstone, InventoryItem
+from inventory_serializers import sale_form_view
+
+TOKEN_FORMAT = '%Y%m%dT%H%M%S.%f'
+# Tokens are issued this far in the past, so a write stamped just before a
+# read but committed just after it is sent again rather than missed.
+TOKEN_OVERLAP = timedelta(seconds=int(os.getenv('CATALOG_TOKEN_OVERLAP_SECONDS', 120)))
+TOMBSTONE_RETENTION = timedelta(days=int(os.getenv('CATALOG_TOMBSTONE_DAYS', 30)))
+
+
+def encode_token(moment):
+    return moment.strftime(TOKEN_FORMAT)
+
+
+def decode_token(token):
+    """The datetime a token stands for, or None if it is missing or malformed."""
+    try:
+        return datetime.strptime(token, TOKEN_FORMAT) if token else None
+    except ValueError:
+        return None
+
+
+def _needs_full_reload(business_id, since, now):
+    if since is None or since < now - TOMBSTONE_RETENTION:
+        return True
+    return db.session.query(CatalogTombstone.id).filter(
+        or_(CatalogTombstone.business_id == business_id, CatalogTombstone.business_id == None),
+        CatalogTombstone.item_id == None,
+        CatalogTombstone.removed_at >= since
+    ).first() is not None
+
+
+def catalog_changes(business_id, token=None, now=None):
+    """
+    {'full', 'version', 'items', 'removed'} for the POS catalog. With a valid
+    token, `items` holds only active items written since and `removed` the ids
+    to drop; otherwise `full` is True and `items` is the whole active catalog.
+    """
+    now = now or datetime.now()
+    since = decode_token(token)
+    full = _needs_full_reload(business_id, since, now)
+
+    query = InventoryItem.query.filter(InventoryItem.business_id == business_id)
+    if full:
+        serialized = sale_form_view.rows(
+            query.filter(InventoryItem.is_active == True).order_by(InventoryItem.product_name)
+        )
+        removed = []
+    else:
+        changed = query.filter(InventoryItem.last_updated >= since).all()
+        serialized = [sale_form_view.item(item) for item in changed if item.is_active]
+        removed = [item.id for item in changed if not item.is_active]
+        removed += [item_id for (item_id,) in db.session.query(CatalogTombstone.item_id).filter(
+            CatalogTombstone.business_id == business_id,
+            CatalogTombstone.item_id != None,
+            CatalogTombstone.removed_at >= since
+        )]
+
+    return {
+        'full': full,
+        'version': encode_token(now - TOKEN_OVERLAP),
+        'items': serialized,
+        'removed': sorted(set(removed)),
+    }
+
+
+# --- Tombstones ---
+
+@event.listens_for(InventoryItem, 'after_delete')
+def _record_deleted_item(mapper, connection, target):
+    connection.execute(insert(CatalogTombstone.__table__).values(
+        id=str(uuid.uuid4()),
+        business_id=target.business_id,
+        item_id=target.id,
+        removed_at=datetime.now()
+    ))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_bulk_inventory_delete(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    if not orm_execute_state.is_delete or mapper is None or mapper.class_ is not InventoryItem:
+        return
+    orm_execute_state.session.add(CatalogTombstone(business_id=None, item_id=None, removed_at=datetime.now()))
+
+
+def prune_tombstones(now=None):
+    """Deletes tombstones older than the retention window (their tokens reload fully anyway). Does not commit."""
+    cutoff = (now or datetime.now()) - TOMBSTONE_RETENTION
+    return CatalogTombstone.query.filter(CatalogTombstone.removed_at < cutoff).delete(synchronize_session=False)
+
+
+# --- CLI: `flask catalog prune-tombstones` ---
+
+catalog_cli = AppGroup('catalog', help='Maintain the POS catalog change log.')
+
+
+@catalog_cli.command('prune-tombstones')
+def prune_tombstones_command():
+    """Delete catalog tombstones older than CATALOG_TOMBSTONE_DAYS."""
+    pruned = prune_tombstones()
+    db.session.commit()
+    click.echo(f"Deleted {pruned} catalog tombstones.")
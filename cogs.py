@@ -0,0 +1,129 @@
+# cogs.py
+# Cost of goods sold over a date range, computed in bulk.
+#
+# New sales carry `cost_at_time_per_unit_sold` on every line of items_sold_json
+# (the purchase cost when the sale was made). Legacy lines without it are
+# costed from the current inventory, resolved with one IN query per chunk.
+
+import json
+import logging
+
+from sqlalchemy import or_, select
+
+from extensions import db
+from models import SalesRecord, InventoryItem
+
+logger = logging.getLogger(__name__)
+
+COGS_CHUNK_SIZE = 1000
+COST_KEY = 'cost_at_time_per_unit_sold'
+
+
+def unit_cost_for(purchase_price, number_of_tabs, sale_unit_type):
+    """
+    Purchase cost of one sold unit. purchase_price is per pack, so tab/piece
+    sales are costed per base unit, matching how add_sale converts stock.
+    """
+    purchase_price = float(purchase_price or 0.0)
+    if sale_unit_type in ('tab', 'piece'):
+        tabs = float(number_of_tabs or 1)
+        return purchase_price / tabs if tabs > 0 else 0.0
+    return purchase_price
+
+
+def unit_cost_for_item(item, sale_unit_type):
+    return unit_cost_for(item.purchase_price, item.number_of_tabs, sale_unit_type)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _line_quantity(line):
+    return _float(line.get('quantity_sold')) or 0.0
+
+
+def _resolve_legacy_costs(business_id, lines):
+    """Costs lines lacking a snapshot from current inventory with a single query."""
+    product_ids = {line.get('product_id') for line in lines if line.get('product_id')}
+    product_names = {line.get('product_name') for line in lines if not line.get('product_id') and line.get('product_name')}
+    if not product_ids and not product_names:
+        return 0.0, len(lines)
+
+    conditions = []
+    if product_ids:
+        conditions.append(InventoryItem.id.in_(product_ids))
+    if product_names:
+        conditions.append(InventoryItem.product_name.in_(product_names))
+    products = db.session.query(
+        InventoryItem.id, InventoryItem.product_name, InventoryItem.purchase_price, InventoryItem.number_of_tabs
+    ).filter(InventoryItem.business_id == business_id, or_(*conditions)).all()
+    by_id = {product.id: product for product in products}
+    by_name = {product.product_name: product for product in products}
+
+    cost = 0.0
+    uncosted = 0
+    for line in lines:
+        product = by_id.get(line.get('product_id')) or by_name.get(line.get('product_name'))
+        if not product:
+            uncosted += 1
+            continue
+        unit_cost = unit_cost_for(product.purchase_price, product.number_of_tabs, line.get('sale_unit_type'))
+        cost += unit_cost * _line_quantity(line)
+    return cost, uncosted
+
+
+def compute_cogs(business_id, start, end, chunk_size=COGS_CHUNK_SIZE):
+    """
+    Revenue, cost of goods sold and gross profit for sales in [start, end).
+
+    Sales are streamed in chunks of `chunk_size`; per chunk, lines without a
+    cost snapshot are resolved against inventory with one IN query.
+    """
+    result = {
+        'revenue': 0.0,
+        'cost_of_goods_sold': 0.0,
+        'gross_profit': 0.0,
+        'sales_count': 0,
+        'lines_costed_at_sale': 0,
+        'lines_costed_from_inventory': 0,
+        'lines_uncosted': 0,
+    }
+
+    statement = select(SalesRecord.grand_total_amount, SalesRecord.items_sold_json).where(
+        SalesRecord.business_id == business_id,
+        SalesRecord.transaction_date >= start,
+        SalesRecord.transaction_date < end
+    ).execution_options(yield_per=chunk_size)
+
+    for chunk in db.session.execute(statement).partitions():
+        legacy_lines = []
+        for grand_total, items_json in chunk:
+            result['sales_count'] += 1
+            result['revenue'] += float(grand_total or 0.0)
+            try:
+                lines = json.loads(items_json or '[]')
+            except (TypeError, ValueError):
+                logger.warning("Skipping unparseable items_sold_json while computing COGS.")
+                continue
+            for line in lines:
+                if not isinstance(line, dict):
+                    continue
+                unit_cost = _float(line.get(COST_KEY))
+                if unit_cost is None:
+                    legacy_lines.append(line)
+                    continue
+                result['cost_of_goods_sold'] += unit_cost * _line_quantity(line)
+                result['lines_costed_at_sale'] += 1
+
+        if legacy_lines:
+            legacy_cost, uncosted = _resolve_legacy_costs(business_id, legacy_lines)
+            result['cost_of_goods_sold'] += legacy_cost
+            result['lines_costed_from_inventory'] += len(legacy_lines) - uncosted
+            result['lines_uncosted'] += uncosted
+
+    result['gross_profit'] = result['revenue'] - result['cost_of_goods_sold']
+    return result
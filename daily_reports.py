@@ -0,0 +1,347 @@
+# daily_reports.py
+# End-of-day sales report for every active business.
+#
+# At each business's closing time (Business.closing_time, 'HH:MM', falling
+# back to DAILY_REPORT_CLOSING_TIME) the scheduler builds the day's report,
+# stores it in daily_reports and queues the summary SMS to the business
+# contact (ADMIN_PHONE_NUMBER when it has none). Businesses are reported
+# DAILY_REPORT_WORKERS at a time. A scheduler thread runs in each app process
+# (started on the first request) or on its own with `flask daily-reports run`;
+# several processes may race for the same business, which only costs a
+# rebuild: the stored row is upserted and the SMS is queued once per
+# business and day (sms_outbox dedupe key).
+#
+# print_daily_sales_report renders the stored report when there is one. Any
+# sale or return written for that day afterwards deletes it (see
+# sales_rollups._bump), and the next scheduler pass rebuilds it without
+# sending the SMS again.
+
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Business, DailyReport, SalesRecord
+from product_resolver import ProductResolver
+from sales_lines import product_quantity_summary
+from sales_rollups import day_bounds, rollup_revenue
+from sms_outbox import enqueue_sms
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLOSING_TIME = os.getenv('DAILY_REPORT_CLOSING_TIME', '21:00')
+WORKERS = int(os.getenv('DAILY_REPORT_WORKERS', 4))
+POLL_SECONDS = float(os.getenv('DAILY_REPORT_POLL_SECONDS', 60))
+ADMIN_PHONE_NUMBER = os.getenv('ADMIN_PHONE_NUMBER', '')
+SALES_CHUNK_SIZE = 500  # Sales streamed per batch while building a report
+
+
+def parse_closing_time(value):
+    """A datetime.time for 'HH:MM', or None if it is empty or malformed."""
+    try:
+        return datetime.strptime(value.strip(), '%H:%M').time() if value and value.strip() else None
+    except ValueError:
+        return None
+
+
+def closing_time_for(business_closing_time):
+    return parse_closing_time(business_closing_time) or parse_closing_time(DEFAULT_CLOSING_TIME) or time(21, 0)
+
+
+# --- Building the report ---
+
+def _amount(value):
+    return float(str(value).replace(',', '').replace('GH₵', '').replace('GHS', '').replace('₵', ''))
+
+
+def parse_sales_item_data(item_dict, resolver=None):
+    """
+    Robust parsing of sales item data with extensive fallback logic.
+    Lines without any price are priced from inventory through `resolver`
+    (a ProductResolver; pass one per report when parsing many lines).
+    """
+    if not isinstance(item_dict, dict):
+        return {
+            'name': 'Unknown Product',
+            'quantity': 1.0,
+            'unitType': 'piece',
+            'unitPrice': 0.0,
+            'totalPrice': 0.0
+        }
+
+    product_name = (
+        item_dict.get('product_name') or
+        item_dict.get('name') or
+        item_dict.get('productName') or
+        item_dict.get('item_name') or
+        'Unknown Product'
+    )
+
+    quantity_raw = (
+        item_dict.get('quantity_sold') or
+        item_dict.get('quantity') or
+        item_dict.get('qty') or
+        1
+    )
+    try:
+        quantity = float(str(quantity_raw).replace(',', ''))
+        if quantity <= 0:
+            quantity = 1.0
+    except (ValueError, TypeError, AttributeError):
+        quantity = 1.0
+
+    unit_type = (
+        item_dict.get('sale_unit_type') or
+        item_dict.get('unitType') or
+        item_dict.get('unit_type') or
+        item_dict.get('unit') or
+        'piece'
+    )
+
+    unit_price = 0.0
+    for price_value in (item_dict.get('price_at_time_per_unit_sold'), item_dict.get('unitPrice'),
+                        item_dict.get('unit_price'), item_dict.get('price'), item_dict.get('sale_price')):
+        if price_value is not None:
+            try:
+                unit_price = _amount(price_value)
+                if unit_price > 0:
+                    break
+            except (ValueError, TypeError, AttributeError):
+                continue
+
+    total_price = 0.0
+    for total_value in (item_dict.get('item_total_amount'), item_dict.get('totalPrice'),
+                        item_dict.get('total_price'), item_dict.get('total'), item_dict.get('amount')):
+        if total_value is not None:
+            try:
+                total_price = _amount(total_value)
+                if total_price > 0:
+                    break
+            except (ValueError, TypeError, AttributeError):
+                continue
+
+    # Calculate missing values
+    if unit_price == 0.0 and total_price > 0.0 and quantity > 0.0:
+        unit_price = total_price / quantity
+    elif total_price == 0.0 and unit_price > 0.0:
+        total_price = unit_price * quantity
+
+    # FALLBACK: price from inventory if both prices are still 0
+    product_id = item_dict.get('product_id')
+    if unit_price == 0.0 and total_price == 0.0 and resolver and (product_id or product_name != 'Unknown Product'):
+        try:
+            unit_price = resolver.sale_price(product_id, product_name)
+            total_price = unit_price * quantity
+        except Exception:
+            pass  # Silent fallback failure
+
+    return {
+        'name': str(product_name).strip(),
+        'quantity': quantity,
+        'unitType': str(unit_type).strip(),
+        'unitPrice': round(unit_price, 2),
+        'totalPrice': round(total_price, 2)
+    }
+
+
+def build_daily_report(business_id, day):
+    """
+    The print_daily_sales_report context for one business and day:
+    {total_sales_amount, total_items_sold, product_sales_summary,
+    sales_details, total_transactions}. Plain JSON types only.
+    """
+    start, end = day_bounds(day, day)
+    product_sales_summary, total_items_sold = product_quantity_summary(business_id, start, end)
+    resolver = ProductResolver(business_id)
+    sales = SalesRecord.query.filter(
+        SalesRecord.business_id == business_id,
+        SalesRecord.transaction_date >= start,
+        SalesRecord.transaction_date < end
+    ).order_by(SalesRecord.transaction_date).yield_per(SALES_CHUNK_SIZE)
+
+    sales_details = []
+    for sale in sales:
+        sales_details.append({
+            'receipt_number': sale.receipt_number or sale.id[:8],
+            'customer_phone': sale.customer_phone or 'N/A',
+            'sales_person': sale.sales_person_name,
+            'transaction_time': sale.transaction_date.strftime('%H:%M'),
+            'grand_total': float(sale.grand_total_amount or 0.0),
+            'products': [parse_sales_item_data(item, resolver) for item in sale.get_items_sold()],
+        })
+    return {
+        'total_sales_amount': rollup_revenue(business_id, day, day),
+        'total_items_sold': total_items_sold,
+        'product_sales_summary': product_sales_summary,
+        'sales_details': sales_details,
+        'total_transactions': len(sales_details),
+    }
+
+
+def daily_report_sms(report, day, business_name):
+    """The daily summary SMS text."""
+    message = f"Daily Sales Report ({day.strftime('%Y-%m-%d')}):\n"
+    message += f"Total Revenue: GH₵{report['total_sales_amount']:.2f}\n"
+    message += f"Total Items Sold (approx): {report['total_items_sold']:.2f}\n"
+
+    if report['product_sales_summary']:
+        message += "Product Breakdown:\n"
+        for product_key, qty in report['product_sales_summary'].items():
+            message += f"- {product_key}: {qty:.2f} units\n"
+    else:
+        message += "No sales recorded today."
+
+    message += "\nThank you for trading with us\n"
+    message += f"From: {business_name}"
+    return message
+
+
+# --- Stored reports ---
+
+def stored_daily_report(business_id, day):
+    """The report the scheduler stored for this business and day, or None."""
+    row = DailyReport.query.filter_by(business_id=business_id, day=day).first()
+    return json.loads(row.report_json) if row else None
+
+
+def store_daily_report(business_id, day, report):
+    """Inserts or replaces the stored report. Does not commit."""
+    values = {'report_json': json.dumps(report), 'generated_at': datetime.now()}
+    key_filter = (DailyReport.business_id == business_id, DailyReport.day == day)
+    if DailyReport.query.filter(*key_filter).update(values, synchronize_session=False):
+        return
+    try:
+        # Another process may store the same report concurrently.
+        with db.session.begin_nested():
+            db.session.add(DailyReport(business_id=business_id, day=day, **values))
+    except IntegrityError:
+        DailyReport.query.filter(*key_filter).update(values, synchronize_session=False)
+
+
+def invalidate_daily_report(business_id, day):
+    """Drops the stored report of `day`, e.g. after a late sale or a return."""
+    return DailyReport.query.filter(
+        DailyReport.business_id == business_id,
+        DailyReport.day == day
+    ).delete(synchronize_session=False)
+
+
+# --- Scheduling ---
+
+def due_businesses(now=None):
+    """Active businesses past their closing time today without a stored report: [(id, name, contact)]."""
+    now = now or datetime.now()
+    reported = {business_id for (business_id,) in
+                db.session.query(DailyReport.business_id).filter(DailyReport.day == now.date())}
+    businesses = db.session.query(Business.id, Business.name, Business.contact, Business.closing_time).filter(
+        Business.is_active == True
+    ).order_by(Business.name).all()
+    return [(business.id, business.name, business.contact) for business in businesses
+            if business.id not in reported and now.time() >= closing_time_for(business.closing_time)]
+
+
+def run_for_business(app, business_id, business_name, contact, day, send_sms=True):
+    """Builds, stores and (optionally) texts one business's report. Returns (business_id, error or None)."""
+    with app.app_context():
+        try:
+            report = build_daily_report(business_id, day)
+            store_daily_report(business_id, day, report)
+            db.session.commit()
+            phone = contact or ADMIN_PHONE_NUMBER
+            if send_sms and phone:
+                enqueue_sms(business_id, phone, daily_report_sms(report, day, business_name), 'daily_report',
+                            dedupe_key=f"daily_report:eod:{business_id}:{day.isoformat()}")
+            elif send_sms:
+                logger.warning(f"No contact phone for business {business_id}; daily report stored but not texted.")
+            return business_id, None
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Daily report for business {business_id} on {day} failed: {e}")
+            return business_id, str(e)
+
+
+def run_due_reports(app, now=None, send_sms=True, workers=WORKERS):
+    """Runs the reports that are due, `workers` businesses at a time. Returns [(business_id, error or None)]."""
+    now = now or datetime.now()
+    with app.app_context():
+        due = due_businesses(now)
+    if not due:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='daily-report') as executor:
+        futures = [executor.submit(run_for_business, app, business_id, name, contact, now.date(), send_sms)
+                   for business_id, name, contact in due]
+        return [future.result() for future in futures]
+
+
+def run_forever(app, stop=None, send_sms=True):
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            run_due_reports(app, send_sms=send_sms)
+        except Exception as e:
+            logger.exception(f"Daily report scheduler error: {e}")
+        stop.wait(POLL_SECONDS)
+
+
+_scheduler_lock = threading.Lock()
+_scheduler_thread = None
+
+
+def start_scheduler(app):
+    """Starts this process's scheduler thread once."""
+    global _scheduler_thread
+    with _scheduler_lock:
+        if _scheduler_thread is None or not _scheduler_thread.is_alive():
+            _scheduler_thread = threading.Thread(target=run_forever, args=(app,), name='daily-reports', daemon=True)
+            _scheduler_thread.start()
+
+
+def init_app(app):
+    """Starts the in-process scheduler on the first request (DAILY_REPORT_SCHEDULER_IN_PROCESS=false leaves it to cron or `flask daily-reports run`)."""
+    if os.getenv('DAILY_REPORT_SCHEDULER_IN_PROCESS', 'true').lower() != 'true' or app.testing:
+        return
+
+    @app.before_request
+    def _ensure_daily_report_scheduler():
+        if _scheduler_thread is None:
+            start_scheduler(app)
+
+
+# --- CLI: `flask daily-reports run` ---
+
+daily_reports_cli = AppGroup('daily-reports', help='Build and send end-of-day sales reports.')
+
+
+@daily_reports_cli.command('run')
+@click.option('--once', is_flag=True, help='Run the reports due now and exit (for cron).')
+@click.option('--business-id', default=None, help='Build this business\'s report now, whatever its closing time.')
+@click.option('--day', default=None, help='Day to report with --business-id (YYYY-MM-DD, default today).')
+@click.option('--no-sms', is_flag=True, help='Store the reports without queueing the SMS.')
+def run_command(once, business_id, day, no_sms):
+    """Run the end-of-day report scheduler."""
+    from flask import current_app
+    app = current_app._get_current_object()
+    if business_id:
+        business = db.session.get(Business, business_id)
+        if not business:
+            raise click.BadParameter(f"No business {business_id}.", param_hint='--business-id')
+        report_day = datetime.strptime(day, '%Y-%m-%d').date() if day else datetime.now().date()
+        _, error = run_for_business(app, business.id, business.name, business.contact, report_day, not no_sms)
+        click.echo(f"Failed: {error}" if error else f"Stored the {report_day} report for {business.name}.")
+        return
+    if once:
+        results = run_due_reports(app, send_sms=not no_sms)
+        failed = [business_id for business_id, error in results if error]
+        click.echo(f"Ran {len(results)} daily reports ({len(failed)} failed).")
+        if failed:
+            raise SystemExit(1)
+        return
+    click.echo("Running the end-of-day report scheduler; press Ctrl+C to stop.")
+    run_forever(app, send_sms=not no_sms)
@@ -0,0 +1,298 @@
+# dashboard_metrics.py
+# Dashboard widgets and a per-business, in-process metrics cache.
+#
+# Every widget returns JSON-ready dicts (never ORM objects) so it can be served
+# by /api/v1/dashboard/widgets/<name> and kept across requests. The dashboard
+# page loads each widget separately. Cache entries are invalidated by a
+# per-business version counter that is bumped whenever a committed
+# transaction touched inventory, sales, returns, customers or rentals
+# (through the ORM or a bulk UPDATE/DELETE), and they expire after a short TTL
+# so other gunicorn workers converge too.
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import InventoryItem, SalesRecord, ReturnRecord, Customer, RentalRecord, Debtor
+from stock_valuation import compute_stock_valuation
+from sales_rollups import rollup_revenue, rollup_sales_by_person
+from sales_timeseries import sales_timeseries, serialize_timeseries
+from low_stock import low_stock_query, low_stock_row
+from expiry_buckets import EXPIRED, EXPIRING_SOON_BUCKETS, EXPIRY_SOON_DAYS, ensure_expiry_buckets_current, items_in_buckets
+
+RECENT_ACTIVITY_LIMIT = 5
+SALES_SERIES_DAYS = 30
+
+
+# --- Widgets ---
+
+def stock_metrics(business_id):
+    valuation = compute_stock_valuation(business_id)
+    return {
+        'total_inventory_items': valuation['total_items'],
+        'current_stock_value_at_cost': valuation['cost_value'],
+        'current_stock_value_at_sale': valuation['sale_value'],
+        'total_potential_gross_profit_stock': valuation['potential_gross_profit'],
+        'overall_stock_profit_margin': valuation['profit_margin'],
+    }
+
+
+def sales_metrics(business_id, today=None):
+    today = today or date.today()
+    return {
+        'total_sales_overall': rollup_revenue(business_id),
+        'total_sales_today': rollup_revenue(business_id, today, today),
+        'total_sales_last_7_days': rollup_revenue(business_id, today - timedelta(days=6), today),
+        'sales_by_person_today': [
+            {'sales_person_name': name, 'amount': float(amount or 0.0)}
+            for name, amount in rollup_sales_by_person(business_id, today, today)
+        ],
+    }
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _inventory_row(item):
+    return {
+        'id': item.id,
+        'product_name': item.product_name,
+        'current_stock': item.current_stock or 0.0,
+        'expiry_date': _iso(item.expiry_date),
+    }
+
+
+def low_stock_items(business_id):
+    """The maintained low-stock set (items at or below their reorder point)."""
+    return [low_stock_row(item) for item in low_stock_query(business_id)]
+
+
+def expiry_items(business_id):
+    """(expired_items, expiring_soon_items) for active items, read from the stored expiry buckets."""
+    ensure_expiry_buckets_current(business_id)
+    items = items_in_buckets(business_id, (EXPIRED,) + EXPIRING_SOON_BUCKETS).all()
+    expired = [_inventory_row(item) for item in items if item.expiry_bucket == EXPIRED]
+    expiring_soon = [_inventory_row(item) for item in items if item.expiry_bucket != EXPIRED]
+    return expired, expiring_soon
+
+
+def overdue_rentals(business_id, today=None):
+    today = today or date.today()
+    rentals = RentalRecord.query.filter(
+        RentalRecord.business_id == business_id,
+        RentalRecord.return_date == None,
+        RentalRecord.due_date < today
+    ).order_by(RentalRecord.due_date).all()
+    return [
+        {'id': rental.id, 'customer_name': rental.customer_name, 'item_name': rental.item_name_at_rent, 'due_date': _iso(rental.due_date)}
+        for rental in rentals
+    ]
+
+
+def recent_activity(business_id, limit=RECENT_ACTIVITY_LIMIT):
+    sales = db.session.query(
+        SalesRecord.sales_person_name, SalesRecord.grand_total_amount, SalesRecord.transaction_date
+    ).filter(SalesRecord.business_id == business_id).order_by(SalesRecord.transaction_date.desc()).limit(limit).all()
+    return [
+        {'sales_person_name': name, 'grand_total_amount': total or 0.0, 'transaction_date': _iso(transaction_date)}
+        for name, total, transaction_date in sales
+    ]
+
+
+def total_customers(business_id):
+    return Customer.query.filter_by(business_id=business_id, is_active=True).count() or 0
+
+
+def outstanding_debt(business_id):
+    return float(db.session.query(func.sum(Debtor.amount_due)).filter(
+        Debtor.business_id == business_id,
+        Debtor.status != 'Paid'
+    ).scalar() or 0.0)
+
+
+def sales_series(business_id, days=SALES_SERIES_DAYS, today=None):
+    """Daily sales for the last `days` days, today included."""
+    today = today or date.today()
+    series = sales_timeseries(business_id, today - timedelta(days=days - 1), today + timedelta(days=1), 'day')
+    return serialize_timeseries(series, 'day')
+
+
+# --- JSON widget payloads (/api/v1/dashboard/widgets/<name>) ---
+
+def kpis_widget(business_id, business_type):
+    data = {
+        'total_customers': total_customers(business_id),
+        'total_outstanding_debt': outstanding_debt(business_id),
+    }
+    data.update(stock_metrics(business_id))
+    data.update(sales_metrics(business_id))
+    data['total_products'] = data['total_inventory_items']
+    return data
+
+
+def sales_series_widget(business_id, business_type):
+    series = sales_series(business_id)
+    return {'days': SALES_SERIES_DAYS, 'total_amount': sum(point['amount'] for point in series), 'series': series}
+
+
+def low_stock_widget(business_id, business_type):
+    return {'items': low_stock_items(business_id)}
+
+
+def expiry_widget(business_id, business_type):
+    if business_type != 'Pharmacy':
+        return {'applicable': False, 'days': EXPIRY_SOON_DAYS, 'expired': [], 'expiring_soon': []}
+    expired, expiring_soon = expiry_items(business_id)
+    return {'applicable': True, 'days': EXPIRY_SOON_DAYS, 'expired': expired, 'expiring_soon': expiring_soon}
+
+
+def overdue_rentals_widget(business_id, business_type):
+    if business_type != 'Hardware':
+        return {'applicable': False, 'rentals': []}
+    return {'applicable': True, 'rentals': overdue_rentals(business_id)}
+
+
+def recent_activity_widget(business_id, business_type):
+    return {'sales': recent_activity(business_id)}
+
+
+DASHBOARD_WIDGETS = {
+    'kpis': kpis_widget,
+    'sales_series': sales_series_widget,
+    'low_stock': low_stock_widget,
+    'expiry': expiry_widget,
+    'overdue_rentals': overdue_rentals_widget,
+    'recent_activity': recent_activity_widget,
+}
+
+
+# --- Cache ---
+
+class DashboardMetricsCache:
+    """Per-business, per-widget metrics with version-counter invalidation and a TTL."""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}   # (business_id, widget) -> (version, computed_at, metrics)
+        self._versions = {}  # business_id -> int
+        self._generation = 0  # Bumped for every business at once
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def version(self, business_id):
+        return self._generation + self._versions.get(business_id, 0)  # Only ever grows
+
+    def bump(self, business_id):
+        with self._lock:
+            self._versions[business_id] = self._versions.get(business_id, 0) + 1
+            self.invalidations += 1
+
+    def bump_all(self):
+        """Invalidates every business, for writes that cannot name theirs."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+
+    def get_or_compute(self, business_id, widget, compute, force_refresh=False):
+        """Returns (metrics, cache_hit)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((business_id, widget))
+            if (not force_refresh and entry
+                    and entry[0] == self.version(business_id)
+                    and now - entry[1] < self.ttl_seconds):
+                self.hits += 1
+                return entry[2], True
+            self.misses += 1
+            version = self.version(business_id)
+
+        metrics = compute()
+        with self._lock:
+            # A write that landed while computing leaves the entry stale on purpose.
+            self._entries[(business_id, widget)] = (version, now, metrics)
+        return metrics, False
+
+    def age_seconds(self, business_id, widget):
+        entry = self._entries.get((business_id, widget))
+        return time.monotonic() - entry[1] if entry else None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'entries': len(self._entries),
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+
+dashboard_cache = DashboardMetricsCache(ttl_seconds=int(os.getenv('DASHBOARD_CACHE_TTL', '60')))
+
+_TRACKED_MODELS = (InventoryItem, SalesRecord, ReturnRecord, Customer, RentalRecord)
+_ALL = '*'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_dashboard_writes(session, flush_context):
+    touched = session.info.setdefault('dashboard_business_ids', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, _TRACKED_MODELS) and getattr(instance, 'business_id', None):
+            touched.add(instance.business_id)
+
+
+def _statement_business_id(statement, model):
+    """The business a bulk UPDATE/DELETE is restricted to by a top-level `business_id == value`, else None."""
+    where = statement.whereclause
+    if where is None:
+        return None
+    conditions = where.clauses if isinstance(where, BooleanClauseList) and where.operator is operators.and_ else [where]
+    for condition in conditions:
+        if (isinstance(condition, BinaryExpression) and condition.operator is operators.eq
+                and isinstance(condition.right, BindParameter)
+                and getattr(condition.left, 'table', None) is model.__table__
+                and condition.left.key == 'business_id'):
+            return condition.right.effective_value
+    return None
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_dashboard_writes(orm_execute_state):
+    # Bulk statements (stock checkout and restock, low-stock rebuilds) skip the flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, _TRACKED_MODELS):
+        return
+    touched = orm_execute_state.session.info.setdefault('dashboard_business_ids', set())
+    touched.add(_statement_business_id(orm_execute_state.statement, mapper.class_) or _ALL)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_dashboard_versions(session):
+    if session.in_nested_transaction():
+        return  # A released savepoint: nothing is visible to other sessions yet
+    business_ids = session.info.pop('dashboard_business_ids', ())
+    if _ALL in business_ids:
+        dashboard_cache.bump_all()
+        return
+    for business_id in business_ids:
+        dashboard_cache.bump(business_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_writes(session):
+    if session.in_nested_transaction():
+        return  # A savepoint: the outer transaction may still commit what it flushed
+    session.info.pop('dashboard_business_ids', None)
@@ -0,0 +1,214 @@
+# expiry_buckets.py
+# Precomputed expiry buckets for inventory items (inventory_items.expiry_bucket).
+#
+# The bucket is set on every insert/update of an InventoryItem by a mapper hook.
+# Buckets also move as days pass without any write, so refresh_expiry_buckets()
+# shifts them with one bulk UPDATE: nightly via `flask expiry-buckets refresh`,
+# and lazily on the first read of the day in each process. Pages read the
+# stored bucket instead of re-deriving it from expiry_date.
+
+import os
+import logging
+import threading
+from datetime import date, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, event, func, literal, update
+
+from extensions import db
+from models import InventoryItem
+
+logger = logging.getLogger(__name__)
+
+EXPIRED = 'expired'
+CRITICAL = 'critical'  # Expires within EXPIRY_CRITICAL_DAYS
+SOON = 'soon'          # Expires within EXPIRY_SOON_DAYS
+WATCH = 'watch'        # Expires within EXPIRY_WATCH_DAYS
+OK = 'ok'              # Later, or no expiry date
+BUCKETS = (EXPIRED, CRITICAL, SOON, WATCH, OK)
+
+
+def _days_setting(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name} '{os.getenv(name)}'; using {default}.")
+        return default
+
+
+# Thresholds in days (inclusive). "Expiring soon" on the dashboard, inventory
+# and reports pages covers CRITICAL and SOON; sale lines and receipts also
+# warn for WATCH.
+EXPIRY_CRITICAL_DAYS = _days_setting('EXPIRY_CRITICAL_DAYS', 30)
+EXPIRY_SOON_DAYS = _days_setting('EXPIRY_SOON_DAYS', 90)
+EXPIRY_WATCH_DAYS = _days_setting('EXPIRY_WATCH_DAYS', 180)
+
+EXPIRING_SOON_BUCKETS = (CRITICAL, SOON)
+SALE_WARNING_BUCKETS = (CRITICAL, SOON, WATCH)
+
+LOOKUP_CHUNK_SIZE = 500
+
+
+def bucket_for(expiry_date, today=None):
+    """Expiry bucket of a single date."""
+    if not expiry_date:
+        return OK
+    days_left = (expiry_date - (today or date.today())).days
+    if days_left < 0:
+        return EXPIRED
+    if days_left <= EXPIRY_CRITICAL_DAYS:
+        return CRITICAL
+    if days_left <= EXPIRY_SOON_DAYS:
+        return SOON
+    if days_left <= EXPIRY_WATCH_DAYS:
+        return WATCH
+    return OK
+
+
+def bucket_expression(today=None):
+    """SQL equivalent of bucket_for() over InventoryItem.expiry_date."""
+    today = today or date.today()
+    column = InventoryItem.expiry_date
+    return case(
+        (column == None, literal(OK)),
+        (column < today, literal(EXPIRED)),
+        (column <= today + timedelta(days=EXPIRY_CRITICAL_DAYS), literal(CRITICAL)),
+        (column <= today + timedelta(days=EXPIRY_SOON_DAYS), literal(SOON)),
+        (column <= today + timedelta(days=EXPIRY_WATCH_DAYS), literal(WATCH)),
+        else_=literal(OK)
+    )
+
+
+def sale_line_expiry_flag(bucket):
+    """The `expires_soon` value sales.html expects: 'Expired', True or False."""
+    if bucket == EXPIRED:
+        return 'Expired'
+    return bucket in SALE_WARNING_BUCKETS
+
+
+@event.listens_for(InventoryItem, 'before_insert')
+@event.listens_for(InventoryItem, 'before_update')
+def _set_expiry_bucket(mapper, connection, target):
+    target.expiry_bucket = bucket_for(target.expiry_date)
+
+
+# --- Refreshing ---
+
+_refreshed_on = {}  # business_id (None = all) -> date of the last refresh in this process
+_refresh_lock = threading.Lock()
+
+
+def _refresh_statement(business_id, today):
+    expected = bucket_expression(today)
+    statement = update(InventoryItem).where(InventoryItem.expiry_bucket.is_distinct_from(expected))
+    if business_id:
+        statement = statement.where(InventoryItem.business_id == business_id)
+    # last_updated is kept: a bucket moving with the calendar is not an edit,
+    # and the catalog delta and sync would otherwise re-send every moved item
+    return statement.values(
+        expiry_bucket=expected, last_updated=InventoryItem.last_updated
+    ).execution_options(synchronize_session=False)
+
+
+def refresh_expiry_buckets(business_id=None, today=None):
+    """
+    Moves items whose stored bucket no longer matches today's date; only those
+    rows are written. Returns the number of rows updated. Does not commit.
+    """
+    return db.session.execute(_refresh_statement(business_id, today)).rowcount
+
+
+def ensure_expiry_buckets_current(business_id):
+    """
+    Refreshes a business's buckets once per day per process, before they are
+    read. The refresh commits on a connection of its own, so the caller's
+    session and transaction are left as they were.
+    """
+    today = date.today()
+    if _refreshed_on.get(None) == today or _refreshed_on.get(business_id) == today:
+        return
+    with _refresh_lock:
+        if _refreshed_on.get(business_id) == today:
+            return
+        try:
+            with db.engine.begin() as connection:
+                moved = connection.execute(_refresh_statement(business_id, today)).rowcount
+        except Exception as e:
+            logger.error(f"Could not refresh expiry buckets for business {business_id}: {e}")
+            return
+        if moved:
+            from dashboard_metrics import dashboard_cache  # Written outside the session, so no hook sees it
+            dashboard_cache.bump(business_id)
+            logger.info(f"Moved {moved} inventory items to a new expiry bucket for business {business_id}.")
+        _refreshed_on[business_id] = today
+
+
+# --- Readers ---
+
+def items_in_buckets(business_id, buckets):
+    """Query of active items in the given buckets, soonest expiry first."""
+    return InventoryItem.query.filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_active == True,
+        InventoryItem.expiry_bucket.in_(buckets)
+    ).order_by(InventoryItem.expiry_date, InventoryItem.product_name)
+
+
+def expiry_lookup(business_id, product_ids, chunk_size=LOOKUP_CHUNK_SIZE):
+    """
+    {product_id: (expiry_date, expiry_bucket)} for the given ids, fetched with
+    one IN query per `chunk_size` ids instead of one query per sale line.
+    """
+    product_ids = sorted({str(product_id) for product_id in product_ids if product_id})
+    lookup = {}
+    for start in range(0, len(product_ids), chunk_size):
+        rows = db.session.query(InventoryItem.id, InventoryItem.expiry_date, InventoryItem.expiry_bucket).filter(
+            InventoryItem.business_id == business_id,
+            InventoryItem.id.in_(product_ids[start:start + chunk_size])
+        ).all()
+        lookup.update({product_id: (expiry_date, bucket) for product_id, expiry_date, bucket in rows})
+    return lookup
+
+
+def expiry_bucket_counts(business_id):
+    """{bucket: number of active items} with every bucket present."""
+    counts = dict.fromkeys(BUCKETS, 0)
+    rows = db.session.query(InventoryItem.expiry_bucket, func.count(InventoryItem.id)).filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_active == True
+    ).group_by(InventoryItem.expiry_bucket).all()
+    for bucket, count in rows:
+        counts[bucket or OK] += count
+    return counts
+
+
+def expiry_thresholds():
+    return {
+        'critical_days': EXPIRY_CRITICAL_DAYS,
+        'soon_days': EXPIRY_SOON_DAYS,
+        'watch_days': EXPIRY_WATCH_DAYS,
+    }
+
+
+# --- CLI: `flask expiry-buckets refresh|counts` ---
+
+expiry_buckets_cli = AppGroup('expiry-buckets', help='Maintain inventory expiry buckets.')
+
+
+@expiry_buckets_cli.command('refresh')
+@click.option('--business-id', default=None, help='Only refresh this business.')
+def refresh_command(business_id):
+    """Move items into today's expiry buckets (run nightly)."""
+    moved = refresh_expiry_buckets(business_id)
+    db.session.commit()
+    _refreshed_on[business_id] = date.today()
+    click.echo(f"Updated the expiry bucket of {moved} inventory items.")
+
+
+@expiry_buckets_cli.command('counts')
+@click.option('--business-id', required=True, help='Business to report on.')
+def counts_command(business_id):
+    """Print the number of active items per expiry bucket."""
+    for bucket, count in expiry_bucket_counts(business_id).items():
+        click.echo(f"{bucket}: {count}")
@@ -0,0 +1,244 @@
+# history_search.py
+# Indexed search over sales and returns history (the search box of sales()
+# and returns_history()).
+#
+# Each SalesRecord/ReturnRecord keeps a lower-cased `search_text` (receipt
+# numbers, names, the phone number in its raw and local forms, and for sales the
+# product names), set by a mapper hook on every write. On PostgreSQL it carries
+# a pg_trgm GIN index, which serves substring LIKE; on SQLite (the offline
+# instance) triggers copy it into a shadow table indexed by an FTS5 trigram
+# table. search_records() hides the difference and returns a ranked query
+# that callers filter further and paginate.
+
+import re
+import json
+import logging
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import DDL, column, event, func, literal_column, select, table, update
+
+from extensions import db
+from models import ReturnRecord, SalesRecord
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = 1000
+SEARCH_PAGE_SIZE = 50
+MIN_TRIGRAM_LENGTH = 3  # Shorter terms cannot use either index and fall back to a scan
+SEPARATOR = ' | '
+COUNTRY_CODE = '233'
+_PHONE_QUERY = re.compile(r'^\+?[\d\s\-()]+$')
+
+
+def normalize_phone(value):
+    """
+    Phone number in local form: digits only, with a leading +233/233 country
+    code replaced by 0, so '+233 24 123 4567' and '0241234567' compare equal.
+    """
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith(COUNTRY_CODE) and len(digits) > len(COUNTRY_CODE) + 6:
+        return '0' + digits[len(COUNTRY_CODE):]
+    return digits
+
+
+def _phone_forms(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    return [digits, normalize_phone(phone)] if digits else []
+
+
+def _join(parts):
+    return SEPARATOR.join(dict.fromkeys(str(part).strip().lower() for part in parts if part and str(part).strip()))
+
+
+def sales_search_text(sale):
+    """search_text of a SalesRecord (or of a dict with the same keys)."""
+    get = sale.get if isinstance(sale, dict) else lambda key: getattr(sale, key, None)
+    try:
+        items = json.loads(get('items_sold_json') or '[]')
+    except (TypeError, ValueError):
+        items = []
+    product_names = [item.get('product_name') for item in items if isinstance(item, dict)]
+    return _join([get('receipt_number'), get('sales_person_name'), *_phone_forms(get('customer_phone')), *product_names])
+
+
+def return_search_text(return_record):
+    """search_text of a ReturnRecord (or of a dict with the same keys)."""
+    get = return_record.get if isinstance(return_record, dict) else lambda key: getattr(return_record, key, None)
+    return _join([
+        get('return_receipt_number'), get('original_receipt_number'), get('customer_name'),
+        get('processed_by'), *_phone_forms(get('customer_phone'))
+    ])
+
+
+SEARCH_TEXT = {SalesRecord: sales_search_text, ReturnRecord: return_search_text}
+DATE_COLUMN = {SalesRecord: SalesRecord.transaction_date, ReturnRecord: ReturnRecord.return_date}
+
+
+@event.listens_for(SalesRecord, 'before_insert')
+@event.listens_for(SalesRecord, 'before_update')
+def _set_sales_search_text(mapper, connection, target):
+    target.search_text = sales_search_text(target)
+
+
+@event.listens_for(ReturnRecord, 'before_insert')
+@event.listens_for(ReturnRecord, 'before_update')
+def _set_return_search_text(mapper, connection, target):
+    target.search_text = return_search_text(target)
+
+
+# --- Index DDL ---
+# PostgreSQL: the pg_trgm extension before the tables, then one GIN index per
+# table (declared on the models with ddl_if). SQLite: for each table a shadow
+# table with a stable INTEGER key (rowids of sales_records may change on
+# VACUUM), an external-content FTS5 trigram table over it, and the triggers
+# keeping both in step with the source table.
+
+def sqlite_search_ddl(tablename, fts_options="tokenize='trigram'"):
+    shadow, fts = f'{tablename}_search', f'{tablename}_fts'
+    return [
+        f"CREATE TABLE IF NOT EXISTS {shadow} ("
+        f"id INTEGER PRIMARY KEY, record_id VARCHAR(36) NOT NULL UNIQUE, search_text TEXT NOT NULL DEFAULT '')",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"search_text, content='{shadow}', content_rowid='id', {fts_options})",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_ai AFTER INSERT ON {tablename} BEGIN "
+        f"INSERT INTO {shadow}(record_id, search_text) VALUES (new.id, coalesce(new.search_text, '')); END",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_au AFTER UPDATE OF search_text ON {tablename} BEGIN "
+        f"UPDATE {shadow} SET search_text = coalesce(new.search_text, '') WHERE record_id = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_ad AFTER DELETE ON {tablename} BEGIN "
+        f"DELETE FROM {shadow} WHERE record_id = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {shadow} BEGIN "
+        f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {shadow} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {shadow} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+        f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    ]
+
+
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+for _model in SEARCH_TEXT:
+    for _statement in sqlite_search_ddl(_model.__tablename__):
+        event.listen(_model.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+# --- Querying ---
+
+def normalize_search_query(text):
+    """Lower-cased search terms; a phone-like query becomes one local-form number."""
+    text = (text or '').strip()
+    if _PHONE_QUERY.match(text) and len(re.sub(r'\D', '', text)) >= MIN_TRIGRAM_LENGTH:
+        digits = re.sub(r'\D', '', text)
+        if text.startswith('+') and digits.startswith(COUNTRY_CODE):
+            return ['0' + digits[len(COUNTRY_CODE):]]
+        return [normalize_phone(digits)]
+    return text.lower().split()
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_records(model, business_id, text):
+    """
+    Query of the business's SalesRecord or ReturnRecord rows matching every
+    term of `text`, best matches first, then newest first. Returns None when
+    `text` has no terms.
+    """
+    terms = normalize_search_query(text)
+    if not terms:
+        return None
+    date_column = DATE_COLUMN[model]
+    dialect = db.engine.dialect.name
+    fts_terms = [term for term in terms if len(term) >= MIN_TRIGRAM_LENGTH] if dialect == 'sqlite' else []
+    query = model.query.filter(model.business_id == business_id)
+    for term in terms:
+        if term not in fts_terms:
+            query = query.filter(model.search_text.contains(term, autoescape=True))
+
+    if dialect == 'postgresql':
+        rank = func.word_similarity(' '.join(terms), model.search_text)
+        return query.order_by(rank.desc(), date_column.desc())
+
+    if fts_terms:
+        tablename = model.__tablename__
+        shadow = table(f'{tablename}_search', column('id'), column('record_id'))
+        fts = table(f'{tablename}_fts', column('rowid'), column('rank'))
+        match = ' AND '.join(_fts_phrase(term) for term in fts_terms)
+        return query.join(shadow, shadow.c.record_id == model.id).join(fts, fts.c.rowid == shadow.c.id).filter(
+            literal_column(f'{tablename}_fts').op('MATCH')(match)
+        ).order_by(fts.c.rank, date_column.desc())
+
+    return query.order_by(date_column.desc())
+
+
+# --- Rebuilding ---
+
+def rebuild_search_text(model, business_id=None, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Recomputes search_text for every row (e.g. after changing what is indexed),
+    `chunk_size` rows per transaction; the SQLite triggers reindex changed rows.
+    Returns the number of rows changed.
+    """
+    compute = SEARCH_TEXT[model]
+    columns = [model.id, model.search_text] + [
+        model.__table__.c[name] for name in (
+            ('receipt_number', 'sales_person_name', 'customer_phone', 'items_sold_json') if model is SalesRecord
+            else ('return_receipt_number', 'original_receipt_number', 'customer_name', 'processed_by', 'customer_phone')
+        )
+    ]
+    statement = select(*columns).order_by(model.id).limit(chunk_size)
+    if business_id:
+        statement = statement.where(model.business_id == business_id)
+
+    changed = 0
+    last_id = ''
+    while True:
+        chunk = db.session.execute(statement.where(model.id > last_id)).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        updates = []
+        for row in chunk:
+            search_text = compute(row._asdict())
+            if search_text != row.search_text:
+                updates.append({'id': row.id, 'search_text': search_text})
+        if updates:
+            db.session.execute(update(model), updates)
+        db.session.commit()
+        changed += len(updates)
+    return changed
+
+
+def rebuild_sqlite_index(model):
+    """Refills the SQLite shadow and FTS tables from the source table."""
+    tablename = model.__tablename__
+    with db.engine.begin() as connection:
+        for statement in sqlite_search_ddl(tablename):
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f"DELETE FROM {tablename}_search")
+        connection.exec_driver_sql(
+            f"INSERT INTO {tablename}_search(record_id, search_text) "
+            f"SELECT id, coalesce(search_text, '') FROM {tablename}"
+        )
+        connection.exec_driver_sql(f"INSERT INTO {tablename}_fts({tablename}_fts) VALUES ('rebuild')")
+
+
+# --- CLI: `flask history-search rebuild` ---
+
+history_search_cli = AppGroup('history-search', help='Maintain the sales and returns search index.')
+
+
+@history_search_cli.command('rebuild')
+@click.option('--business-id', default=None, help='Only recompute this business.')
+@click.option('--chunk-size', default=REBUILD_CHUNK_SIZE, show_default=True, help='Rows per batch.')
+def rebuild_command(business_id, chunk_size):
+    """Recompute search_text (and on SQLite, rebuild the FTS tables)."""
+    for model in SEARCH_TEXT:
+        changed = rebuild_search_text(model, business_id, chunk_size)
+        click.echo(f"Updated the search text of {changed} {model.__tablename__} rows.")
+        if db.engine.dialect.name == 'sqlite':
+            rebuild_sqlite_index(model)
+            click.echo(f"Rebuilt the {model.__tablename__} full-text index.")
@@ -0,0 +1,298 @@
+# inventory_import.py
+# Streaming inventory CSV import (/inventory/upload_csv).
+#
+# The upload is decoded and parsed as it is read, never held whole in memory.
+# Rows are validated one by one and written CHUNK_SIZE at a time: one query
+# reads the chunk's existing items (to count updates and keep their barcode and
+# reorder point), then one INSERT ... ON CONFLICT (product_name, business_id)
+# DO UPDATE upserts the chunk, on PostgreSQL and SQLite alike, and the chunk is
+# committed on its own. An update overwrites UPDATED_COLUMNS from the row:
+# a blank or absent optional column is written as its default (a blank
+# batch_number clears it, a blank is_active reactivates the item), while
+# barcode, markup, price range and reorder point are kept. A product_name
+# repeated in the file is imported from its first row; later rows for it go
+# to the error report rather than silently overwriting it.
+# Bulk statements bypass the mapper hooks, so search_text, expiry_bucket and
+# is_low_stock are computed here. Rows that fail are written to an error
+# report CSV: the line number, the reason and the row as uploaded, so the
+# report can be corrected and uploaded again.
+
+import os
+import re
+import csv
+import codecs
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models import InventoryItem
+from barcodes import invalidate as invalidate_barcodes
+from dashboard_metrics import dashboard_cache
+from expiry_buckets import bucket_for
+from low_stock import is_low_stock
+from product_search import product_search_cache, product_search_text
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv('INVENTORY_IMPORT_CHUNK_SIZE', 1000))
+REPORT_RETENTION = timedelta(hours=int(os.getenv('INVENTORY_IMPORT_REPORT_HOURS', 24)))
+REQUIRED_COLUMNS = ('product_name', 'category', 'purchase_price', 'current_stock')
+# What an upload overwrites on an existing item (barcode, markup, price range
+# and reorder point are kept)
+UPDATED_COLUMNS = (
+    'category', 'purchase_price', 'sale_price', 'current_stock', 'last_updated', 'batch_number', 'number_of_tabs',
+    'unit_price_per_tab', 'item_type', 'expiry_date', 'is_fixed_price', 'fixed_sale_price', 'is_active',
+    'search_text', 'expiry_bucket', 'is_low_stock',
+)
+_REPORT_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class InvalidInventoryCsv(ValueError):
+    """The file as a whole cannot be imported (no header, required columns missing)."""
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+# --- Parsing ---
+
+def _text(row, column, max_length, default=''):
+    value = (row.get(column) or '').strip() or default
+    if len(value) > max_length:
+        raise InvalidRow(f"'{column}' is longer than {max_length} characters.")
+    return value
+
+
+def _number(row, column, default=None, convert=float):
+    value = (row.get(column) or '').strip()
+    if not value:
+        if default is None:
+            raise InvalidRow(f"'{column}' is required.")
+        return default
+    try:
+        return convert(value)
+    except ValueError:
+        raise InvalidRow(f"'{column}' must be a number, got '{value}'.")
+
+
+def _flag(row, column, default):
+    value = (row.get(column) or '').strip()
+    return value.lower() == 'true' if value else default
+
+
+def parse_row(row, default_item_type, now=None):
+    """The inventory_items values of one CSV row (without business or id). Raises InvalidRow."""
+    product_name = _text(row, 'product_name', 255)
+    if not product_name:
+        raise InvalidRow("'product_name' is required.")
+    purchase_price = _number(row, 'purchase_price')
+    number_of_tabs = _number(row, 'number_of_tabs', 1, int)
+    if number_of_tabs <= 0:
+        raise InvalidRow("'number_of_tabs' (units/pieces per pack) must be greater than zero.")
+    expiry_date = (row.get('expiry_date') or '').strip()
+    try:
+        expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').date() if expiry_date else None
+    except ValueError:
+        raise InvalidRow(f"'expiry_date' must be YYYY-MM-DD, got '{expiry_date}'.")
+    is_fixed_price = _flag(row, 'is_fixed_price', False)
+    fixed_sale_price = _number(row, 'fixed_sale_price', 0.0)
+
+    if is_fixed_price:
+        sale_price = fixed_sale_price
+        unit_price_per_tab = fixed_sale_price / number_of_tabs
+    else:
+        sale_price = _number(row, 'sale_price', purchase_price * 1.2)  # Default 20% markup
+        unit_price_per_tab = _number(row, 'unit_price_per_tab', sale_price / number_of_tabs)
+
+    return {
+        'product_name': product_name,
+        'category': _text(row, 'category', 100),
+        'purchase_price': purchase_price,
+        'sale_price': sale_price,
+        'current_stock': _number(row, 'current_stock'),
+        'last_updated': now or datetime.now(),
+        'batch_number': _text(row, 'batch_number', 100),
+        'number_of_tabs': number_of_tabs,
+        'unit_price_per_tab': unit_price_per_tab,
+        'item_type': _text(row, 'item_type', 50, default_item_type),
+        'expiry_date': expiry_date,
+        'is_fixed_price': is_fixed_price,
+        'fixed_sale_price': fixed_sale_price,
+        'is_active': _flag(row, 'is_active', True),
+    }
+
+
+# --- Error reports ---
+
+def _report_dir():
+    return os.path.join(current_app.instance_path, 'inventory_import_reports')
+
+
+def error_report_path(business_id, report_id):
+    """Where a business's error report lives (it may not exist yet)."""
+    if not _REPORT_ID.match(report_id or ''):
+        return None
+    return os.path.join(_report_dir(), f'{business_id}_{report_id}.csv')
+
+
+def prune_error_reports():
+    """Deletes reports older than REPORT_RETENTION."""
+    directory = _report_dir()
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - REPORT_RETENTION.total_seconds()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ErrorReport:
+    """The per-row error report of one import, written to `path` from the first error on."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fieldnames = []
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, line, error, row=None):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['line', 'error', *self.fieldnames])
+        row = row or {}
+        self._writer.writerow([line, error, *(row.get(name, '') for name in self.fieldnames)])
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+# --- Writing ---
+
+def _upsert_statement():
+    insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(InventoryItem)
+    return statement.on_conflict_do_update(
+        index_elements=['product_name', 'business_id'],
+        set_={column: statement.excluded[column] for column in UPDATED_COLUMNS}
+    )
+
+
+def _existing_items(business_id, names):
+    return {row.product_name: row for row in db.session.query(
+        InventoryItem.product_name, InventoryItem.barcode, InventoryItem.reorder_point
+    ).filter(InventoryItem.business_id == business_id, InventoryItem.product_name.in_(names))}
+
+
+def _derived(values, existing):
+    """Adds the columns the mapper hooks would have set."""
+    barcode = existing.barcode if existing else None
+    reorder_point = existing.reorder_point if existing else None
+    values['search_text'] = product_search_text({**values, 'barcode': barcode})
+    values['expiry_bucket'] = bucket_for(values['expiry_date'])
+    values['is_low_stock'] = is_low_stock(SimpleNamespace(**values, reorder_point=reorder_point))
+    return values
+
+
+def _write_chunk(business_id, chunk, report, totals):
+    """Upserts one chunk {product_name: (line, row, values)} and commits it."""
+    existing = _existing_items(business_id, list(chunk))
+    rows = [
+        _derived({'id': str(uuid.uuid4()), 'business_id': business_id, **values}, existing.get(name))
+        for name, (_, _, values) in chunk.items()
+    ]
+    try:
+        db.session.execute(_upsert_statement(), rows)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning(f"Inventory import chunk for business {business_id} failed ({getattr(e, 'orig', e)}); retrying row by row.")
+        for (line, row, _), values in zip(chunk.values(), rows):
+            try:
+                db.session.execute(_upsert_statement(), [values])
+                db.session.commit()
+            except SQLAlchemyError as row_error:
+                db.session.rollback()
+                report.add(line, f"Could not be saved: {getattr(row_error, 'orig', row_error)}", row)
+                continue
+            totals['updated' if values['product_name'] in existing else 'added'] += 1
+    else:
+        updated = sum(1 for name in chunk if name in existing)
+        totals['updated'] += updated
+        totals['added'] += len(chunk) - updated
+
+    dashboard_cache.bump(business_id)
+    product_search_cache.bump(business_id)
+    invalidate_barcodes(business_id)
+
+
+def import_inventory_csv(business_id, stream, default_item_type, report_path, chunk_size=CHUNK_SIZE):
+    """
+    Adds or updates the business's items from a CSV byte stream, matching
+    on product_name. Returns {'added', 'updated', 'errors'}; rows in error
+    are written to report_path. Raises InvalidInventoryCsv, before writing
+    anything, if the header lacks a required column. Each chunk commits, so
+    rows before a fatal error (e.g. invalid UTF-8) stay imported.
+    """
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+    report = ErrorReport(report_path)
+    totals = {'added': 0, 'updated': 0, 'errors': 0}
+    try:
+        fieldnames = reader.fieldnames
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise InvalidInventoryCsv(f"Could not read the file: {e}")
+    if not fieldnames:
+        raise InvalidInventoryCsv('The file is empty.')
+    reader.fieldnames = [name.strip() for name in fieldnames]
+    missing = [column for column in REQUIRED_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise InvalidInventoryCsv(f"Missing required column(s): {', '.join(missing)}.")
+    report.fieldnames = [name for name in reader.fieldnames if name not in ('line', 'error')]  # A re-uploaded report
+
+    chunk = {}  # product_name -> (line, row, values)
+    first_lines = {}  # product_name -> line of its first row, across chunks
+    try:
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except (UnicodeDecodeError, csv.Error) as e:
+                report.add(reader.line_num + 1, f"Import stopped, the rest of the file could not be read: {e}")
+                break
+            try:
+                values = parse_row(row, default_item_type)
+            except InvalidRow as e:
+                report.add(reader.line_num, str(e), row)
+                continue
+            first_line = first_lines.setdefault(values['product_name'], reader.line_num)
+            if first_line != reader.line_num:
+                report.add(reader.line_num, f"Duplicate of line {first_line}; only the first row for a product is imported.", row)
+                continue
+            chunk[values['product_name']] = (reader.line_num, row, values)
+            if len(chunk) >= chunk_size:
+                _write_chunk(business_id, chunk, report, totals)
+                chunk = {}
+        if chunk:
+            _write_chunk(business_id, chunk, report, totals)
+    finally:
+        report.close()
+    totals['errors'] = report.count
+    return totals
@@ -0,0 +1,248 @@
+# inventory_serializers.py
+# The JSON shapes of inventory items sent to the front end, in one place.
+#
+# Each InventoryView names the columns its shape needs and a function
+# building the dict from them, positionally. rows(query) projects an
+# InventoryItem query onto just those columns, so a list endpoint reads
+# tuples instead of hydrating (and identity-mapping) full ORM objects;
+# item(obj) builds the same dict from an object already loaded. Large
+# payloads go through json_response, which encodes with orjson (pinned in
+# requirements.txt). If it is missing from an environment anyway, the
+# standard library encoder is the safety net and produces equivalent JSON.
+#
+# bench_inventory_serializers.py times the old per-object serializers
+# against these for 10k items.
+
+import json
+
+from flask import current_app
+
+from models import InventoryItem
+
+try:
+    import orjson
+except ImportError:  # Safety net only: requirements.txt installs orjson
+    orjson = None
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+class InventoryView:
+    """One JSON shape of an inventory item: the columns it reads and the function building it."""
+
+    def __init__(self, build, *columns):
+        self.build = build
+        self.columns = columns
+
+    def rows(self, query):
+        """The dicts of every item an InventoryItem query selects, reading only this view's columns."""
+        build = self.build
+        return [build(*row) for row in query.with_entities(*self.columns)]
+
+    def item(self, item):
+        return self.build(*(getattr(item, column.key) for column in self.columns))
+
+
+def _sale_form(item_id, product_name, category, current_stock, sale_price, number_of_tabs, batch_number, barcode,
+               item_type, purchase_price, is_fixed_price, fixed_sale_price, use_price_range, min_sale_price,
+               preferred_sale_price, max_sale_price):
+    sale_price = float(sale_price) if sale_price else 0.0
+    number_of_tabs = float(number_of_tabs) if number_of_tabs else 1.0
+    return {
+        'id': item_id,
+        'product_name': product_name or '',
+        'category': category or '',
+        'current_stock': float(current_stock) if current_stock else 0.0,
+        'sale_price': sale_price,
+        'unit_price_per_tab': sale_price / number_of_tabs if number_of_tabs > 0 else 0.0,
+        'number_of_tabs': number_of_tabs,
+        'batch_number': batch_number or '',
+        'barcode': barcode or '',
+        'item_type': item_type or '',
+        'purchase_price': float(purchase_price) if purchase_price else 0.0,
+        'is_fixed_price': bool(is_fixed_price),
+        'fixed_sale_price': float(fixed_sale_price) if fixed_sale_price else 0.0,
+        'use_price_range': bool(use_price_range),
+        'min_sale_price': float(min_sale_price) if min_sale_price else 0.0,
+        'preferred_sale_price': float(preferred_sale_price) if preferred_sale_price else 0.0,
+        'max_sale_price': float(max_sale_price) if max_sale_price else 0.0,
+    }
+
+
+# The sale form's product list: /api/v1/catalog, /api/get_inventory_for_sale, /api/v1/products/search
+sale_form_view = InventoryView(
+    _sale_form,
+    InventoryItem.id, InventoryItem.product_name, InventoryItem.category, InventoryItem.current_stock,
+    InventoryItem.sale_price, InventoryItem.number_of_tabs, InventoryItem.batch_number, InventoryItem.barcode,
+    InventoryItem.item_type, InventoryItem.purchase_price, InventoryItem.is_fixed_price,
+    InventoryItem.fixed_sale_price, InventoryItem.use_price_range, InventoryItem.min_sale_price,
+    InventoryItem.preferred_sale_price, InventoryItem.max_sale_price,
+)
+
+
+def _scanner(item_id, product_name, current_stock, is_fixed_price, barcode, number_of_tabs, unit_price_per_tab,
+             item_type, expiry_date, batch_number, purchase_price, sale_price, fixed_sale_price,
+             markup_percentage_pharmacy):
+    return {
+        'id': str(item_id),
+        'product_name': product_name,
+        'current_stock': float(current_stock or 0.0),
+        'is_fixed_price': is_fixed_price,
+        'barcode': barcode,
+        'number_of_tabs': float(number_of_tabs or 1.0),
+        'unit_price_per_tab': float(unit_price_per_tab or 0.0),
+        'item_type': item_type,
+        'expiry_date': expiry_date.strftime('%Y-%m-%d') if expiry_date else None,
+        'batch_number': batch_number,
+        'purchase_price': float(purchase_price or 0.0),
+        'sale_price': float(sale_price or 0.0),
+        'fixed_sale_price': float(fixed_sale_price or 0.0),
+        'markup_percentage_pharmacy': float(markup_percentage_pharmacy or 0.0),
+    }
+
+
+# Barcode scans and the rental/sale product pickers: /api/get_product_by_barcode, /get_all_active_products
+scanner_view = InventoryView(
+    _scanner,
+    InventoryItem.id, InventoryItem.product_name, InventoryItem.current_stock, InventoryItem.is_fixed_price,
+    InventoryItem.barcode, InventoryItem.number_of_tabs, InventoryItem.unit_price_per_tab, InventoryItem.item_type,
+    InventoryItem.expiry_date, InventoryItem.batch_number, InventoryItem.purchase_price, InventoryItem.sale_price,
+    InventoryItem.fixed_sale_price, InventoryItem.markup_percentage_pharmacy,
+)
+
+
+def _item_picker(item_id, product_name, category, current_stock, sale_price, unit_price_per_tab, number_of_tabs,
+                 is_fixed_price, fixed_sale_price, barcode, batch_number, item_type, purchase_price,
+                 markup_percentage_pharmacy, expiry_date):
+    return {
+        'id': str(item_id),
+        'product_name': product_name or '',
+        'category': category or '',
+        'current_stock': float(current_stock or 0.0),
+        'sale_price': float(sale_price or 0.0),
+        'unit_price_per_tab': float(unit_price_per_tab or 0.0),
+        'number_of_tabs': float(number_of_tabs or 1.0),
+        'is_fixed_price': is_fixed_price,
+        'fixed_sale_price': float(fixed_sale_price or 0.0),
+        'barcode': barcode or '',
+        'batch_number': batch_number or '',
+        'item_type': item_type or '',
+        'purchase_price': float(purchase_price or 0.0),
+        'markup_percentage_pharmacy': float(markup_percentage_pharmacy or 0.0),
+        'expiry_date': expiry_date.strftime('%Y-%m-%d') if expiry_date else None,
+    }
+
+
+# The invoice item dropdown: /api/inventory-items
+item_picker_view = InventoryView(
+    _item_picker,
+    InventoryItem.id, InventoryItem.product_name, InventoryItem.category, InventoryItem.current_stock,
+    InventoryItem.sale_price, InventoryItem.unit_price_per_tab, InventoryItem.number_of_tabs,
+    InventoryItem.is_fixed_price, InventoryItem.fixed_sale_price, InventoryItem.barcode, InventoryItem.batch_number,
+    InventoryItem.item_type, InventoryItem.purchase_price, InventoryItem.markup_percentage_pharmacy,
+    InventoryItem.expiry_date,
+)
+
+
+def _sync(item_id, business_id, product_name, category, purchase_price, sale_price, current_stock, last_updated,
+          batch_number, number_of_tabs, unit_price_per_tab, item_type, expiry_date, is_fixed_price,
+          fixed_sale_price, is_active):
+    return {
+        'id': str(item_id),
+        'business_id': str(business_id),
+        'product_name': str(product_name),
+        'category': str(category),
+        'purchase_price': float(purchase_price),
+        'sale_price': float(sale_price),
+        'current_stock': float(current_stock),
+        'last_updated': _iso(last_updated),
+        'batch_number': str(batch_number) if batch_number else None,
+        'number_of_tabs': int(number_of_tabs),
+        'unit_price_per_tab': float(unit_price_per_tab),
+        'item_type': str(item_type),
+        'expiry_date': _iso(expiry_date),
+        'is_fixed_price': bool(is_fixed_price),
+        'fixed_sale_price': float(fixed_sale_price),
+        'is_active': bool(is_active),
+    }
+
+
+# Remote sync: GET /api/inventory and the super-admin inventory export
+sync_view = InventoryView(
+    _sync,
+    InventoryItem.id, InventoryItem.business_id, InventoryItem.product_name, InventoryItem.category,
+    InventoryItem.purchase_price, InventoryItem.sale_price, InventoryItem.current_stock, InventoryItem.last_updated,
+    InventoryItem.batch_number, InventoryItem.number_of_tabs, InventoryItem.unit_price_per_tab,
+    InventoryItem.item_type, InventoryItem.expiry_date, InventoryItem.is_fixed_price,
+    InventoryItem.fixed_sale_price, InventoryItem.is_active,
+)
+
+
+def _or(value, default):
+    return default if value is None else value
+
+
+def _detail(item_id, product_name, category, purchase_price, sale_price, current_stock, last_updated, batch_number,
+            number_of_tabs, unit_price_per_tab, item_type, expiry_date, is_fixed_price, fixed_sale_price,
+            is_active, barcode):
+    return {
+        'id': str(_or(item_id, '')),
+        'product_name': str(_or(product_name, 'N/A')),
+        'category': str(_or(category, 'N/A')),
+        'purchase_price': float(_or(purchase_price, 0.0)),
+        'sale_price': float(_or(sale_price, 0.0)),
+        'current_stock': float(_or(current_stock, 0.0)),
+        'last_updated': _iso(last_updated),
+        'batch_number': str(_or(batch_number, 'N/A')),
+        'number_of_tabs': float(_or(number_of_tabs, 1.0)),
+        'unit_price_per_tab': float(_or(unit_price_per_tab, 0.0)),
+        'item_type': str(_or(item_type, 'N/A')),
+        'expiry_date': _iso(expiry_date),
+        'is_fixed_price': bool(_or(is_fixed_price, False)),
+        'fixed_sale_price': float(_or(fixed_sale_price, 0.0)),
+        'is_active': bool(_or(is_active, False)),
+        'barcode': str(_or(barcode, '')),
+    }
+
+
+# Business inventory for other services and the future-order forms: /api/v1/inventory/<business_id>
+detail_view = InventoryView(
+    _detail,
+    InventoryItem.id, InventoryItem.product_name, InventoryItem.category, InventoryItem.purchase_price,
+    InventoryItem.sale_price, InventoryItem.current_stock, InventoryItem.last_updated, InventoryItem.batch_number,
+    InventoryItem.number_of_tabs, InventoryItem.unit_price_per_tab, InventoryItem.item_type,
+    InventoryItem.expiry_date, InventoryItem.is_fixed_price, InventoryItem.fixed_sale_price,
+    InventoryItem.is_active, InventoryItem.barcode,
+)
+
+
+def _invoice_form(product_name, sale_price, category, current_stock):
+    return {
+        'product_name': product_name,
+        'sale_price': float(sale_price) if sale_price else 0,
+        'category': category or '',
+        'current_stock': current_stock if current_stock else 0,
+    }
+
+
+# The invoice form's product list (embedded in the page)
+invoice_form_view = InventoryView(
+    _invoice_form,
+    InventoryItem.product_name, InventoryItem.sale_price, InventoryItem.category, InventoryItem.current_stock,
+)
+
+
+# --- Encoding ---
+
+def dumps(payload):
+    """Compact JSON bytes of `payload`."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def json_response(payload, status=200):
+    """A JSON response for a large payload, encoded with dumps()."""
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
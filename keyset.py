@@ -0,0 +1,119 @@
+# keyset.py
+# Keyset ("seek") pagination for the long list views.
+#
+# A page is read with WHERE (sort, id) < (boundary sort, boundary id)
+# ORDER BY sort, id LIMIT per_page + 1 (> and ascending for the other
+# direction), so a deep page costs the same as the first one and rows written
+# in between neither repeat nor go missing, as they can with OFFSET. The
+# `after`/`before` cursors in the URL are opaque tokens of a boundary row's
+# (sort, id); the sort column must be NOT NULL. Pages carry no totals: views
+# run one aggregate over the same filtered query for those.
+
+import json
+import base64
+import binascii
+from datetime import date, datetime
+
+from sqlalchemy import literal, tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def page_size(args, default=DEFAULT_PAGE_SIZE):
+    """The `per_page` request argument, clamped to 1..MAX_PAGE_SIZE."""
+    size = args.get('per_page', default, type=int) or default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        raise ValueError('Unknown cursor value.')
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """The (sort, id) values of a cursor, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != 2:
+            return None
+        return [_decode_value(value) for value in values]
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbours (None at either end)."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, sort_column, id_column, args, descending=True, per_page=None):
+    """
+    The page of `query` (ORM rows) selected by the `after`/`before` cursor in
+    `args`, ordered by (sort_column, id_column), newest/highest first when
+    `descending`. A malformed cursor reads as the first page.
+    """
+    per_page = per_page or page_size(args)
+    after = decode_cursor(args.get('after'))
+    before = None if after else decode_cursor(args.get('before'))
+    key = tuple_(sort_column, id_column)
+
+    backwards = before is not None
+    cursor = before or after
+    if cursor:
+        boundary = tuple_(literal(cursor[0], sort_column.type), literal(cursor[1], id_column.type))
+        # Reading backwards flips both the comparison and the order
+        query = query.filter(key < boundary if descending != backwards else key > boundary)
+    ascending = descending == backwards
+    query = query.order_by(None).order_by(
+        *((sort_column.asc(), id_column.asc()) if ascending else (sort_column.desc(), id_column.desc()))
+    )
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_of(row):
+        return encode_cursor([getattr(row, sort_column.key), getattr(row, id_column.key)])
+
+    has_next = (more and not backwards) or (backwards and bool(rows))
+    has_prev = (more and backwards) or (after is not None and bool(rows))
+    return KeysetPage(
+        rows, per_page,
+        next_cursor=cursor_of(rows[-1]) if has_next and rows else None,
+        prev_cursor=cursor_of(rows[0]) if has_prev and rows else None,
+    )
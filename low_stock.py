@@ -0,0 +1,189 @@
+# low_stock.py
+# Per-item reorder points and the maintained low-stock set (inventory_items.is_low_stock).
+#
+# current_stock is kept in base units (tabs/pieces). An item's own
+# reorder_point is in base units too and compares directly; without one, the
+# category default applies, which is a number of packs and so is multiplied
+# by number_of_tabs: 10 packs of a 100-tab item is 1000 tabs, not 10.
+# A mapper hook recomputes the flag whenever an item is written (sales,
+# returns, CSV uploads, transfers, edits), so reading the set is an index
+# lookup on (business_id, is_low_stock). Items that cross the reorder point
+# are reported to the registered crossing listeners after commit.
+
+import os
+import json
+import logging
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, case, event, literal
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import InventoryItem
+
+logger = logging.getLogger(__name__)
+
+
+def _load_category_reorder_points():
+    """REORDER_POINTS_BY_CATEGORY='{"Antibiotics": 4, "Syrups": 5}' (packs)."""
+    raw = os.getenv('REORDER_POINTS_BY_CATEGORY')
+    if not raw:
+        return {}
+    try:
+        return {str(category).strip().lower(): float(points) for category, points in json.loads(raw).items()}
+    except (TypeError, ValueError, AttributeError):
+        logger.warning("Ignoring invalid REORDER_POINTS_BY_CATEGORY; expected a JSON object of numbers.")
+        return {}
+
+
+try:
+    DEFAULT_REORDER_POINT = float(os.getenv('REORDER_POINT_DEFAULT', 10))
+except ValueError:
+    DEFAULT_REORDER_POINT = 10.0
+CATEGORY_REORDER_POINTS = _load_category_reorder_points()
+
+
+def default_reorder_point(category):
+    """The category's default reorder point, in packs."""
+    return CATEGORY_REORDER_POINTS.get((category or '').strip().lower(), DEFAULT_REORDER_POINT)
+
+
+def _tabs(item):
+    return float(item.number_of_tabs) if item.number_of_tabs and item.number_of_tabs > 0 else 1.0
+
+
+def effective_reorder_point(item):
+    """The item's own reorder point, else its category default in packs times its tabs (base units)."""
+    if item.reorder_point is not None:
+        return float(item.reorder_point)
+    return default_reorder_point(item.category) * _tabs(item)
+
+
+def is_low_stock(item):
+    if item.is_active is False:
+        return False
+    return float(item.current_stock or 0.0) <= effective_reorder_point(item)
+
+
+def parse_reorder_point(value):
+    """Form/CSV value to a reorder point: blank means 'use the category default'."""
+    value = (value or '').strip() if isinstance(value, str) else value
+    if value in (None, ''):
+        return None
+    reorder_point = float(value)
+    if reorder_point < 0:
+        raise ValueError('Reorder point cannot be negative.')
+    return reorder_point
+
+
+# --- Maintaining the set ---
+
+_crossing_listeners = []
+
+
+def on_low_stock_crossing(listener):
+    """
+    Registers listener(crossings) called after a commit in which items entered
+    or left the low-stock set. Each crossing is a plain dict.
+    """
+    _crossing_listeners.append(listener)
+    return listener
+
+
+@event.listens_for(InventoryItem, 'before_insert')
+@event.listens_for(InventoryItem, 'before_update')
+def _set_low_stock_flag(mapper, connection, target):
+    was_low = bool(target.is_low_stock)
+    now_low = is_low_stock(target)
+    target.is_low_stock = now_low
+    if now_low == was_low or not _crossing_listeners:
+        return
+    session = object_session(target)
+    if session is None:
+        return
+    session.info.setdefault('low_stock_crossings', []).append({
+        'business_id': target.business_id,
+        'item_id': target.id,
+        'product_name': target.product_name,
+        'current_stock': float(target.current_stock or 0.0),
+        'reorder_point': effective_reorder_point(target),
+        'entered': now_low,
+    })
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_low_stock_crossings(session):
+    crossings = session.info.pop('low_stock_crossings', None)
+    if not crossings:
+        return
+    for listener in _crossing_listeners:
+        try:
+            listener(crossings)
+        except Exception as e:
+            logger.error(f"Low-stock crossing listener failed: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_low_stock_crossings(session):
+    session.info.pop('low_stock_crossings', None)
+
+
+def low_stock_expression():
+    """SQL equivalent of is_low_stock() with the configured defaults."""
+    category_default = case(
+        *[(db.func.lower(db.func.trim(InventoryItem.category)) == category, literal(points))
+          for category, points in CATEGORY_REORDER_POINTS.items()],
+        else_=literal(DEFAULT_REORDER_POINT)
+    ) if CATEGORY_REORDER_POINTS else literal(DEFAULT_REORDER_POINT)
+    tabs = case((InventoryItem.number_of_tabs > 0, InventoryItem.number_of_tabs), else_=literal(1))
+    reorder_point = db.func.coalesce(InventoryItem.reorder_point, category_default * tabs)
+    return case(
+        (and_(InventoryItem.is_active == True, InventoryItem.current_stock <= reorder_point), literal(True)),
+        else_=literal(False)
+    )
+
+
+def rebuild_low_stock_flags(business_id=None):
+    """Recomputes every flag in SQL, e.g. after changing the category defaults. Does not commit."""
+    expected = low_stock_expression()
+    query = InventoryItem.query.filter(InventoryItem.is_low_stock.is_distinct_from(expected))
+    if business_id:
+        query = query.filter(InventoryItem.business_id == business_id)
+    return query.update({InventoryItem.is_low_stock: expected}, synchronize_session=False)
+
+
+# --- Reading the set ---
+
+def low_stock_query(business_id):
+    """Items in the low-stock set (served by the is_low_stock index), lowest stock first."""
+    return InventoryItem.query.filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_low_stock == True
+    ).order_by(InventoryItem.current_stock, InventoryItem.product_name)
+
+
+def low_stock_row(item):
+    return {
+        'id': item.id,
+        'product_name': item.product_name,
+        'category': item.category,
+        'current_stock': item.current_stock or 0.0,
+        'number_of_tabs': item.number_of_tabs,
+        'reorder_point': effective_reorder_point(item),
+        'reorder_point_is_default': item.reorder_point is None,
+    }
+
+
+# --- CLI: `flask low-stock rebuild` ---
+
+low_stock_cli = AppGroup('low-stock', help='Maintain the low-stock set.')
+
+
+@low_stock_cli.command('rebuild')
+@click.option('--business-id', default=None, help='Only rebuild this business.')
+def rebuild_command(business_id):
+    """Recompute is_low_stock for all items (run after changing reorder defaults)."""
+    changed = rebuild_low_stock_flags(business_id)
+    db.session.commit()
+    click.echo(f"Updated the low-stock flag of {changed} inventory items.")
@@ -0,0 +1,106 @@
+"""Add search_text to inventory items with a trigram / FTS5 prefix index
+
+Revision ID: 2d8b6f4a1c57
+Revises: 9a3e5c7b1d24
+Create Date: 2026-10-18 22:31:52.084613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d8b6f4a1c57'
+down_revision = '9a3e5c7b1d24'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 1000
+TABLE = 'inventory_items'
+INDEX = 'ix_inventory_items_search_text_trgm'
+
+
+def _is_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+# Same text as product_search.product_search_text(), frozen here.
+def _search_text(row):
+    parts = (row.product_name, row.category, row.batch_number, row.barcode)
+    return ' | '.join(dict.fromkeys(str(part).strip().lower() for part in parts if part and str(part).strip()))
+
+
+def _backfill():
+    """Fills search_text in keyset-ordered chunks, one executemany UPDATE per chunk."""
+    source = sa.table(TABLE, sa.column('id', sa.String), sa.column('search_text', sa.Text),
+                      sa.column('product_name'), sa.column('category'), sa.column('batch_number'), sa.column('barcode'))
+    bind = op.get_bind()
+    update = source.update().where(source.c.id == sa.bindparam('record_id')).values(search_text=sa.bindparam('text'))
+    last_id = ''
+    while True:
+        chunk = bind.execute(
+            sa.select(source).where(source.c.id > last_id).order_by(source.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        bind.execute(update, [{'record_id': row.id, 'text': _search_text(row)} for row in chunk])
+
+
+def _sqlite_ddl():
+    shadow, fts = f'{TABLE}_search', f'{TABLE}_fts'
+    return [
+        f"CREATE TABLE IF NOT EXISTS {shadow} ("
+        f"id INTEGER PRIMARY KEY, record_id VARCHAR(36) NOT NULL UNIQUE, search_text TEXT NOT NULL DEFAULT '')",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"search_text, content='{shadow}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_ai AFTER INSERT ON {TABLE} BEGIN "
+        f"INSERT INTO {shadow}(record_id, search_text) VALUES (new.id, coalesce(new.search_text, '')); END",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_au AFTER UPDATE OF search_text ON {TABLE} BEGIN "
+        f"UPDATE {shadow} SET search_text = coalesce(new.search_text, '') WHERE record_id = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_ad AFTER DELETE ON {TABLE} BEGIN "
+        f"DELETE FROM {shadow} WHERE record_id = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {shadow} BEGIN "
+        f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {shadow} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {shadow} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+        f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    ]
+
+
+def upgrade():
+    with op.batch_alter_table(TABLE, schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_text', sa.Text(), nullable=True))
+    _backfill()
+
+    if _is_postgresql():
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        # Built without blocking writes; CONCURRENTLY cannot run in a transaction.
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX, TABLE, ['search_text'], postgresql_using='gin',
+                            postgresql_ops={'search_text': 'gin_trgm_ops'},
+                            postgresql_concurrently=True, if_not_exists=True)
+    elif op.get_bind().dialect.name == 'sqlite':
+        for statement in _sqlite_ddl():
+            op.execute(statement)
+        # The shadow table's insert trigger fills the FTS index.
+        op.execute(f"INSERT INTO {TABLE}_search(record_id, search_text) "
+                   f"SELECT id, coalesce(search_text, '') FROM {TABLE}")
+
+
+def downgrade():
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            op.drop_index(INDEX, table_name=TABLE, postgresql_concurrently=True, if_exists=True)
+    elif op.get_bind().dialect.name == 'sqlite':
+        shadow, fts = f'{TABLE}_search', f'{TABLE}_fts'
+        for trigger in (f'{shadow}_ai', f'{shadow}_au', f'{shadow}_ad', f'{fts}_ai', f'{fts}_ad', f'{fts}_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute(f"DROP TABLE IF EXISTS {fts}")
+        op.execute(f"DROP TABLE IF EXISTS {shadow}")
+
+    with op.batch_alter_table(TABLE, schema=None) as batch_op:
+        batch_op.drop_column('search_text')
@@ -0,0 +1,37 @@
+"""Add a (business_id, original_receipt_number) index to return_records
+
+Revision ID: 3b9f6d2e8a41
+Revises: 8c4e2b7a9d16
+Create Date: 2026-10-18 19:26:40.913577
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f6d2e8a41'
+down_revision = '8c4e2b7a9d16'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_return_records_business_original_receipt'
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Built without blocking writes; CONCURRENTLY cannot run in a transaction.
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX, 'return_records', ['business_id', 'original_receipt_number'],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        with op.batch_alter_table('return_records', schema=None) as batch_op:
+            batch_op.create_index(INDEX, ['business_id', 'original_receipt_number'], unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index(INDEX, table_name='return_records', postgresql_concurrently=True, if_exists=True)
+    else:
+        with op.batch_alter_table('return_records', schema=None) as batch_op:
+            batch_op.drop_index(INDEX)
@@ -0,0 +1,119 @@
+"""Add sales_line_items and backfill it from items_sold_json
+
+Revision ID: 4f2a8c6e1d53
+Revises: b81d3e6c4a27
+Create Date: 2026-10-18 15:07:44.528913
+
+"""
+import json
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a8c6e1d53'
+down_revision = 'b81d3e6c4a27'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 1000
+
+sales_records = sa.table(
+    'sales_records',
+    sa.column('id', sa.String),
+    sa.column('business_id', sa.String),
+    sa.column('transaction_date', sa.DateTime),
+    sa.column('items_sold_json', sa.Text),
+)
+
+
+def _float(value, default=0.0):
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return default
+
+
+def _line_rows(sale):
+    """Same mapping as sales_lines.line_values(), frozen for this migration."""
+    try:
+        items = json.loads(sale.items_sold_json or '[]')
+    except (TypeError, ValueError):
+        return []
+    rows = []
+    for line_number, item in enumerate(items if isinstance(items, list) else []):
+        if not isinstance(item, dict):
+            continue
+        quantity = _float(item.get('quantity_sold', item.get('quantity')))
+        unit_price = _float(item.get('price_at_time_per_unit_sold', item.get('unit_price')))
+        line_total = item.get('item_total_amount', item.get('total_amount'))
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'sales_record_id': sale.id,
+            'business_id': sale.business_id,
+            'transaction_date': sale.transaction_date,
+            'line_number': line_number,
+            'product_id': str(item['product_id']) if item.get('product_id') else None,
+            'product_name': (item.get('product_name') or item.get('name') or 'Unknown Product')[:255],
+            'sale_unit_type': (item.get('sale_unit_type') or 'piece')[:20],
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'unit_cost': _float(item.get('cost_at_time_per_unit_sold'), None),
+            'line_total': _float(line_total) if line_total is not None else quantity * unit_price,
+            'quantity_returned': 0.0,
+            'refund_amount': 0.0,
+        })
+    return rows
+
+
+def upgrade():
+    sales_line_items = op.create_table('sales_line_items',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('sales_record_id', sa.String(length=36), nullable=False),
+    sa.Column('business_id', sa.String(length=36), nullable=False),
+    sa.Column('transaction_date', sa.DateTime(), nullable=False),
+    sa.Column('line_number', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.String(length=36), nullable=True),
+    sa.Column('product_name', sa.String(length=255), nullable=False),
+    sa.Column('sale_unit_type', sa.String(length=20), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('unit_price', sa.Float(), nullable=False),
+    sa.Column('unit_cost', sa.Float(), nullable=True),
+    sa.Column('line_total', sa.Float(), nullable=False),
+    sa.Column('quantity_returned', sa.Float(), nullable=False),
+    sa.Column('refund_amount', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.ForeignKeyConstraint(['sales_record_id'], ['sales_records.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sales_record_id', 'line_number', name='_sales_line_item_uc')
+    )
+
+    # Backfill in keyset-ordered chunks so a large sales_records table is never
+    # loaded at once; each chunk is inserted with one executemany. The index is
+    # built afterwards, once, instead of being maintained row by row.
+    bind = op.get_bind()
+    last_id = ''
+    while True:
+        chunk = bind.execute(
+            sa.select(sales_records)
+            .where(sales_records.c.id > last_id)
+            .order_by(sales_records.c.id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        rows = [row for sale in chunk for row in _line_rows(sale)]
+        if rows:
+            bind.execute(sales_line_items.insert(), rows)
+
+    op.create_index('ix_sales_line_items_business_product_date', 'sales_line_items',
+                    ['business_id', 'product_id', 'transaction_date'], unique=False)
+    # Returns recorded before this table existed: flask sales-lines backfill --with-returns
+
+
+def downgrade():
+    op.drop_index('ix_sales_line_items_business_product_date', table_name='sales_line_items')
+    op.drop_table('sales_line_items')
@@ -0,0 +1,39 @@
+"""Add period_aggregates table
+
+Revision ID: 5e8f0b7c2d19
+Revises: c3a1d9e4b702
+Create Date: 2026-10-18 10:02:47.530114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8f0b7c2d19'
+down_revision = 'c3a1d9e4b702'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('period_aggregates',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('business_id', sa.String(length=36), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('period_end', sa.Date(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('cost_of_goods_sold', sa.Float(), nullable=False),
+    sa.Column('vat_amount', sa.Float(), nullable=False),
+    sa.Column('nhil_amount', sa.Float(), nullable=False),
+    sa.Column('getfund_amount', sa.Float(), nullable=False),
+    sa.Column('covid_levy', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('business_id', 'period_start', 'period_end', name='_period_aggregate_uc')
+    )
+
+
+def downgrade():
+    op.drop_table('period_aggregates')
@@ -0,0 +1,59 @@
+"""Add (business_id, sort column, id) indexes for the keyset-paginated list views
+
+Revision ID: 5f2c8e1d7a93
+Revises: e7a14c9b3f58
+Create Date: 2026-10-18 21:03:18.204671
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5f2c8e1d7a93'
+down_revision = 'e7a14c9b3f58'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_sales_records_business_date_id', 'sales_records', ['business_id', 'transaction_date', 'id']),
+    ('ix_inventory_items_business_name_id', 'inventory_items', ['business_id', 'product_name', 'id']),
+    ('ix_rental_records_business_recorded_id', 'rental_records', ['business_id', 'date_recorded', 'id']),
+    ('ix_future_orders_business_order_date_id', 'future_orders', ['business_id', 'order_date', 'id']),
+    ('ix_invoices_business_created_id', 'invoices', ['business_id', 'created_at', 'id']),
+    ('ix_return_records_business_date_id', 'return_records', ['business_id', 'return_date', 'id']),
+    ('ix_companies_business_name_id', 'companies', ['business_id', 'name', 'id']),
+]
+# 9d4b6a1e8f30's (business_id, transaction_date) is a prefix of the first
+# index above, which serves its date ranges as well.
+SUPERSEDED = ('ix_sales_records_business_transaction_date', 'sales_records', ['business_id', 'transaction_date'])
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Built without blocking writes; CONCURRENTLY cannot run in a transaction.
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+            name, table, _ = SUPERSEDED
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.create_index(name, columns, unique=False)
+        name, table, _ = SUPERSEDED
+        op.drop_index(name, table_name=table, if_exists=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            name, table, columns = SUPERSEDED
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+            for name, table, _ in reversed(INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        name, table, columns = SUPERSEDED
+        op.create_index(name, table, columns, if_not_exists=True)
+        for name, table, _ in reversed(INDEXES):
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_index(name)
@@ -0,0 +1,48 @@
+"""Add sms_outbox
+
+Revision ID: 8c4e2b7a9d16
+Revises: d52e8a1c7f30
+Create Date: 2026-10-18 18:37:55.264081
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2b7a9d16'
+down_revision = 'd52e8a1c7f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sms_outbox',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('business_id', sa.String(length=36), nullable=True),
+    sa.Column('kind', sa.String(length=40), nullable=False),
+    sa.Column('to_phone', sa.String(length=20), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('dedupe_key', sa.String(length=200), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('provider_response', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('dedupe_key')
+    )
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.create_index('ix_sms_outbox_status_next_attempt', ['status', 'next_attempt_at'], unique=False)
+        batch_op.create_index('ix_sms_outbox_business_created', ['business_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sms_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_sms_outbox_business_created')
+        batch_op.drop_index('ix_sms_outbox_status_next_attempt')
+    op.drop_table('sms_outbox')
@@ -0,0 +1,38 @@
+"""Add product_barcodes (extra barcodes per inventory item)
+
+Revision ID: 9a3e5c7b1d24
+Revises: 5f2c8e1d7a93
+Create Date: 2026-10-18 21:48:09.315207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3e5c7b1d24'
+down_revision = '5f2c8e1d7a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_barcodes',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('business_id', sa.String(length=36), nullable=False),
+    sa.Column('item_id', sa.String(length=36), nullable=False),
+    sa.Column('barcode', sa.String(length=100), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.ForeignKeyConstraint(['item_id'], ['inventory_items.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('business_id', 'barcode', name='_product_barcode_business_uc')
+    )
+    with op.batch_alter_table('product_barcodes', schema=None) as batch_op:
+        batch_op.create_index('ix_product_barcodes_item', ['item_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product_barcodes', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_barcodes_item')
+    op.drop_table('product_barcodes')
@@ -0,0 +1,49 @@
+"""Add composite indexes for hot filters
+
+Revision ID: 9d4b6a1e8f30
+Revises: 5e8f0b7c2d19
+Create Date: 2026-10-18 11:20:14.208361
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b6a1e8f30'
+down_revision = '5e8f0b7c2d19'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_sales_records_business_transaction_date', 'sales_records', ['business_id', 'transaction_date']),
+    ('ix_inventory_items_business_active_type', 'inventory_items', ['business_id', 'is_active', 'item_type']),
+    ('ix_company_transactions_company_date', 'company_transactions', ['company_id', 'transaction_date']),
+    ('ix_rental_records_business_return_due', 'rental_records', ['business_id', 'return_date', 'due_date']),
+]
+
+
+def _is_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if _is_postgresql():
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block and
+        # does not lock the tables against writes while it builds.
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, table, _ in reversed(INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,145 @@
+"""Add search_text to sales and return records with trigram / FTS5 indexes
+
+Revision ID: a6d3f1b9e205
+Revises: 4f2a8c6e1d53
+Create Date: 2026-10-18 16:24:09.731552
+
+"""
+import json
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3f1b9e205'
+down_revision = '4f2a8c6e1d53'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 1000
+TABLES = ('sales_records', 'return_records')
+INDEXES = [
+    ('ix_sales_records_search_text_trgm', 'sales_records'),
+    ('ix_return_records_search_text_trgm', 'return_records'),
+]
+
+
+def _is_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+# Same text as history_search.sales_search_text()/return_search_text(), frozen here.
+def _phone_forms(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if not digits:
+        return []
+    local = '0' + digits[3:] if digits.startswith('233') and len(digits) > 9 else digits
+    return [digits, local]
+
+
+def _join(parts):
+    return ' | '.join(dict.fromkeys(str(part).strip().lower() for part in parts if part and str(part).strip()))
+
+
+def _sales_text(row):
+    try:
+        items = json.loads(row.items_sold_json or '[]')
+    except (TypeError, ValueError):
+        items = []
+    names = [item.get('product_name') for item in items if isinstance(item, dict)]
+    return _join([row.receipt_number, row.sales_person_name, *_phone_forms(row.customer_phone), *names])
+
+
+def _return_text(row):
+    return _join([row.return_receipt_number, row.original_receipt_number, row.customer_name,
+                  row.processed_by, *_phone_forms(row.customer_phone)])
+
+
+SOURCES = {
+    'sales_records': (('receipt_number', 'sales_person_name', 'customer_phone', 'items_sold_json'), _sales_text),
+    'return_records': (('return_receipt_number', 'original_receipt_number', 'customer_name', 'processed_by', 'customer_phone'), _return_text),
+}
+
+
+def _backfill(tablename):
+    """Fills search_text in keyset-ordered chunks, one executemany UPDATE per chunk."""
+    names, compute = SOURCES[tablename]
+    source = sa.table(tablename, sa.column('id', sa.String), sa.column('search_text', sa.Text),
+                      *[sa.column(name) for name in names])
+    bind = op.get_bind()
+    update = source.update().where(source.c.id == sa.bindparam('record_id')).values(search_text=sa.bindparam('text'))
+    last_id = ''
+    while True:
+        chunk = bind.execute(
+            sa.select(source).where(source.c.id > last_id).order_by(source.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        bind.execute(update, [{'record_id': row.id, 'text': compute(row)} for row in chunk])
+
+
+def _sqlite_ddl(tablename):
+    shadow, fts = f'{tablename}_search', f'{tablename}_fts'
+    return [
+        f"CREATE TABLE IF NOT EXISTS {shadow} ("
+        f"id INTEGER PRIMARY KEY, record_id VARCHAR(36) NOT NULL UNIQUE, search_text TEXT NOT NULL DEFAULT '')",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"search_text, content='{shadow}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_ai AFTER INSERT ON {tablename} BEGIN "
+        f"INSERT INTO {shadow}(record_id, search_text) VALUES (new.id, coalesce(new.search_text, '')); END",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_au AFTER UPDATE OF search_text ON {tablename} BEGIN "
+        f"UPDATE {shadow} SET search_text = coalesce(new.search_text, '') WHERE record_id = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {shadow}_ad AFTER DELETE ON {tablename} BEGIN "
+        f"DELETE FROM {shadow} WHERE record_id = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {shadow} BEGIN "
+        f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {shadow} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {shadow} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+        f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    ]
+
+
+def upgrade():
+    for tablename in TABLES:
+        with op.batch_alter_table(tablename, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('search_text', sa.Text(), nullable=True))
+        _backfill(tablename)
+
+    if _is_postgresql():
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        # Built without blocking writes; CONCURRENTLY cannot run in a transaction.
+        with op.get_context().autocommit_block():
+            for name, tablename in INDEXES:
+                op.create_index(name, tablename, ['search_text'], postgresql_using='gin',
+                                postgresql_ops={'search_text': 'gin_trgm_ops'},
+                                postgresql_concurrently=True, if_not_exists=True)
+    elif op.get_bind().dialect.name == 'sqlite':
+        for tablename in TABLES:
+            for statement in _sqlite_ddl(tablename):
+                op.execute(statement)
+            # The shadow table's insert trigger fills the FTS index.
+            op.execute(f"INSERT INTO {tablename}_search(record_id, search_text) "
+                       f"SELECT id, coalesce(search_text, '') FROM {tablename}")
+
+
+def downgrade():
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, tablename in INDEXES:
+                op.drop_index(name, table_name=tablename, postgresql_concurrently=True, if_exists=True)
+    elif op.get_bind().dialect.name == 'sqlite':
+        for tablename in TABLES:
+            shadow, fts = f'{tablename}_search', f'{tablename}_fts'
+            for trigger in (f'{shadow}_ai', f'{shadow}_au', f'{shadow}_ad', f'{fts}_ai', f'{fts}_ad', f'{fts}_au'):
+                op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            op.execute(f"DROP TABLE IF EXISTS {fts}")
+            op.execute(f"DROP TABLE IF EXISTS {shadow}")
+
+    for tablename in TABLES:
+        with op.batch_alter_table(tablename, schema=None) as batch_op:
+            batch_op.drop_column('search_text')
@@ -0,0 +1,38 @@
+"""Add inventory_items.reorder_point and is_low_stock
+
+Revision ID: b81d3e6c4a27
+Revises: e7c2f5a90b14
+Create Date: 2026-10-18 13:52:33.180442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81d3e6c4a27'
+down_revision = 'e7c2f5a90b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('inventory_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reorder_point', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('is_low_stock', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.create_index('ix_inventory_items_business_low_stock', ['business_id', 'is_low_stock'], unique=False)
+
+    # Initial fill with the default reorder point of 10 packs (current_stock
+    # is in tabs/pieces); run `flask low-stock rebuild` to apply
+    # REORDER_POINTS_BY_CATEGORY.
+    op.execute(sa.text(
+        "UPDATE inventory_items SET is_low_stock = (is_active = :true AND "
+        "current_stock <= 10 * CASE WHEN number_of_tabs > 0 THEN number_of_tabs ELSE 1 END)"
+    ).bindparams(true=True))
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_inventory_items_business_low_stock')
+        batch_op.drop_column('is_low_stock')
+        batch_op.drop_column('reorder_point')
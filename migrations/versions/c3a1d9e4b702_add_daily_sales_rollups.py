@@ -0,0 +1,39 @@
+"""Add daily_sales_rollups table
+
+Revision ID: c3a1d9e4b702
+Revises: 427576b0cf3e
+Create Date: 2026-10-18 09:12:31.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a1d9e4b702'
+down_revision = '427576b0cf3e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_sales_rollups',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('business_id', sa.String(length=36), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('sales_person_name', sa.String(length=100), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('transaction_count', sa.Integer(), nullable=False),
+    sa.Column('item_count', sa.Float(), nullable=False),
+    sa.Column('refund_amount', sa.Float(), nullable=False),
+    sa.Column('refund_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('business_id', 'day', 'sales_person_name', name='_daily_sales_rollup_uc')
+    )
+    # Populate it afterwards with: flask sales-rollups backfill
+
+
+def downgrade():
+    op.drop_table('daily_sales_rollups')
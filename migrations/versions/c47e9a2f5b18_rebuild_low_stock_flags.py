@@ -0,0 +1,32 @@
+"""Rebuild inventory_items.is_low_stock from current_stock in base units
+
+Revision ID: c47e9a2f5b18
+Revises: 2d8b6f4a1c57
+Create Date: 2026-10-18 23:40:07.516230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e9a2f5b18'
+down_revision = '2d8b6f4a1c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # b81d3e6c4a27 first filled the flag from current_stock * number_of_tabs,
+    # but current_stock is already in base units. Refill with per-item
+    # reorder points (base units), else the default of 10 packs; run
+    # `flask low-stock rebuild` to apply REORDER_POINTS_BY_CATEGORY.
+    op.execute(sa.text(
+        "UPDATE inventory_items SET is_low_stock = (is_active = :true AND current_stock <= "
+        "COALESCE(reorder_point, 10 * CASE WHEN number_of_tabs > 0 THEN number_of_tabs ELSE 1 END))"
+    ).bindparams(true=True))
+
+
+def downgrade():
+    # The flags stay as rebuilt; the multiplied values were wrong.
+    pass
@@ -0,0 +1,51 @@
+"""Add catalog_tombstones and an inventory (business_id, last_updated) index
+
+Revision ID: d52e8a1c7f30
+Revises: a6d3f1b9e205
+Create Date: 2026-10-18 17:41:12.508317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd52e8a1c7f30'
+down_revision = 'a6d3f1b9e205'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('catalog_tombstones',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('business_id', sa.String(length=36), nullable=True),
+    sa.Column('item_id', sa.String(length=36), nullable=True),
+    sa.Column('removed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('catalog_tombstones', schema=None) as batch_op:
+        batch_op.create_index('ix_catalog_tombstones_business_removed_at', ['business_id', 'removed_at'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # Built without blocking writes; CONCURRENTLY cannot run in a transaction.
+        with op.get_context().autocommit_block():
+            op.create_index('ix_inventory_items_business_last_updated', 'inventory_items',
+                            ['business_id', 'last_updated'], postgresql_concurrently=True, if_not_exists=True)
+    else:
+        with op.batch_alter_table('inventory_items', schema=None) as batch_op:
+            batch_op.create_index('ix_inventory_items_business_last_updated', ['business_id', 'last_updated'], unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_inventory_items_business_last_updated', table_name='inventory_items',
+                          postgresql_concurrently=True, if_exists=True)
+    else:
+        with op.batch_alter_table('inventory_items', schema=None) as batch_op:
+            batch_op.drop_index('ix_inventory_items_business_last_updated')
+
+    with op.batch_alter_table('catalog_tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_catalog_tombstones_business_removed_at')
+    op.drop_table('catalog_tombstones')
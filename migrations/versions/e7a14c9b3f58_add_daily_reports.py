@@ -0,0 +1,37 @@
+"""Add daily_reports and businesses.closing_time
+
+Revision ID: e7a14c9b3f58
+Revises: 3b9f6d2e8a41
+Create Date: 2026-10-18 20:12:46.731904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a14c9b3f58'
+down_revision = '3b9f6d2e8a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_reports',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('business_id', sa.String(length=36), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('report_json', sa.Text(), nullable=False),
+    sa.Column('generated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('business_id', 'day', name='_daily_report_uc')
+    )
+    with op.batch_alter_table('businesses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('closing_time', sa.String(length=5), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('businesses', schema=None) as batch_op:
+        batch_op.drop_column('closing_time')
+    op.drop_table('daily_reports')
@@ -0,0 +1,48 @@
+"""Add inventory_items.expiry_bucket
+
+Revision ID: e7c2f5a90b14
+Revises: 9d4b6a1e8f30
+Create Date: 2026-10-18 12:41:09.615207
+
+"""
+from datetime import date, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c2f5a90b14'
+down_revision = '9d4b6a1e8f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('inventory_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('expiry_bucket', sa.String(length=20), nullable=True))
+        batch_op.create_index('ix_inventory_items_business_expiry_bucket', ['business_id', 'expiry_bucket', 'expiry_date'], unique=False)
+
+    # Initial fill with the default thresholds; `flask expiry-buckets refresh`
+    # (and the first read of each day) applies the configured ones.
+    today = date.today()
+    op.execute(sa.text(
+        "UPDATE inventory_items SET expiry_bucket = CASE "
+        "WHEN expiry_date IS NULL THEN 'ok' "
+        "WHEN expiry_date < :today THEN 'expired' "
+        "WHEN expiry_date <= :critical THEN 'critical' "
+        "WHEN expiry_date <= :soon THEN 'soon' "
+        "WHEN expiry_date <= :watch THEN 'watch' "
+        "ELSE 'ok' END"
+    ).bindparams(
+        today=today,
+        critical=today + timedelta(days=30),
+        soon=today + timedelta(days=90),
+        watch=today + timedelta(days=180)
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_inventory_items_business_expiry_bucket')
+        batch_op.drop_column('expiry_bucket')
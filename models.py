@@ -20,6 +20,7 @@ class Business(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     last_synced_at = db.Column(db.DateTime, default=datetime.utcnow)
     remote_id = db.Column(db.String(36), nullable=True)
+    closing_time = db.Column(db.String(5), nullable=True)  # 'HH:MM' the end-of-day report runs; DAILY_REPORT_CLOSING_TIME when empty
     
     # Use back_populates to explicitly link to the 'business' relationship in the User model
     users = db.relationship('User', back_populates='business', lazy=True)
@@ -90,9 +91,19 @@ class SalesRecord(db.Model):
     receipt_number = db.Column(db.String(50), unique=True, nullable=True)
     reference_number = db.Column(db.String(100), nullable=True)
     synced_to_remote = db.Column(db.Boolean, default=False, nullable=False) 
+    search_text = db.Column(db.Text, nullable=True)  # Maintained by history_search
     
     # Foreign key relationship - CORRECTED TO USE back_populates
     business = db.relationship('Business', back_populates='sales_records') # <<< UPDATED LINE
+    # Normalized copy of items_sold_json, written by sales_lines.write_sale_lines()
+    line_items = db.relationship('SalesLineItem', back_populates='sales_record', lazy=True,
+                                 cascade='all, delete-orphan', order_by='SalesLineItem.line_number')
+
+    __table_args__ = (
+        db.Index('ix_sales_records_business_date_id', 'business_id', 'transaction_date', 'id'),  # Keyset pages, date ranges
+        db.Index('ix_sales_records_search_text_trgm', 'search_text', postgresql_using='gin',
+                 postgresql_ops={'search_text': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     def set_items_sold(self, items_list):
         self.items_sold_json = json.dumps(items_list)
@@ -129,12 +140,25 @@ class InventoryItem(db.Model):
     min_sale_price = db.Column(db.Float, default=0.0, nullable=False)  
     preferred_sale_price = db.Column(db.Float, default=0.0, nullable=False)
     max_sale_price = db.Column(db.Float, default=0.0, nullable=False)
+    # expired / critical / soon / watch / ok, maintained by expiry_buckets.py
+    expiry_bucket = db.Column(db.String(20), default='ok', nullable=True)
+    # Base units (tabs/pieces); NULL uses the category default, see low_stock.py
+    reorder_point = db.Column(db.Float, nullable=True)
+    is_low_stock = db.Column(db.Boolean, default=False, nullable=False)
+    search_text = db.Column(db.Text, nullable=True)  # Maintained by product_search
     business = db.relationship('Business', back_populates='inventory_items')
 
     __table_args__ = (
         db.UniqueConstraint('product_name', 'business_id', name='_product_name_business_uc'),
         # CORRECTED LINE: Composite unique index on business_id and barcode
         db.Index('idx_unique_active_barcode', 'business_id', 'barcode', unique=True, postgresql_where=db.text('barcode IS NOT NULL')),
+        db.Index('ix_inventory_items_business_active_type', 'business_id', 'is_active', 'item_type'),
+        db.Index('ix_inventory_items_business_expiry_bucket', 'business_id', 'expiry_bucket', 'expiry_date'),
+        db.Index('ix_inventory_items_business_low_stock', 'business_id', 'is_low_stock'),
+        db.Index('ix_inventory_items_business_last_updated', 'business_id', 'last_updated'),
+        db.Index('ix_inventory_items_business_name_id', 'business_id', 'product_name', 'id'),
+        db.Index('ix_inventory_items_search_text_trgm', 'search_text', postgresql_using='gin',
+                 postgresql_ops={'search_text': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
     )
 
     def __repr__(self):
@@ -221,6 +245,10 @@ class CompanyTransaction(db.Model):
     company = db.relationship('Company', back_populates='company_transactions')
     recorder = db.relationship('User', back_populates='company_transactions')
 
+    __table_args__ = (
+        db.Index('ix_company_transactions_company_date', 'company_id', 'transaction_date'),
+    )
+
     def __repr__(self):
         return f'<CompanyTransaction {self.transaction_type} - {self.amount}>'
 
@@ -249,6 +277,11 @@ class RentalRecord(db.Model):
     date_recorded = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     hirable_item = db.relationship('HirableItem', backref='rental_records_rel', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_rental_records_business_return_due', 'business_id', 'return_date', 'due_date'),
+        db.Index('ix_rental_records_business_recorded_id', 'business_id', 'date_recorded', 'id'),
+    )
+
     def __repr__(self):
         return f'<RentalRecord {self.item_name_at_rent} - {self.customer_name}>'
 
@@ -272,6 +305,10 @@ class Company(db.Model):
     # This assumes you have added 'company_id' column to CompanyTransaction model as previously advised.
     company_transactions = db.relationship('CompanyTransaction', back_populates='company', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_companies_business_name_id', 'business_id', 'name', 'id'),
+    )
+
     def calculate_current_balance(self):
         """
         Calculates the current balance for this company based on its transactions.
@@ -294,6 +331,15 @@ class Company(db.Model):
         balance = total_credits - total_debits
         return float(balance)
 
+    @staticmethod
+    def balance_sum():
+        """calculate_current_balance() as a SUM over CompanyTransaction rows, for queries grouped by company_id."""
+        return func.coalesce(func.sum(db.case(
+            (CompanyTransaction.transaction_type == 'Credit', CompanyTransaction.amount),
+            (CompanyTransaction.transaction_type == 'Debit', -CompanyTransaction.amount),
+            else_=0
+        )), 0.0)
+
     @property
     def total_creditors_amount(self):
         """
@@ -335,6 +381,10 @@ class FutureOrder(db.Model):
     company = db.relationship('Company', backref='future_orders_rel', lazy=True)
     business = db.relationship('Business', back_populates='future_orders')
 
+    __table_args__ = (
+        db.Index('ix_future_orders_business_order_date_id', 'business_id', 'order_date', 'id'),
+    )
+
     def set_order_details(self, details_list):
         self.order_details = json.dumps(details_list)
 
@@ -384,9 +434,17 @@ class ReturnRecord(db.Model):
     notes = db.Column(db.Text, nullable=True)
     is_synced = db.Column(db.Boolean, default=False, nullable=False)
     synced_to_remote = db.Column(db.Boolean, default=False, nullable=False)
+    search_text = db.Column(db.Text, nullable=True)  # Maintained by history_search
     
     # Relationship to Business
     business = db.relationship('Business', back_populates='return_records')
+
+    __table_args__ = (
+        db.Index('ix_return_records_business_original_receipt', 'business_id', 'original_receipt_number'),
+        db.Index('ix_return_records_business_date_id', 'business_id', 'return_date', 'id'),
+        db.Index('ix_return_records_search_text_trgm', 'search_text', postgresql_using='gin',
+                 postgresql_ops={'search_text': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
     
     def set_returned_items(self, items_list):
         """Store returned items as JSON"""
@@ -437,6 +495,11 @@ class Invoice(db.Model):
     # Relationships
     business = db.relationship('Business', backref='invoices', lazy=True)
     creator = db.relationship('User', backref='created_invoices', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_invoices_business_created_id', 'business_id', 'created_at', 'id'),
+    )
+
     def set_items(self, items_list):
         """Store invoice items as JSON"""
         self.items_json = json.dumps(items_list)
@@ -481,3 +544,151 @@ class InvoicePayment(db.Model):
     def __repr__(self):
         return f'<InvoicePayment {self.invoice_id} - GH₵{self.amount_paid:.2f}>'
 
+
+class DailySalesRollup(db.Model):
+    __tablename__ = 'daily_sales_rollups'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    business_id = db.Column(db.String(36), db.ForeignKey('businesses.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    sales_person_name = db.Column(db.String(100), nullable=False)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    item_count = db.Column(db.Float, nullable=False, default=0.0)  # Quantity sold across all lines
+    refund_amount = db.Column(db.Float, nullable=False, default=0.0)
+    refund_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('business_id', 'day', 'sales_person_name', name='_daily_sales_rollup_uc'),
+    )
+
+    def __repr__(self):
+        return f'<DailySalesRollup {self.business_id} {self.day} {self.sales_person_name} - GH₵{self.revenue:.2f}>'
+
+class PeriodAggregate(db.Model):
+    __tablename__ = 'period_aggregates'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    business_id = db.Column(db.String(36), db.ForeignKey('businesses.id'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    period_end = db.Column(db.Date, nullable=False)  # Inclusive
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    cost_of_goods_sold = db.Column(db.Float, nullable=False, default=0.0)
+    # VAT and levies at the standard rates; the report decides whether they apply
+    vat_amount = db.Column(db.Float, nullable=False, default=0.0)
+    nhil_amount = db.Column(db.Float, nullable=False, default=0.0)
+    getfund_amount = db.Column(db.Float, nullable=False, default=0.0)
+    covid_levy = db.Column(db.Float, nullable=False, default=0.0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('business_id', 'period_start', 'period_end', name='_period_aggregate_uc'),
+    )
+
+    def __repr__(self):
+        return f'<PeriodAggregate {self.business_id} {self.period_start}..{self.period_end} - GH₵{self.revenue:.2f}>'
+
+
+class SalesLineItem(db.Model):
+    __tablename__ = 'sales_line_items'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    sales_record_id = db.Column(db.String(36), db.ForeignKey('sales_records.id', ondelete='CASCADE'), nullable=False)
+    business_id = db.Column(db.String(36), db.ForeignKey('businesses.id'), nullable=False)
+    transaction_date = db.Column(db.DateTime, nullable=False)  # Copied from the sale for range filters
+    line_number = db.Column(db.Integer, nullable=False)  # Position in items_sold_json
+    product_id = db.Column(db.String(36), nullable=True)  # Legacy lines may only carry a name
+    product_name = db.Column(db.String(255), nullable=False)
+    sale_unit_type = db.Column(db.String(20), nullable=False, default='piece')
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    unit_price = db.Column(db.Float, nullable=False, default=0.0)
+    unit_cost = db.Column(db.Float, nullable=True)  # Purchase cost snapshot, when the sale recorded one
+    line_total = db.Column(db.Float, nullable=False, default=0.0)
+    quantity_returned = db.Column(db.Float, nullable=False, default=0.0)
+    refund_amount = db.Column(db.Float, nullable=False, default=0.0)
+
+    sales_record = db.relationship('SalesRecord', back_populates='line_items')
+
+    __table_args__ = (
+        db.UniqueConstraint('sales_record_id', 'line_number', name='_sales_line_item_uc'),
+        db.Index('ix_sales_line_items_business_product_date', 'business_id', 'product_id', 'transaction_date'),
+    )
+
+    def __repr__(self):
+        return f'<SalesLineItem {self.product_name} x{self.quantity} - GH₵{self.line_total:.2f}>'
+
+
+class CatalogTombstone(db.Model):
+    """An inventory item deleted from the POS catalog (see catalog.py)."""
+    __tablename__ = 'catalog_tombstones'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    business_id = db.Column(db.String(36), nullable=True)  # NULL: every business
+    item_id = db.Column(db.String(36), nullable=True)  # NULL: a bulk delete, clients reload in full
+    removed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.Index('ix_catalog_tombstones_business_removed_at', 'business_id', 'removed_at'),
+    )
+
+    def __repr__(self):
+        return f'<CatalogTombstone {self.business_id} {self.item_id or "reset"} {self.removed_at}>'
+
+
+class SmsMessage(db.Model):
+    """An outbound SMS and its delivery state (see sms_outbox.py)."""
+    __tablename__ = 'sms_outbox'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    business_id = db.Column(db.String(36), db.ForeignKey('businesses.id'), nullable=True)
+    kind = db.Column(db.String(40), nullable=False)  # e.g. 'sale_receipt', 'return_receipt', 'daily_report'
+    to_phone = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    dedupe_key = db.Column(db.String(200), unique=True, nullable=True)  # Queued at most once per key
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Lease of the process sending it
+    last_error = db.Column(db.Text, nullable=True)
+    provider_response = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_sms_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_sms_outbox_business_created', 'business_id', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<SmsMessage {self.kind} to {self.to_phone} - {self.status}>'
+
+
+class DailyReport(db.Model):
+    """A business's end-of-day sales report as stored by the scheduler (see daily_reports.py)."""
+    __tablename__ = 'daily_reports'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    business_id = db.Column(db.String(36), db.ForeignKey('businesses.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    report_json = db.Column(db.Text, nullable=False)  # The print_daily_sales_report context
+    generated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint('business_id', 'day', name='_daily_report_uc'),
+    )
+
+    def __repr__(self):
+        return f'<DailyReport {self.business_id} {self.day}>'
+
+
+class ProductBarcode(db.Model):
+    """An extra barcode of an inventory item, besides InventoryItem.barcode (see barcodes.py)."""
+    __tablename__ = 'product_barcodes'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    business_id = db.Column(db.String(36), db.ForeignKey('businesses.id'), nullable=False)
+    item_id = db.Column(db.String(36), db.ForeignKey('inventory_items.id', ondelete='CASCADE'), nullable=False)
+    barcode = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint('business_id', 'barcode', name='_product_barcode_business_uc'),
+        db.Index('ix_product_barcodes_item', 'item_id'),
+    )
+
+    def __repr__(self):
+        return f'<ProductBarcode {self.barcode} -> {self.item_id}>'
@@ -0,0 +1,167 @@
+# period_cache.py
+# Persisted revenue / COGS / VAT aggregates for closed reporting periods.
+#
+# A period is frozen once it ends before the lock date. Frozen periods are
+# computed once and read back from period_aggregates; open periods are always
+# computed live. A back-dated sale or return deletes the cached rows that
+# cover its day (see sales_rollups.record_sale/record_return). Periods with
+# legacy sale lines (no cost snapshot) are never stored: their COGS follows
+# current purchase prices.
+
+import os
+import logging
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import DailySalesRollup, PeriodAggregate
+from sales_rollups import rollup_revenue
+from cogs import compute_cogs
+
+logger = logging.getLogger(__name__)
+
+# GRA rates used by gra_tax_report (simplified, see the report notes)
+VAT_RATE = 0.15
+NHIL_RATE = 0.025
+GETFUND_RATE = 0.025
+COVID_LEVY_RATE = 0.01
+
+# Periods ending more than this many days ago are frozen, unless
+# TAX_PERIOD_LOCK_DATE pins an explicit lock date (YYYY-MM-DD).
+DEFAULT_LOCK_GRACE_DAYS = 15
+
+AGGREGATE_FIELDS = ('revenue', 'cost_of_goods_sold', 'vat_amount', 'nhil_amount', 'getfund_amount', 'covid_levy')
+
+
+def period_lock_date(today=None):
+    """Periods that end strictly before this date are frozen."""
+    configured = os.getenv('TAX_PERIOD_LOCK_DATE')
+    if configured:
+        try:
+            return datetime.strptime(configured, '%Y-%m-%d').date()
+        except ValueError:
+            logger.warning(f"Ignoring invalid TAX_PERIOD_LOCK_DATE '{configured}'.")
+    try:
+        grace_days = int(os.getenv('TAX_PERIOD_LOCK_GRACE_DAYS', DEFAULT_LOCK_GRACE_DAYS))
+    except ValueError:
+        grace_days = DEFAULT_LOCK_GRACE_DAYS
+    return (today or date.today()) - timedelta(days=grace_days)
+
+
+def is_frozen(period_end, today=None):
+    return period_end < period_lock_date(today)
+
+
+def taxes_for_revenue(revenue):
+    """VAT and levies on a revenue figure at the standard rates."""
+    vat_exclusive = revenue / (1 + VAT_RATE)
+    return {
+        'vat_amount': revenue * VAT_RATE,
+        'nhil_amount': vat_exclusive * NHIL_RATE,
+        'getfund_amount': vat_exclusive * GETFUND_RATE,
+        'covid_levy': vat_exclusive * COVID_LEVY_RATE,
+    }
+
+
+def _period_aggregates(business_id, period_start, period_end):
+    """(aggregates, costed_at_sale): costed_at_sale is False when a legacy line was costed from inventory."""
+    revenue = rollup_revenue(business_id, period_start, period_end)
+    cogs = compute_cogs(
+        business_id,
+        datetime.combine(period_start, datetime.min.time()),
+        datetime.combine(period_end + timedelta(days=1), datetime.min.time())
+    )
+    aggregates = {'revenue': revenue, 'cost_of_goods_sold': cogs['cost_of_goods_sold']}
+    aggregates.update(taxes_for_revenue(revenue))
+    return aggregates, not (cogs['lines_costed_from_inventory'] or cogs['lines_uncosted'])
+
+
+def compute_period_aggregates(business_id, period_start, period_end):
+    """Live computation for the inclusive day range [period_start, period_end]."""
+    return _period_aggregates(business_id, period_start, period_end)[0]
+
+
+def _rollup_state(connection, business_id, period_start, period_end, lock=False):
+    """
+    The period's rollup rows as (id, updated_at, transaction_count,
+    refund_count): every record_sale/record_return of a day in the period
+    changes them. `lock` waits for uncommitted bumps of existing rows.
+    """
+    statement = select(
+        DailySalesRollup.id, DailySalesRollup.updated_at,
+        DailySalesRollup.transaction_count, DailySalesRollup.refund_count
+    ).where(
+        DailySalesRollup.business_id == business_id,
+        DailySalesRollup.day >= period_start,
+        DailySalesRollup.day <= period_end
+    ).order_by(DailySalesRollup.id)
+    if lock:
+        statement = statement.with_for_update()
+    return [tuple(row) for row in connection.execute(statement)]
+
+
+def get_period_aggregates(business_id, period_start, period_end):
+    """
+    Aggregates for an inclusive day range, served from period_aggregates when
+    the period is frozen. Adds a 'cached' flag to the returned dict. Does not
+    touch the session's transaction.
+
+    A period is only stored when all its sale lines carry a cost snapshot:
+    legacy lines are costed at today's purchase prices, which a later price
+    edit changes, so such periods are computed live every time.
+    """
+    if period_end < period_start:
+        return dict({field: 0.0 for field in AGGREGATE_FIELDS}, cached=False)
+
+    if not is_frozen(period_end):
+        return dict(compute_period_aggregates(business_id, period_start, period_end), cached=False)
+
+    cached = PeriodAggregate.query.filter_by(
+        business_id=business_id, period_start=period_start, period_end=period_end
+    ).first()
+    if cached:
+        return dict({field: getattr(cached, field) for field in AGGREGATE_FIELDS}, cached=True)
+
+    state = _rollup_state(db.session, business_id, period_start, period_end)
+    aggregates, costed_at_sale = _period_aggregates(business_id, period_start, period_end)
+    if not costed_at_sale:
+        return dict(aggregates, cached=False)
+    # Stored on a connection of its own, so a read leaves the caller's
+    # transaction as it found it. A back-dated sale or return committed since
+    # `state` was read invalidated the period before this row existed, so the
+    # row is only written if the rollups are unchanged.
+    try:
+        with db.engine.begin() as connection:
+            if _rollup_state(connection, business_id, period_start, period_end, lock=True) != state:
+                logger.info(f"Not caching {period_start}..{period_end} for business {business_id}: it changed while computing.")
+                return dict(aggregates, cached=False)
+            connection.execute(insert(PeriodAggregate).values(
+                business_id=business_id, period_start=period_start, period_end=period_end, **aggregates
+            ))
+    except IntegrityError:
+        # Another worker cached the same period first; its values are equivalent.
+        pass
+    return dict(aggregates, cached=False)
+
+
+def invalidate_period_aggregates(business_id, day):
+    """Drops cached periods covering `day`, e.g. after a back-dated sale or return."""
+    return PeriodAggregate.query.filter(
+        PeriodAggregate.business_id == business_id,
+        PeriodAggregate.period_start <= day,
+        PeriodAggregate.period_end >= day
+    ).delete(synchronize_session=False)
+
+
+def invalidate_period_aggregates_in_range(business_id=None, start_day=None, end_day=None):
+    """Drops cached periods overlapping a day range (all of them when unbounded)."""
+    query = PeriodAggregate.query
+    if business_id:
+        query = query.filter(PeriodAggregate.business_id == business_id)
+    if start_day:
+        query = query.filter(PeriodAggregate.period_end >= start_day)
+    if end_day:
+        query = query.filter(PeriodAggregate.period_start <= end_day)
+    return query.delete(synchronize_session=False)
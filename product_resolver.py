@@ -0,0 +1,61 @@
+# product_resolver.py
+# Per-request lookup of inventory items by id or name.
+#
+# Report code that has to price sale lines from the current inventory builds
+# one ProductResolver and asks it for each line. The first lookup loads the
+# business's products with a single query into maps keyed by id and by
+# normalized name (case and runs of whitespace ignored); every later lookup
+# is a dict hit. Names that match no product exactly fall back to the first
+# product whose name contains them, as the old ilike('%name%') lookup did.
+
+import re
+
+from extensions import db
+from models import InventoryItem
+
+
+def normalize_name(name):
+    return re.sub(r'\s+', ' ', str(name or '')).strip().casefold()
+
+
+class ProductResolver:
+    """Resolves sale lines of one business to (id, product_name, sale_price) rows."""
+
+    def __init__(self, business_id):
+        self.business_id = business_id
+        self._by_id = None
+        self._by_name = None
+        self._contains_cache = {}
+
+    def _load(self):
+        if self._by_id is not None:
+            return
+        products = db.session.query(
+            InventoryItem.id, InventoryItem.product_name, InventoryItem.sale_price
+        ).filter(InventoryItem.business_id == self.business_id).order_by(InventoryItem.product_name).all()
+        self._by_id = {product.id: product for product in products}
+        self._by_name = {}
+        for product in products:
+            self._by_name.setdefault(normalize_name(product.product_name), product)
+
+    def _containing(self, name):
+        if name not in self._contains_cache:
+            self._contains_cache[name] = next(
+                (product for key, product in self._by_name.items() if name in key), None
+            )
+        return self._contains_cache[name]
+
+    def resolve(self, product_id=None, product_name=None):
+        """The product for a line's id, else its exact name, else the first name containing it; or None."""
+        if not self.business_id or not (product_id or product_name):
+            return None
+        self._load()
+        product = self._by_id.get(product_id) if product_id else None
+        name = normalize_name(product_name)
+        if product is None and name:
+            product = self._by_name.get(name) or self._containing(name)
+        return product
+
+    def sale_price(self, product_id=None, product_name=None):
+        product = self.resolve(product_id, product_name)
+        return float(product.sale_price) if product and product.sale_price else 0.0
@@ -0,0 +1,284 @@
+# product_search.py
+# Typeahead product search (GET /api/v1/products/search), also behind the
+# inventory pages' search box and the name fallback of the barcode lookup.
+#
+# Each InventoryItem keeps a lower-cased `search_text` (name, category, batch
+# number and barcode), set by a mapper hook on every write. On PostgreSQL it
+# carries a pg_trgm GIN index serving the per-term substring LIKE and
+# word_similarity(); on SQLite an FTS5 table with prefix indexes, over a
+# shadow copy kept by triggers (history_search.sqlite_search_ddl), matches
+# each term as a word prefix. Results are ranked by whether the name starts
+# with the first term, then by similarity (bm25 on SQLite), then by units sold
+# in the last VELOCITY_DAYS, and cut to the top N. The ranked ids are cached
+# per business and query for a short TTL and dropped when a committed write
+# changes an item's search text or active flag; the items are read fresh.
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import DDL, case, column, event, func, inspect, literal, literal_column, select, table, update
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import InventoryItem, SalesLineItem
+from history_search import sqlite_search_ddl
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+CANDIDATE_LIMIT = 200  # Best index matches re-ranked by sales velocity
+VELOCITY_DAYS = int(os.getenv('PRODUCT_SEARCH_VELOCITY_DAYS', 30))
+REBUILD_CHUNK_SIZE = 1000
+SEPARATOR = ' | '
+FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'"
+_TERM = re.compile(r'\w+')
+
+
+def product_search_text(item):
+    """search_text of an InventoryItem (or of a dict with the same keys)."""
+    get = item.get if isinstance(item, dict) else lambda key: getattr(item, key, None)
+    parts = (get('product_name'), get('category'), get('batch_number'), get('barcode'))
+    return SEPARATOR.join(dict.fromkeys(str(part).strip().lower() for part in parts if part and str(part).strip()))
+
+
+def search_terms(text):
+    """The distinct lower-cased words of a query, in order."""
+    return list(dict.fromkeys(_TERM.findall((text or '').lower())))
+
+
+@event.listens_for(InventoryItem, 'before_insert')
+@event.listens_for(InventoryItem, 'before_update')
+def _set_search_text(mapper, connection, target):
+    search_text = product_search_text(target)
+    if search_text != target.search_text or inspect(target).attrs.is_active.history.has_changes():
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('product_search_business_ids', set()).add(target.business_id)
+    if search_text != target.search_text:
+        target.search_text = search_text
+
+
+# SQLite: shadow and FTS5 tables, created with inventory_items (and by the migration)
+for _statement in sqlite_search_ddl(InventoryItem.__tablename__, FTS_OPTIONS):
+    event.listen(InventoryItem.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+# --- Querying ---
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _match(query, terms):
+    """`query` restricted to items matching every term, and its similarity score (higher is better)."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        tablename = InventoryItem.__tablename__
+        shadow = table(f'{tablename}_search', column('id'), column('record_id'))
+        fts = table(f'{tablename}_fts', column('rowid'), column('rank'))
+        match = ' AND '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+        query = query.join(shadow, shadow.c.record_id == InventoryItem.id).join(fts, fts.c.rowid == shadow.c.id).filter(
+            literal_column(f'{tablename}_fts').op('MATCH')(match)
+        )
+        return query, -fts.c.rank
+
+    for term in terms:
+        query = query.filter(InventoryItem.search_text.contains(term, autoescape=True))
+    if dialect == 'postgresql':
+        return query, func.word_similarity(' '.join(terms), InventoryItem.search_text)
+    return query, literal(0.0)
+
+
+def matching_items(business_id, text):
+    """
+    Query of the business's active items matching every term of `text`, for
+    callers to order and paginate. Returns None when `text` has no terms.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return None
+    query = InventoryItem.query.filter(InventoryItem.business_id == business_id, InventoryItem.is_active == True)
+    return _match(query, terms)[0]
+
+
+def _ranked_ids(business_id, terms, limit, now=None):
+    prefix = case(
+        (func.lower(InventoryItem.product_name).like(_escape_like(terms[0]) + '%', escape='\\'), 1),
+        else_=0
+    )
+    query = db.session.query(InventoryItem.id).filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_active == True
+    )
+    query, score = _match(query, terms)
+    candidates = query.add_columns(prefix.label('prefix'), score.label('score')).order_by(
+        prefix.desc(), score.desc(), InventoryItem.product_name
+    ).limit(CANDIDATE_LIMIT).all()
+    if not candidates:
+        return []
+
+    since = (now or datetime.now()) - timedelta(days=VELOCITY_DAYS)
+    velocity = dict(db.session.query(SalesLineItem.product_id, func.sum(SalesLineItem.quantity)).filter(
+        SalesLineItem.business_id == business_id,
+        SalesLineItem.product_id.in_([row.id for row in candidates]),
+        SalesLineItem.transaction_date >= since
+    ).group_by(SalesLineItem.product_id).all())
+    # Stable: equal keys keep the name order of the query
+    candidates.sort(key=lambda row: (-row.prefix, -round(row.score or 0.0, 2), -(velocity.get(row.id) or 0.0)))
+    return [row.id for row in candidates[:limit]]
+
+
+def search_products(business_id, text, limit=DEFAULT_LIMIT):
+    """The business's active items best matching `text`, best first, at most `limit`."""
+    terms = search_terms(text)
+    if not business_id or not terms:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    ids = product_search_cache.get_or_compute(
+        business_id, (' '.join(terms), limit), lambda: _ranked_ids(business_id, terms, limit)
+    )
+    if not ids:
+        return []
+    items = {item.id: item for item in InventoryItem.query.filter(
+        InventoryItem.id.in_(ids), InventoryItem.is_active == True
+    )}
+    return [items[item_id] for item_id in ids if item_id in items]
+
+
+# --- Cache ---
+
+class ProductSearchCache:
+    """Per-business LRU of ranked result ids, with version-counter invalidation and a TTL."""
+
+    def __init__(self, ttl_seconds, max_queries):
+        self.ttl_seconds = ttl_seconds
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+        self._entries = {}   # business_id -> OrderedDict(key -> (version, computed_at, ids))
+        self._versions = {}  # business_id -> int
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, business_id):
+        with self._lock:
+            self._versions[business_id] = self._versions.get(business_id, 0) + 1
+            self._entries.pop(business_id, None)
+
+    def get_or_compute(self, business_id, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries.setdefault(business_id, OrderedDict())
+            entry = entries.get(key)
+            version = self._versions.get(business_id, 0)
+            if entry and entry[0] == version and now - entry[1] < self.ttl_seconds:
+                entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        ids = compute()
+        with self._lock:
+            entries = self._entries.setdefault(business_id, OrderedDict())
+            # A write that landed while computing leaves the entry stale on purpose.
+            entries[key] = (version, now, ids)
+            entries.move_to_end(key)
+            while len(entries) > self.max_queries:
+                entries.popitem(last=False)
+        return ids
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            'entries': sum(len(entries) for entries in self._entries.values()),
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+
+product_search_cache = ProductSearchCache(
+    ttl_seconds=float(os.getenv('PRODUCT_SEARCH_CACHE_TTL', 60)),
+    max_queries=int(os.getenv('PRODUCT_SEARCH_CACHE_SIZE', 256)),
+)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_search_versions(session):
+    for business_id in session.info.pop('product_search_business_ids', ()):
+        product_search_cache.bump(business_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_writes(session):
+    session.info.pop('product_search_business_ids', None)
+
+
+# --- Rebuilding ---
+
+def rebuild_search_text(business_id=None, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Recomputes search_text for every item (e.g. after a Core bulk insert),
+    `chunk_size` rows per transaction; the SQLite triggers reindex changed
+    rows. Returns the number of rows changed.
+    """
+    source = InventoryItem.__table__.c
+    statement = select(
+        source.id, source.search_text, source.product_name, source.category, source.batch_number, source.barcode
+    ).order_by(source.id).limit(chunk_size)
+    if business_id:
+        statement = statement.where(source.business_id == business_id)
+
+    changed = 0
+    last_id = ''
+    while True:
+        chunk = db.session.execute(statement.where(source.id > last_id)).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        updates = []
+        for row in chunk:
+            search_text = product_search_text(row._asdict())
+            if search_text != row.search_text:
+                updates.append({'id': row.id, 'search_text': search_text})
+        if updates:
+            db.session.execute(update(InventoryItem), updates)
+        db.session.commit()
+        changed += len(updates)
+    return changed
+
+
+def rebuild_sqlite_index():
+    """Refills the SQLite shadow and FTS tables from inventory_items."""
+    tablename = InventoryItem.__tablename__
+    with db.engine.begin() as connection:
+        for statement in sqlite_search_ddl(tablename, FTS_OPTIONS):
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f"DELETE FROM {tablename}_search")
+        connection.exec_driver_sql(
+            f"INSERT INTO {tablename}_search(record_id, search_text) "
+            f"SELECT id, coalesce(search_text, '') FROM {tablename}"
+        )
+        connection.exec_driver_sql(f"INSERT INTO {tablename}_fts({tablename}_fts) VALUES ('rebuild')")
+
+
+# --- CLI: `flask product-search rebuild` ---
+
+product_search_cli = AppGroup('product-search', help='Maintain the product search index.')
+
+
+@product_search_cli.command('rebuild')
+@click.option('--business-id', default=None, help='Only recompute this business.')
+@click.option('--chunk-size', default=REBUILD_CHUNK_SIZE, show_default=True, help='Rows per batch.')
+def rebuild_command(business_id, chunk_size):
+    """Recompute inventory search_text (and on SQLite, rebuild the FTS tables)."""
+    changed = rebuild_search_text(business_id, chunk_size)
+    click.echo(f"Updated the search text of {changed} inventory items.")
+    if db.engine.dialect.name == 'sqlite':
+        rebuild_sqlite_index()
+        click.echo("Rebuilt the inventory full-text index.")
@@ -0,0 +1,211 @@
+# sales_ingest.py
+# Bulk, idempotent ingestion of whole sales pushed by offline terminals
+# (POST /api/v1/sales/bulk).
+#
+# Each sale carries the cart in add_sale's format and a client idempotency
+# key. The record id is derived from (business, key), so a retried push maps
+# to the same ids: every chunk of CHUNK_SIZE sales costs one IN query to find
+# what is already stored, one query for the product cost snapshots and one
+# executemany INSERT each for sales_records and sales_line_items, and is
+# committed on its own. Bulk inserts bypass the mapper hooks, so search_text,
+# the sale lines and the daily rollups are written, and the dashboard cache
+# bumped, here explicitly. As with api_record_sales, stock is not touched: the
+# terminal already took it.
+
+import os
+import json
+import uuid
+import logging
+from datetime import datetime
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import InventoryItem, SalesLineItem, SalesRecord
+from cogs import COST_KEY, unit_cost_for_item
+from dashboard_metrics import dashboard_cache
+from history_search import sales_search_text
+from sales_lines import sale_line_values
+from sales_rollups import record_sale_rows
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv('SALES_INGEST_CHUNK_SIZE', 200))
+MAX_SALES_PER_REQUEST = int(os.getenv('SALES_INGEST_MAX_SALES', 2000))
+SALE_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'global-business-app/sales-ingest')
+
+CREATED, DUPLICATE, CONFLICT, INVALID = 'created', 'duplicate', 'conflict', 'invalid'
+
+
+class InvalidSale(ValueError):
+    pass
+
+
+def sale_id_for(business_id, idempotency_key):
+    """The SalesRecord id of a pushed sale: stable across retries of the same key."""
+    return str(uuid.uuid5(SALE_ID_NAMESPACE, f'{business_id}:{idempotency_key}'))
+
+
+def _number(value, field):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise InvalidSale(f"'{field}' must be a number.")
+
+
+def _prepare(business_id, sale, default_sales_person):
+    """Validates one pushed sale and returns its sales_records row (lines still in items_sold_json)."""
+    if not isinstance(sale, dict):
+        raise InvalidSale('Each sale must be an object.')
+    key = str(sale.get('idempotency_key') or '').strip()
+    if not key or len(key) > 200:
+        raise InvalidSale("'idempotency_key' is required (at most 200 characters).")
+    items = sale.get('items')
+    if not isinstance(items, list) or not items:
+        raise InvalidSale("'items' must be a non-empty list.")
+
+    lines = []
+    for item in items:
+        if not isinstance(item, dict) or not (item.get('product_id') or item.get('product_name')):
+            raise InvalidSale('Each item needs a product_id or product_name.')
+        quantity = _number(item.get('quantity_sold'), 'quantity_sold')
+        if quantity <= 0:
+            raise InvalidSale(f"Quantity for '{item.get('product_name') or item.get('product_id')}' must be greater than zero.")
+        unit_price = _number(item.get('price_at_time_per_unit_sold', 0.0), 'price_at_time_per_unit_sold')
+        total = item.get('item_total_amount')
+        lines.append({
+            'product_id': str(item['product_id']) if item.get('product_id') else None,
+            'product_name': item.get('product_name'),
+            'quantity_sold': quantity,
+            'sale_unit_type': item.get('sale_unit_type') or 'pack',
+            'price_at_time_per_unit_sold': unit_price,
+            'item_total_amount': _number(total, 'item_total_amount') if total is not None else quantity * unit_price,
+        })
+
+    transaction_date = sale.get('transaction_date')
+    try:
+        transaction_date = datetime.fromisoformat(transaction_date) if transaction_date else datetime.now()
+    except (TypeError, ValueError):
+        raise InvalidSale("'transaction_date' must be an ISO 8601 date-time.")
+    if transaction_date.tzinfo:
+        transaction_date = transaction_date.astimezone().replace(tzinfo=None)  # Stored as local naive time
+    receipt_number = (sale.get('receipt_number') or '').strip() or None
+    if receipt_number and len(receipt_number) > 50:
+        raise InvalidSale("'receipt_number' is longer than 50 characters.")
+    grand_total = sale.get('grand_total_amount')
+
+    return {
+        'id': sale_id_for(business_id, key),
+        'business_id': business_id,
+        'transaction_date': transaction_date,
+        'customer_phone': (sale.get('customer_phone') or '').strip()[:20] or None,
+        'sales_person_name': (sale.get('sales_person_name') or default_sales_person or 'Unknown')[:100],
+        'grand_total_amount': _number(grand_total, 'grand_total_amount') if grand_total is not None
+                              else sum(line['item_total_amount'] for line in lines),
+        'payment_method': sale.get('payment_method'),
+        'receipt_number': receipt_number,
+        'reference_number': sale.get('reference_number'),
+        'is_synced': True,
+        'synced_to_remote': True,
+        'items_sold_json': lines,  # Serialized in _insert_chunk once costs are filled in
+    }, key
+
+
+def _insert_chunk(business_id, chunk):
+    """
+    Stores the new sales of one chunk [(position, key, row)] and returns
+    {position: (status, detail)}. Commits.
+    """
+    ids = [row['id'] for _, _, row in chunk]
+    receipts = [row['receipt_number'] for _, _, row in chunk if row['receipt_number']]
+    condition = SalesRecord.id.in_(ids)
+    if receipts:
+        condition = or_(condition, SalesRecord.receipt_number.in_(receipts))
+    stored = db.session.execute(select(SalesRecord.id, SalesRecord.receipt_number).where(condition)).all()
+    stored_ids = {row.id for row in stored}
+    taken_receipts = {row.receipt_number: row.id for row in stored if row.receipt_number}
+
+    results, new_rows = {}, []
+    for position, key, row in chunk:
+        if row['id'] in stored_ids:
+            results[position] = (DUPLICATE, row['id'])
+        elif row['receipt_number'] in taken_receipts:
+            results[position] = (CONFLICT, f"Receipt number '{row['receipt_number']}' belongs to another sale.")
+        else:
+            new_rows.append((position, row))
+            if row['receipt_number']:
+                taken_receipts[row['receipt_number']] = row['id']  # A later sale of this chunk conflicts
+    if not new_rows:
+        return results
+
+    product_ids = {line['product_id'] for _, row in new_rows for line in row['items_sold_json'] if line['product_id']}
+    products = {
+        product.id: product for product in InventoryItem.query.filter(
+            InventoryItem.business_id == business_id,
+            InventoryItem.id.in_(product_ids)
+        )
+    } if product_ids else {}
+
+    sales_rows, line_rows = [], []
+    for _, row in new_rows:
+        for line in row['items_sold_json']:
+            product = products.get(line['product_id'])
+            if product:
+                line['product_name'] = line['product_name'] or product.product_name
+                line[COST_KEY] = unit_cost_for_item(product, line['sale_unit_type'])
+            line['product_name'] = line['product_name'] or 'Unknown Product'
+        row = dict(row, items_sold_json=json.dumps(row['items_sold_json']))
+        row['search_text'] = sales_search_text(row)
+        sales_rows.append(row)
+        line_rows.extend(sale_line_values(row['id'], business_id, row['transaction_date'], row['items_sold_json']))
+
+    db.session.execute(insert(SalesRecord), sales_rows)
+    if line_rows:
+        db.session.execute(insert(SalesLineItem), line_rows)
+    record_sale_rows(sales_rows)
+    db.session.commit()
+    dashboard_cache.bump(business_id)  # Bulk inserts skip the flush hook that bumps it
+    for position, row in new_rows:
+        results[position] = (CREATED, row['id'])
+    return results
+
+
+def ingest_sales(business_id, sales, default_sales_person=None, chunk_size=CHUNK_SIZE):
+    """
+    Stores pushed sales and returns one result per input, in order:
+    {'index', 'idempotency_key', 'status', 'id'} with status created or
+    duplicate (already stored: safe to drop on the client), or
+    {'index', 'idempotency_key', 'status', 'error'} with status invalid or
+    conflict (will fail the same way if retried).
+    """
+    results = [None] * len(sales)
+    prepared, seen = [], {}
+    for position, sale in enumerate(sales):
+        key = sale.get('idempotency_key') if isinstance(sale, dict) else None
+        try:
+            row, key = _prepare(business_id, sale, default_sales_person)
+        except InvalidSale as e:
+            results[position] = {'index': position, 'idempotency_key': key, 'status': INVALID, 'error': str(e)}
+            continue
+        if key in seen:
+            results[position] = {'index': position, 'idempotency_key': key, 'status': DUPLICATE, 'id': row['id']}
+            continue
+        seen[key] = position
+        prepared.append((position, key, row))
+
+    for start in range(0, len(prepared), chunk_size):
+        chunk = prepared[start:start + chunk_size]
+        try:
+            outcome = _insert_chunk(business_id, chunk)
+        except IntegrityError:
+            # A concurrent push stored some of these first; the retry sees them as duplicates.
+            db.session.rollback()
+            logger.info(f"Retrying a sales ingest chunk for business {business_id} after a concurrent insert.")
+            outcome = _insert_chunk(business_id, chunk)
+        for position, key, _ in chunk:
+            status, detail = outcome[position]
+            result = {'index': position, 'idempotency_key': key, 'status': status}
+            result['id' if status in (CREATED, DUPLICATE) else 'error'] = detail
+            results[position] = result
+    return results
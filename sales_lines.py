@@ -0,0 +1,324 @@
+# sales_lines.py
+# Normalized sale lines (sales_line_items), one row per entry of items_sold_json.
+#
+# Every write path that creates a SalesRecord calls write_sale_lines() next to
+# record_sale(), so the lines commit (or roll back) together with the sale;
+# deleting a sale deletes its lines through the SalesRecord.line_items cascade.
+# Returns add to quantity_returned/refund_amount of the line they came from.
+# Product-level reports then aggregate these rows in SQL, served by the
+# (business_id, product_id, transaction_date) index, instead of loading and
+# parsing every sale's JSON in Python.
+
+import json
+import logging
+from collections import defaultdict
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, func, insert, select, update
+
+from extensions import db
+from models import InventoryItem, ReturnRecord, SalesLineItem, SalesRecord
+from cogs import COST_KEY
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = 1000
+DEFAULT_UNIT_TYPE = 'piece'
+QUANTITY_TOLERANCE = 1e-9  # Float slack when comparing returned and sold quantities
+
+
+def _float(value, default=0.0):
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return default
+
+
+def line_values(item, line_number):
+    """
+    Column values for one items_sold_json entry, or None if it is not a line.
+    Accepts the keys written by add_sale, api_record_sales and edits.
+    """
+    if not isinstance(item, dict):
+        return None
+    quantity = _float(item.get('quantity_sold', item.get('quantity')))
+    unit_price = _float(item.get('price_at_time_per_unit_sold', item.get('unit_price')))
+    line_total = item.get('item_total_amount', item.get('total_amount'))
+    return {
+        'line_number': line_number,
+        'product_id': str(item['product_id']) if item.get('product_id') else None,
+        'product_name': (item.get('product_name') or item.get('name') or 'Unknown Product')[:255],
+        'sale_unit_type': (item.get('sale_unit_type') or DEFAULT_UNIT_TYPE)[:20],
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'unit_cost': _float(item.get(COST_KEY), None),
+        'line_total': _float(line_total) if line_total is not None else quantity * unit_price,
+    }
+
+
+def sale_line_values(sale_id, business_id, transaction_date, items_sold_json):
+    """Rows to insert for one sale's items_sold_json; unparseable JSON yields none."""
+    try:
+        items = json.loads(items_sold_json or '[]')
+    except (TypeError, ValueError):
+        logger.warning(f"Skipping unparseable items_sold_json of sale {sale_id}.")
+        return []
+    rows = []
+    for line_number, item in enumerate(items if isinstance(items, list) else []):
+        values = line_values(item, line_number)
+        if values:
+            values.update(sales_record_id=sale_id, business_id=business_id, transaction_date=transaction_date)
+            rows.append(values)
+    return rows
+
+
+# --- Write paths ---
+
+def write_sale_lines(sale):
+    """
+    (Re)builds a SalesRecord's lines from its items_sold_json. Call it after
+    set_items_sold(); the lines are flushed with the sale. Does not commit.
+    """
+    lines = []
+    for line_number, item in enumerate(sale.get_items_sold()):
+        values = line_values(item, line_number)
+        if values:
+            lines.append(SalesLineItem(
+                business_id=sale.business_id,
+                transaction_date=sale.transaction_date,
+                **values
+            ))
+    sale.line_items = lines
+
+
+def apply_return_to_lines(original_sale, returned_items, sign=1):
+    """
+    Adds the returned quantities and refunds to the lines of the original sale.
+    Each returned item carries the 'line_number' it was selected from. Does not commit.
+    """
+    lines_by_number = {line.line_number: line for line in original_sale.line_items}
+    for returned in returned_items:
+        line = lines_by_number.get(returned.get('line_number'))
+        if line is None:
+            logger.warning(f"Return of '{returned.get('product_name')}' has no matching line on sale {original_sale.id}.")
+            continue
+        line.quantity_returned = (line.quantity_returned or 0.0) + sign * _float(returned.get('return_quantity'))
+        line.refund_amount = (line.refund_amount or 0.0) + sign * _float(returned.get('refund_amount'))
+
+
+def take_returned_quantities(original_sale, returned_items):
+    """
+    apply_return_to_lines() for a new return, guarded against returning more
+    than was sold: one conditional UPDATE adds every line's quantity only
+    where quantity - quantity_returned still covers it, so two returns of
+    the same receipt cannot both pass. Returns the line numbers that could
+    not take their quantity, in which case nothing was changed. Does not commit.
+    """
+    requested = defaultdict(lambda: [0.0, 0.0])
+    for returned in returned_items:
+        requested[returned.get('line_number')][0] += _float(returned.get('return_quantity'))
+        requested[returned.get('line_number')][1] += _float(returned.get('refund_amount'))
+    lines_by_number = {line.line_number: line for line in original_sale.line_items}
+    missing = [line_number for line_number in requested if line_number not in lines_by_number]
+    if missing or not requested:
+        return missing
+
+    by_id = {lines_by_number[line_number].id: amounts for line_number, amounts in requested.items()}
+    quantity = case({line_id: amounts[0] for line_id, amounts in by_id.items()}, value=SalesLineItem.id)
+    refund = case({line_id: amounts[1] for line_id, amounts in by_id.items()}, value=SalesLineItem.id)
+    savepoint = db.session.begin_nested()
+    result = db.session.execute(
+        update(SalesLineItem).where(
+            SalesLineItem.id.in_(by_id),
+            SalesLineItem.quantity - SalesLineItem.quantity_returned + QUANTITY_TOLERANCE >= quantity
+        ).values(
+            quantity_returned=SalesLineItem.quantity_returned + quantity,
+            refund_amount=SalesLineItem.refund_amount + refund
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(by_id):
+        savepoint.rollback()
+        return sorted(requested)
+    savepoint.commit()
+    for line_number in requested:
+        db.session.expire(lines_by_number[line_number], ['quantity_returned', 'refund_amount'])
+    return []
+
+
+def returned_quantities(sale_ids):
+    """{(sales_record_id, line_number): quantity returned} for the lines of these sales with returns."""
+    sale_ids = list(set(sale_ids))
+    returned = {}
+    for start in range(0, len(sale_ids), BACKFILL_CHUNK_SIZE):
+        rows = db.session.query(
+            SalesLineItem.sales_record_id, SalesLineItem.line_number, SalesLineItem.quantity_returned
+        ).filter(
+            SalesLineItem.sales_record_id.in_(sale_ids[start:start + BACKFILL_CHUNK_SIZE]),
+            SalesLineItem.quantity_returned != 0
+        )
+        returned.update(((sale_id, line_number), quantity) for sale_id, line_number, quantity in rows)
+    return returned
+
+
+# --- Backfill ---
+
+def backfill_sales_lines(business_id=None, chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Writes lines for sales that have none, walking sales_records in id order
+    `chunk_size` at a time and inserting each chunk with one executemany.
+    Commits per chunk. Returns (sales, lines) written.
+    """
+    has_lines = select(SalesLineItem.id).where(SalesLineItem.sales_record_id == SalesRecord.id).exists()
+    statement = select(
+        SalesRecord.id, SalesRecord.business_id, SalesRecord.transaction_date, SalesRecord.items_sold_json
+    ).where(~has_lines).order_by(SalesRecord.id).limit(chunk_size)
+    if business_id:
+        statement = statement.where(SalesRecord.business_id == business_id)
+
+    sales_written = lines_written = 0
+    last_id = ''
+    while True:
+        chunk = db.session.execute(statement.where(SalesRecord.id > last_id)).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        rows = []
+        for sale_id, sale_business_id, transaction_date, items_sold_json in chunk:
+            rows.extend(sale_line_values(sale_id, sale_business_id, transaction_date, items_sold_json))
+        if rows:
+            db.session.execute(insert(SalesLineItem), rows)
+        db.session.commit()
+        sales_written += len(chunk)
+        lines_written += len(rows)
+    return sales_written, lines_written
+
+
+def backfill_returned_quantities(business_id=None, chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Re-applies return history to the lines. Returns recorded before lines
+    existed carry no line number, so they are matched to the first line of
+    the receipt with the same product name and unit type. Does not commit.
+    """
+    lines = SalesLineItem.query.filter(
+        (SalesLineItem.quantity_returned != 0) | (SalesLineItem.refund_amount != 0))
+    if business_id:
+        lines = lines.filter(SalesLineItem.business_id == business_id)
+    lines.update({SalesLineItem.quantity_returned: 0.0, SalesLineItem.refund_amount: 0.0}, synchronize_session=False)
+
+    returns = ReturnRecord.query.order_by(ReturnRecord.id)
+    if business_id:
+        returns = returns.filter(ReturnRecord.business_id == business_id)
+    applied = 0
+    for return_record in returns.yield_per(chunk_size):
+        original_sale = SalesRecord.query.filter_by(
+            business_id=return_record.business_id,
+            receipt_number=return_record.original_receipt_number
+        ).first()
+        if not original_sale:
+            continue
+        returned_items = return_record.get_returned_items()
+        for returned in returned_items:
+            if returned.get('line_number') is None:
+                returned['line_number'] = next((
+                    line.line_number for line in original_sale.line_items
+                    if line.product_name == returned.get('product_name')
+                    and line.sale_unit_type == (returned.get('sale_unit_type') or DEFAULT_UNIT_TYPE)
+                ), None)
+        apply_return_to_lines(original_sale, returned_items)
+        applied += 1
+    return applied
+
+
+# --- Product-level reports ---
+
+def _lines_between(query, business_id, start=None, end=None):
+    query = query.filter(SalesLineItem.business_id == business_id)
+    if start:
+        query = query.filter(SalesLineItem.transaction_date >= start)
+    if end:
+        query = query.filter(SalesLineItem.transaction_date < end)
+    return query
+
+
+def product_sales(business_id, start=None, end=None, limit=None):
+    """
+    Per product and unit type, for sales in [start, end): units sold, units
+    returned, revenue, refunds and cost (snapshot lines only), best sellers first.
+    """
+    revenue = func.sum(SalesLineItem.line_total)
+    query = _lines_between(db.session.query(
+        SalesLineItem.product_id,
+        func.max(SalesLineItem.product_name).label('product_name'),
+        SalesLineItem.sale_unit_type,
+        func.sum(SalesLineItem.quantity).label('quantity_sold'),
+        func.sum(SalesLineItem.quantity_returned).label('quantity_returned'),
+        revenue.label('revenue'),
+        func.sum(SalesLineItem.refund_amount).label('refund_amount'),
+        func.sum(SalesLineItem.unit_cost * SalesLineItem.quantity).label('cost'),
+        func.count(func.distinct(SalesLineItem.sales_record_id)).label('receipt_count'),
+    ), business_id, start, end).group_by(
+        SalesLineItem.product_id,
+        # Name-only legacy lines are grouped by name; lines with an id by id
+        func.coalesce(SalesLineItem.product_id, SalesLineItem.product_name),
+        SalesLineItem.sale_unit_type
+    ).order_by(revenue.desc())
+    if limit:
+        query = query.limit(limit)
+    return [{
+        'product_id': row.product_id,
+        'product_name': row.product_name,
+        'sale_unit_type': row.sale_unit_type,
+        'quantity_sold': float(row.quantity_sold or 0.0),
+        'quantity_returned': float(row.quantity_returned or 0.0),
+        'revenue': float(row.revenue or 0.0),
+        'refund_amount': float(row.refund_amount or 0.0),
+        'cost': float(row.cost) if row.cost is not None else None,
+        'receipt_count': row.receipt_count,
+    } for row in query.all()]
+
+
+def product_quantity_summary(business_id, start=None, end=None):
+    """{'Name (unit)': quantity} as the daily report and SMS list it, plus the total quantity."""
+    rows = _lines_between(db.session.query(
+        SalesLineItem.product_name,
+        SalesLineItem.sale_unit_type,
+        func.sum(SalesLineItem.quantity)
+    ), business_id, start, end).group_by(
+        SalesLineItem.product_name, SalesLineItem.sale_unit_type
+    ).order_by(SalesLineItem.product_name, SalesLineItem.sale_unit_type).all()
+    summary = {f"{name} ({unit_type})": float(quantity or 0.0) for name, unit_type, quantity in rows}
+    return summary, sum(summary.values())
+
+
+def category_sales(business_id, start=None, end=None):
+    """[{category, quantity_sold, revenue}] joined to the current inventory category."""
+    revenue = func.sum(SalesLineItem.line_total)
+    rows = _lines_between(db.session.query(
+        func.coalesce(InventoryItem.category, 'Uncategorized'),
+        func.sum(SalesLineItem.quantity),
+        revenue
+    ).outerjoin(InventoryItem, InventoryItem.id == SalesLineItem.product_id), business_id, start, end).group_by(
+        func.coalesce(InventoryItem.category, 'Uncategorized')
+    ).order_by(revenue.desc()).all()
+    return [{'category': category, 'quantity_sold': float(quantity or 0.0), 'revenue': float(total or 0.0)}
+            for category, quantity, total in rows]
+
+
+# --- CLI: `flask sales-lines backfill` ---
+
+sales_lines_cli = AppGroup('sales-lines', help='Maintain the normalized sales_line_items table.')
+
+
+@sales_lines_cli.command('backfill')
+@click.option('--business-id', default=None, help='Only backfill this business.')
+@click.option('--chunk-size', default=BACKFILL_CHUNK_SIZE, show_default=True, help='Sales per batch.')
+@click.option('--with-returns', is_flag=True, help='Also re-apply return history to the lines.')
+def backfill_command(business_id, chunk_size, with_returns):
+    """Write lines for sales recorded before sales_line_items existed."""
+    sales_written, lines_written = backfill_sales_lines(business_id, chunk_size)
+    click.echo(f"Wrote {lines_written} lines for {sales_written} sales.")
+    if with_returns:
+        applied = backfill_returned_quantities(business_id, chunk_size)
+        db.session.commit()
+        click.echo(f"Applied {applied} returns to their sale lines.")
@@ -0,0 +1,306 @@
+# sales_rollups.py
+# Incrementally maintained per-day sales totals (daily_sales_rollups).
+#
+# Every write path that creates, edits or deletes a SalesRecord or ReturnRecord
+# calls record_sale()/record_return() inside its own transaction, so the rollup
+# rows commit (or roll back) together with the sale. Reports then sum a few
+# hundred rollup rows instead of scanning sales_records. The same hook drops
+# any cached closed-period aggregates (period_cache) covering the day and the
+# stored end-of-day report (daily_reports) of the day.
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import DailySalesRollup, SalesRecord, ReturnRecord
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_SALES_PERSON = 'Unknown'
+ROLLUP_FIELDS = ('revenue', 'transaction_count', 'item_count', 'refund_amount', 'refund_count')
+STREAM_CHUNK_SIZE = 1000
+
+
+def items_quantity(items_sold):
+    """Total quantity across the lines of an items_sold_json list."""
+    total = 0.0
+    for item in items_sold or []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            total += float(item.get('quantity_sold') or 0.0)
+        except (TypeError, ValueError):
+            continue
+    return total
+
+
+def _items_quantity_from_json(items_sold_json):
+    try:
+        return items_quantity(json.loads(items_sold_json or '[]'))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def day_bounds(start_day, end_day):
+    """Half-open datetime range [start_day 00:00, end_day + 1 00:00)."""
+    return (
+        datetime.combine(start_day, datetime.min.time()),
+        datetime.combine(end_day + timedelta(days=1), datetime.min.time()),
+    )
+
+
+def _bump(business_id, day, sales_person_name, **deltas):
+    """Adds deltas to one rollup row, creating it on first use."""
+    from period_cache import invalidate_period_aggregates
+    from daily_reports import invalidate_daily_report
+    invalidate_period_aggregates(business_id, day)
+    invalidate_daily_report(business_id, day)
+
+    sales_person_name = sales_person_name or UNKNOWN_SALES_PERSON
+    key_filter = (
+        DailySalesRollup.business_id == business_id,
+        DailySalesRollup.day == day,
+        DailySalesRollup.sales_person_name == sales_person_name,
+    )
+    values = {getattr(DailySalesRollup, field): getattr(DailySalesRollup, field) + delta
+              for field, delta in deltas.items()}
+    values[DailySalesRollup.updated_at] = datetime.utcnow()
+
+    if DailySalesRollup.query.filter(*key_filter).update(values, synchronize_session=False):
+        return
+
+    try:
+        # The savepoint keeps a concurrent insert of the same key from
+        # aborting the caller's transaction; we fall back to the UPDATE.
+        with db.session.begin_nested():
+            db.session.add(DailySalesRollup(
+                business_id=business_id,
+                day=day,
+                sales_person_name=sales_person_name,
+                **{field: deltas.get(field, 0) for field in ROLLUP_FIELDS}
+            ))
+    except IntegrityError:
+        DailySalesRollup.query.filter(*key_filter).update(values, synchronize_session=False)
+
+
+def record_sale(sale, sign=1):
+    """
+    Applies a SalesRecord to its rollup row. Pass sign=-1 before deleting the
+    record (or before replacing it during an edit) to take it back out.
+    """
+    if not sale.transaction_date:
+        return
+    _bump(
+        sale.business_id,
+        sale.transaction_date.date(),
+        sale.sales_person_name,
+        revenue=sign * float(sale.grand_total_amount or 0.0),
+        transaction_count=sign,
+        item_count=sign * items_quantity(sale.get_items_sold()),
+    )
+
+
+def record_sale_rows(rows):
+    """
+    record_sale() for many sales inserted without the ORM (sales_records
+    column dicts): one rollup bump per (business, day, sales person).
+    """
+    totals = {}
+    for row in rows:
+        if not row.get('transaction_date'):
+            continue
+        key = (row['business_id'], row['transaction_date'].date(), row.get('sales_person_name'))
+        total = totals.setdefault(key, {'revenue': 0.0, 'transaction_count': 0, 'item_count': 0.0})
+        total['revenue'] += float(row.get('grand_total_amount') or 0.0)
+        total['transaction_count'] += 1
+        total['item_count'] += _items_quantity_from_json(row.get('items_sold_json'))
+    for (business_id, day, sales_person_name), deltas in totals.items():
+        _bump(business_id, day, sales_person_name, **deltas)
+
+
+def record_return(return_record, sign=1):
+    """Applies a ReturnRecord's refund to the rollup row of the staff member who processed it."""
+    if not return_record.return_date:
+        return
+    _bump(
+        return_record.business_id,
+        return_record.return_date.date(),
+        return_record.processed_by,
+        refund_amount=sign * float(return_record.total_refund_amount or 0.0),
+        refund_count=sign,
+    )
+
+
+# --- Read helpers used by the reports ---
+
+def _rollup_query(columns, business_id, start_day=None, end_day=None):
+    query = db.session.query(*columns).filter(DailySalesRollup.business_id == business_id)
+    if start_day:
+        query = query.filter(DailySalesRollup.day >= start_day)
+    if end_day:
+        query = query.filter(DailySalesRollup.day <= end_day)
+    return query
+
+
+def rollup_totals(business_id, start_day=None, end_day=None):
+    """Revenue, transactions, items and refunds summed over an inclusive day range."""
+    row = _rollup_query(
+        [func.sum(getattr(DailySalesRollup, field)) for field in ROLLUP_FIELDS],
+        business_id, start_day, end_day
+    ).one()
+    return {field: (value or 0) for field, value in zip(ROLLUP_FIELDS, row)}
+
+
+def rollup_revenue(business_id, start_day=None, end_day=None):
+    return float(rollup_totals(business_id, start_day, end_day)['revenue'] or 0.0)
+
+
+def rollup_sales_by_person(business_id, start_day=None, end_day=None):
+    """[(sales_person_name, revenue), ...] ordered by revenue, highest first."""
+    revenue = func.sum(DailySalesRollup.revenue)
+    return _rollup_query(
+        [DailySalesRollup.sales_person_name, revenue], business_id, start_day, end_day
+    ).group_by(DailySalesRollup.sales_person_name).having(revenue != 0).order_by(revenue.desc()).all()
+
+
+# --- Backfill and consistency checking ---
+
+def _empty_rollup():
+    return {field: 0 for field in ROLLUP_FIELDS}
+
+
+def compute_rollups_from_source(business_id=None, start_day=None, end_day=None):
+    """
+    Recomputes rollups from sales_records and return_records, streaming the
+    rows in chunks. Returns {(business_id, day, sales_person_name): totals}.
+    """
+    expected = {}
+
+    sales_query = db.session.query(
+        SalesRecord.business_id, SalesRecord.transaction_date, SalesRecord.sales_person_name,
+        SalesRecord.grand_total_amount, SalesRecord.items_sold_json
+    )
+    returns_query = db.session.query(
+        ReturnRecord.business_id, ReturnRecord.return_date, ReturnRecord.processed_by,
+        ReturnRecord.total_refund_amount
+    )
+    if business_id:
+        sales_query = sales_query.filter(SalesRecord.business_id == business_id)
+        returns_query = returns_query.filter(ReturnRecord.business_id == business_id)
+    if start_day:
+        sales_query = sales_query.filter(SalesRecord.transaction_date >= day_bounds(start_day, start_day)[0])
+        returns_query = returns_query.filter(ReturnRecord.return_date >= day_bounds(start_day, start_day)[0])
+    if end_day:
+        sales_query = sales_query.filter(SalesRecord.transaction_date < day_bounds(end_day, end_day)[1])
+        returns_query = returns_query.filter(ReturnRecord.return_date < day_bounds(end_day, end_day)[1])
+
+    for sale_business_id, transaction_date, person, grand_total, items_json in sales_query.yield_per(STREAM_CHUNK_SIZE):
+        if not transaction_date:
+            continue
+        bucket = expected.setdefault((sale_business_id, transaction_date.date(), person or UNKNOWN_SALES_PERSON), _empty_rollup())
+        bucket['revenue'] += float(grand_total or 0.0)
+        bucket['transaction_count'] += 1
+        bucket['item_count'] += _items_quantity_from_json(items_json)
+
+    for return_business_id, return_date, person, refund in returns_query.yield_per(STREAM_CHUNK_SIZE):
+        if not return_date:
+            continue
+        bucket = expected.setdefault((return_business_id, return_date.date(), person or UNKNOWN_SALES_PERSON), _empty_rollup())
+        bucket['refund_amount'] += float(refund or 0.0)
+        bucket['refund_count'] += 1
+
+    return expected
+
+
+def _stored_rollups(business_id=None, start_day=None, end_day=None):
+    query = DailySalesRollup.query
+    if business_id:
+        query = query.filter(DailySalesRollup.business_id == business_id)
+    if start_day:
+        query = query.filter(DailySalesRollup.day >= start_day)
+    if end_day:
+        query = query.filter(DailySalesRollup.day <= end_day)
+    return query
+
+
+def rebuild_daily_sales_rollups(business_id=None, start_day=None, end_day=None):
+    """Replaces the rollups in scope with values recomputed from the source tables."""
+    from period_cache import invalidate_period_aggregates_in_range
+    expected = compute_rollups_from_source(business_id, start_day, end_day)
+    _stored_rollups(business_id, start_day, end_day).delete(synchronize_session=False)
+    invalidate_period_aggregates_in_range(business_id, start_day, end_day)
+    db.session.bulk_insert_mappings(DailySalesRollup, [
+        dict(business_id=key[0], day=key[1], sales_person_name=key[2], updated_at=datetime.utcnow(), **totals)
+        for key, totals in expected.items()
+    ])
+    db.session.commit()
+    return len(expected)
+
+
+def check_daily_sales_rollups(business_id=None, start_day=None, end_day=None, tolerance=0.005):
+    """
+    Compares stored rollups with the source tables.
+    Returns a list of mismatches; an empty list means the rollups are consistent.
+    """
+    expected = compute_rollups_from_source(business_id, start_day, end_day)
+    stored = {
+        (row.business_id, row.day, row.sales_person_name): {field: getattr(row, field) or 0 for field in ROLLUP_FIELDS}
+        for row in _stored_rollups(business_id, start_day, end_day)
+    }
+
+    mismatches = []
+    for key in set(expected) | set(stored):
+        expected_totals = expected.get(key, _empty_rollup())
+        stored_totals = stored.get(key, _empty_rollup())
+        differing = {
+            field: {'expected': expected_totals[field], 'stored': stored_totals[field]}
+            for field in ROLLUP_FIELDS
+            if abs((expected_totals[field] or 0) - (stored_totals[field] or 0)) > tolerance
+        }
+        if differing:
+            mismatches.append({
+                'business_id': key[0],
+                'day': key[1].isoformat(),
+                'sales_person_name': key[2],
+                'fields': differing,
+            })
+    return sorted(mismatches, key=lambda m: (m['business_id'], m['day'], m['sales_person_name']))
+
+
+# --- CLI: `flask sales-rollups backfill|check` ---
+
+sales_rollups_cli = AppGroup('sales-rollups', help='Maintain the daily_sales_rollups table.')
+
+
+def _parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+@sales_rollups_cli.command('backfill')
+@click.option('--business-id', default=None, help='Only rebuild this business.')
+@click.option('--start', default=None, help='First day to rebuild (YYYY-MM-DD).')
+@click.option('--end', default=None, help='Last day to rebuild (YYYY-MM-DD).')
+def backfill_command(business_id, start, end):
+    """Rebuild rollups from sales_records and return_records."""
+    count = rebuild_daily_sales_rollups(business_id, _parse_day(start), _parse_day(end))
+    click.echo(f"Rebuilt {count} daily sales rollup rows.")
+
+
+@sales_rollups_cli.command('check')
+@click.option('--business-id', default=None, help='Only check this business.')
+@click.option('--start', default=None, help='First day to check (YYYY-MM-DD).')
+@click.option('--end', default=None, help='Last day to check (YYYY-MM-DD).')
+def check_command(business_id, start, end):
+    """Report rollup rows that disagree with the source tables."""
+    mismatches = check_daily_sales_rollups(business_id, _parse_day(start), _parse_day(end))
+    for mismatch in mismatches:
+        click.echo(json.dumps(mismatch, default=str))
+    click.echo(f"{len(mismatches)} mismatching rollup rows.")
+    if mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,126 @@
+# sales_timeseries.py
+# Zero-filled, time-bucketed sales totals from a single GROUP BY query.
+
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import func
+
+from extensions import db
+from models import SalesRecord
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+MAX_BUCKETS = 2000
+
+
+def _bucket_expression(granularity):
+    """SQL expression truncating transaction_date to the start of its bucket."""
+    column = SalesRecord.transaction_date
+    if db.engine.dialect.name == 'sqlite':
+        if granularity == 'hour':
+            return func.strftime('%Y-%m-%d %H:00:00', column)
+        if granularity == 'day':
+            return func.date(column)
+        if granularity == 'week':
+            # 'weekday 0' moves to the coming Sunday; six days back is that week's Monday.
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m-01', column)
+    # PostgreSQL weeks start on Monday (ISO), matching the SQLite expression above.
+    return func.date_trunc(granularity, column)
+
+
+def truncate(moment, granularity):
+    """Python equivalent of _bucket_expression for a single datetime."""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day_start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return day_start
+    if granularity == 'week':
+        return day_start - timedelta(days=day_start.weekday())
+    return day_start.replace(day=1)
+
+
+def next_bucket(bucket_start, granularity):
+    if granularity == 'hour':
+        return bucket_start + timedelta(hours=1)
+    if granularity == 'day':
+        return bucket_start + timedelta(days=1)
+    if granularity == 'week':
+        return bucket_start + timedelta(days=7)
+    if bucket_start.month == 12:
+        return bucket_start.replace(year=bucket_start.year + 1, month=1)
+    return bucket_start.replace(month=bucket_start.month + 1)
+
+
+def _as_datetime(value):
+    """Normalizes the bucket value each dialect returns (str, date or datetime)."""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value))
+
+
+def bucket_starts(start, end, granularity):
+    """Start of every bucket overlapping the half-open range [start, end)."""
+    buckets = []
+    current = truncate(start, granularity)
+    while current < end:
+        buckets.append(current)
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError(f"Range too large for '{granularity}' buckets (limit {MAX_BUCKETS}).")
+        current = next_bucket(current, granularity)
+    return buckets
+
+
+def sales_timeseries(business_id, start, end, granularity='day'):
+    """
+    Sales totals per bucket for the half-open range [start, end).
+
+    Returns one entry per bucket, including empty ones:
+    {'bucket_start': datetime, 'amount': float, 'transactions': int}.
+    Raises ValueError for an unknown granularity or an oversized range.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'. Use one of: {', '.join(GRANULARITIES)}.")
+    if isinstance(start, date) and not isinstance(start, datetime):
+        start = datetime.combine(start, datetime.min.time())
+    if isinstance(end, date) and not isinstance(end, datetime):
+        end = datetime.combine(end, datetime.min.time())
+
+    buckets = bucket_starts(start, end, granularity)
+
+    bucket = _bucket_expression(granularity).label('bucket')
+    rows = db.session.query(
+        bucket,
+        func.sum(SalesRecord.grand_total_amount),
+        func.count(SalesRecord.id)
+    ).filter(
+        SalesRecord.business_id == business_id,
+        SalesRecord.transaction_date >= start,
+        SalesRecord.transaction_date < end
+    ).group_by(bucket).all()
+
+    totals = {_as_datetime(row[0]): (float(row[1] or 0.0), int(row[2] or 0)) for row in rows if row[0] is not None}
+    return [
+        {
+            'bucket_start': bucket_start,
+            'amount': totals.get(bucket_start, (0.0, 0))[0],
+            'transactions': totals.get(bucket_start, (0.0, 0))[1],
+        }
+        for bucket_start in buckets
+    ]
+
+
+def serialize_timeseries(series, granularity):
+    """JSON-friendly form of sales_timeseries() output."""
+    label_format = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}[granularity]
+    return [
+        {
+            'bucket_start': point['bucket_start'].isoformat(),
+            'label': point['bucket_start'].strftime(label_format),
+            'amount': point['amount'],
+            'transactions': point['transactions'],
+        }
+        for point in series
+    ]
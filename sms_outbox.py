@@ -0,0 +1,298 @@
+# sms_outbox.py
+# Outbound SMS queue (sms_outbox) and its background sender.
+#
+# Request handlers call enqueue_sms(), which stores the message and returns at
+# once; nothing in a request waits on the Arkesel gateway any more. A
+# dispatcher thread in each app process (started on the first request, or run
+# on its own with `flask sms-outbox work`) claims due messages with a
+# conditional UPDATE, so several processes never send the same row, sends them
+# through a small thread pool, and records the outcome on the row:
+#   pending -> sending -> sent
+#                      -> pending again, after an exponential backoff, when
+#                         the gateway is unreachable, times out or answers
+#                         429/5xx (up to SMS_MAX_ATTEMPTS)
+#                      -> failed, when the gateway rejects the message.
+# A message with a dedupe_key is only queued once for that key, and each
+# business may send at most SMS_RATE_PER_MINUTE messages a minute; the rest
+# wait for the next minute.
+
+import os
+import re
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+import requests
+from flask.cli import AppGroup
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import SmsMessage
+
+logger = logging.getLogger(__name__)
+
+ARKESEL_SMS_URL = os.getenv('ARKESEL_SMS_URL', 'https://sms.arkesel.com/sms/api')
+ARKESEL_API_KEY = os.getenv('ARKESEL_API_KEY')
+ARKESEL_SENDER_ID = os.getenv('ARKESEL_SENDER_ID', 'BizApp')  # Max 11 chars
+
+CONCURRENCY = int(os.getenv('SMS_WORKER_CONCURRENCY', 4))
+BATCH_SIZE = int(os.getenv('SMS_BATCH_SIZE', 20))
+POLL_SECONDS = float(os.getenv('SMS_POLL_SECONDS', 5))
+MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', 6))
+RETRY_BASE_SECONDS = float(os.getenv('SMS_RETRY_BASE_SECONDS', 30))
+RETRY_MAX_SECONDS = float(os.getenv('SMS_RETRY_MAX_SECONDS', 3600))
+RATE_PER_MINUTE = int(os.getenv('SMS_RATE_PER_MINUTE', 30))
+REQUEST_TIMEOUT = (5, 15)  # (connect, read) seconds
+# A claimed message not finished within this lease (the process died while
+# sending) becomes due again.
+LEASE = timedelta(seconds=int(os.getenv('SMS_LEASE_SECONDS', 120)))
+COUNTRY_CODE = '233'
+
+PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+
+
+def international_phone(phone):
+    """Digits in 233XXXXXXXXX form: a leading 0 is replaced by the country code, as Arkesel expects."""
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('0'):
+        return COUNTRY_CODE + digits[1:]
+    if digits and not digits.startswith(COUNTRY_CODE):
+        return COUNTRY_CODE + digits
+    return digits
+
+
+def enqueue_sms(business_id, phone, message, kind, dedupe_key=None):
+    """
+    Queues an SMS and wakes the sender. Returns (SmsMessage, created); when a
+    message with the same dedupe_key was already queued, that one is returned
+    with created=False. Commits.
+    """
+    if dedupe_key:
+        existing = SmsMessage.query.filter_by(dedupe_key=dedupe_key).first()
+        if existing:
+            return existing, False
+    sms = SmsMessage(business_id=business_id, to_phone=international_phone(phone), message=message,
+                     kind=kind, dedupe_key=dedupe_key, status=PENDING, next_attempt_at=datetime.now())
+    try:
+        with db.session.begin_nested():
+            db.session.add(sms)
+    except IntegrityError:
+        # Queued concurrently by another request with the same key.
+        db.session.commit()
+        return SmsMessage.query.filter_by(dedupe_key=dedupe_key).one(), False
+    db.session.commit()
+    _wake.set()
+    return sms, True
+
+
+def serialize_sms(sms):
+    return {
+        'id': sms.id,
+        'kind': sms.kind,
+        'to_phone': sms.to_phone,
+        'status': sms.status,
+        'attempts': sms.attempts,
+        'last_error': sms.last_error,
+        'created_at': sms.created_at.isoformat() if sms.created_at else None,
+        'next_attempt_at': sms.next_attempt_at.isoformat() if sms.next_attempt_at and sms.status == PENDING else None,
+        'sent_at': sms.sent_at.isoformat() if sms.sent_at else None,
+    }
+
+
+# --- Sending ---
+
+class RetryableError(Exception):
+    """The gateway could not be reached or asked us to come back later."""
+
+
+def send_via_gateway(http, phone, message):
+    """
+    Sends one SMS through the Arkesel v1 API. Returns (True, response text) on
+    success or (False, reason) when the gateway rejects it; raises
+    RetryableError for failures worth retrying.
+    """
+    if not ARKESEL_API_KEY:
+        return False, 'ARKESEL_API_KEY is not set.'
+    params = {'action': 'send-sms', 'api_key': ARKESEL_API_KEY, 'to': phone, 'from': ARKESEL_SENDER_ID, 'sms': message}
+    try:
+        response = http.get(ARKESEL_SMS_URL, params=params, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        raise RetryableError(f"{type(e).__name__}: {e}")
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(f"HTTP {response.status_code}")
+    if response.status_code >= 400:
+        return False, f"HTTP {response.status_code}: {response.text[:200]}"
+    try:
+        result = response.json()
+    except ValueError:
+        raise RetryableError(f"Unreadable gateway response: {response.text[:200]}")
+    if result.get('status') == 'success' or str(result.get('code')).lower() in ('ok', '200'):
+        return True, response.text[:500]
+    return False, str(result.get('message') or result)[:500]
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: about RETRY_BASE_SECONDS, doubling per attempt, capped."""
+    delay = min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def _sent_last_minute(now):
+    """{business_id: messages sent or being sent in the last minute}."""
+    rows = db.session.query(SmsMessage.business_id, func.count(SmsMessage.id)).filter(
+        or_(SmsMessage.sent_at >= now - timedelta(minutes=1), SmsMessage.status == SENDING)
+    ).group_by(SmsMessage.business_id).all()
+    return dict(rows)
+
+
+def claim_due_messages(now=None, limit=BATCH_SIZE):
+    """
+    Marks up to `limit` due messages as sending and returns them, respecting
+    each business's per-minute budget. Commits.
+    """
+    now = now or datetime.now()
+    due = SmsMessage.query.filter(or_(
+        (SmsMessage.status == PENDING) & (SmsMessage.next_attempt_at <= now),
+        (SmsMessage.status == SENDING) & (SmsMessage.locked_until < now)
+    )).order_by(SmsMessage.next_attempt_at).limit(limit * 4).all()
+
+    used = _sent_last_minute(now)
+    claimed = []
+    for sms in due:
+        if len(claimed) >= limit:
+            break
+        if used.get(sms.business_id, 0) >= RATE_PER_MINUTE:
+            continue
+        result = db.session.execute(
+            update(SmsMessage).where(
+                SmsMessage.id == sms.id,
+                or_(SmsMessage.status == PENDING, (SmsMessage.status == SENDING) & (SmsMessage.locked_until < now))
+            ).values(status=SENDING, locked_until=now + LEASE, attempts=SmsMessage.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:  # Otherwise another process claimed it first
+            used[sms.business_id] = used.get(sms.business_id, 0) + 1
+            claimed.append(sms.id)
+    db.session.commit()
+    return SmsMessage.query.filter(SmsMessage.id.in_(claimed)).all() if claimed else []
+
+
+def record_result(sms, outcome, now=None):
+    """Applies a send outcome: (True, detail), (False, reason) or a RetryableError. Does not commit."""
+    now = now or datetime.now()
+    sms.locked_until = None
+    if isinstance(outcome, Exception):
+        sms.last_error = str(outcome)[:500]
+        if sms.attempts >= MAX_ATTEMPTS:
+            sms.status = FAILED
+        else:
+            sms.status = PENDING
+            sms.next_attempt_at = now + retry_delay(sms.attempts)
+        return
+    delivered, detail = outcome
+    if delivered:
+        sms.status, sms.sent_at, sms.provider_response, sms.last_error = SENT, now, detail, None
+    else:
+        sms.status, sms.last_error = FAILED, detail
+
+
+class SmsDispatcher:
+    """Claims due messages and sends them CONCURRENCY at a time."""
+
+    def __init__(self, app, concurrency=CONCURRENCY):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='sms-send')
+        self.http = requests.Session()
+        self.batch_size = max(BATCH_SIZE, concurrency)
+
+    def _send(self, phone, message):
+        try:
+            return send_via_gateway(self.http, phone, message)
+        except RetryableError as e:
+            return e
+
+    def dispatch_once(self):
+        """Sends one batch of due messages. Returns how many were attempted."""
+        with self.app.app_context():
+            batch = claim_due_messages(limit=self.batch_size)
+            if not batch:
+                return 0
+            futures = {sms.id: self.executor.submit(self._send, sms.to_phone, sms.message) for sms in batch}
+            for sms in batch:
+                record_result(sms, futures[sms.id].result())
+                if sms.status != SENT:
+                    logger.warning(f"SMS {sms.id} ({sms.kind}) attempt {sms.attempts} not sent: {sms.last_error}")
+            db.session.commit()
+            return len(batch)
+
+    def run_forever(self, stop=None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                attempted = self.dispatch_once()
+            except Exception as e:
+                logger.exception(f"SMS dispatcher error: {e}")
+                attempted = 0
+            if not attempted:
+                _wake.wait(POLL_SECONDS)
+                _wake.clear()
+
+
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker_thread = None
+
+
+def start_worker(app):
+    """Starts this process's dispatcher thread once."""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=SmsDispatcher(app).run_forever, name='sms-dispatcher', daemon=True)
+            _worker_thread.start()
+
+
+def init_app(app):
+    """Starts the in-process sender on the first request (SMS_WORKER_IN_PROCESS=false leaves it to `flask sms-outbox work`)."""
+    if os.getenv('SMS_WORKER_IN_PROCESS', 'true').lower() != 'true' or app.testing:
+        return
+
+    @app.before_request
+    def _ensure_sms_worker():
+        if _worker_thread is None:
+            start_worker(app)
+
+
+# --- CLI: `flask sms-outbox work|status` ---
+
+sms_outbox_cli = AppGroup('sms-outbox', help='Send and inspect queued SMS.')
+
+
+@sms_outbox_cli.command('work')
+@click.option('--once', is_flag=True, help='Send the messages due now and exit.')
+def work_command(once):
+    """Run the SMS sender in the foreground."""
+    from flask import current_app
+    dispatcher = SmsDispatcher(current_app._get_current_object())
+    if once:
+        total = 0
+        while True:
+            attempted = dispatcher.dispatch_once()
+            if not attempted:
+                break
+            total += attempted
+        click.echo(f"Attempted {total} messages.")
+        return
+    click.echo("Sending queued SMS; press Ctrl+C to stop.")
+    dispatcher.run_forever()
+
+
+@sms_outbox_cli.command('status')
+def status_command():
+    """Count queued messages by status."""
+    for status, count in db.session.query(SmsMessage.status, func.count(SmsMessage.id)).group_by(SmsMessage.status):
+        click.echo(f"{status}: {count}")
@@ -0,0 +1,112 @@
+# stock_checkout.py
+# Concurrency-safe stock decrement for checkout.
+#
+# add_sale used to read each cart product with its own query, check the stock
+# in Python and write `current_stock -= qty`, so two cashiers selling the same
+# product could both pass the check and one decrement was lost. Checkout now:
+#   1. loads every cart product in one SELECT ... FOR UPDATE, ordered by id so
+#      concurrent carts lock rows in the same order and cannot deadlock;
+#   2. decrements them all with one conditional UPDATE (... WHERE current_stock
+#      >= quantity) in a savepoint, which is the authority on stock even where
+#      FOR UPDATE is a no-op (SQLite serializes the UPDATE instead);
+#   3. reloads the products so the mapper hooks (low-stock flag, expiry bucket)
+#      see the new stock when the sale is flushed.
+# The caller commits the sale in the same transaction, or rolls back on shortage.
+# Returns put stock back the same way: restock() adds to every product in one
+# UPDATE computed in SQL.
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, func, update
+
+from extensions import db
+from models import InventoryItem
+
+logger = logging.getLogger(__name__)
+
+
+def base_units(quantity, sale_unit_type, number_of_tabs):
+    """Stock units a sale line consumes: packs are multiplied out, tabs/pieces are not."""
+    if sale_unit_type in ('piece', 'tab'):
+        return quantity
+    return quantity * float(number_of_tabs or 1.0)
+
+
+def lock_products(business_id, product_ids):
+    """{id: InventoryItem} for the business's products, row-locked until commit."""
+    if not product_ids:
+        return {}
+    products = InventoryItem.query.filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.id.in_(set(product_ids))
+    ).order_by(InventoryItem.id).with_for_update().populate_existing().all()
+    return {product.id: product for product in products}
+
+
+def decrement_stock(business_id, quantities, products):
+    """
+    Takes {product_id: base units} off current_stock in one conditional UPDATE.
+    `products` are the rows from lock_products(). Returns the ids lacking stock,
+    in which case nothing was changed. On success the products are reloaded
+    with their new stock. Does not commit.
+    """
+    quantities = {product_id: float(quantity) for product_id, quantity in quantities.items() if quantity > 0}
+    short = [product_id for product_id, quantity in quantities.items()
+             if product_id not in products or (products[product_id].current_stock or 0.0) < quantity]
+    if short or not quantities:
+        return short
+
+    required = case(quantities, value=InventoryItem.id)
+    savepoint = db.session.begin_nested()
+    result = db.session.execute(
+        update(InventoryItem).where(
+            InventoryItem.business_id == business_id,
+            InventoryItem.id.in_(quantities),
+            InventoryItem.current_stock >= required
+        ).values(current_stock=InventoryItem.current_stock - required).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(quantities):
+        # Another checkout took the stock after we read it (possible where
+        # FOR UPDATE is a no-op): undo the rows that did match and report.
+        savepoint.rollback()
+        logger.info(f"Concurrent checkout took stock first for business {business_id}; rejecting the cart.")
+        products = lock_products(business_id, quantities)
+        short = [product_id for product_id, quantity in quantities.items()
+                 if product_id not in products or (products[product_id].current_stock or 0.0) < quantity]
+        return short or list(quantities)
+    savepoint.commit()
+
+    for product in lock_products(business_id, quantities).values():
+        product.last_updated = datetime.now()  # Marks it dirty so the mapper hooks recompute its flags
+    return []
+
+
+def checkout_quantities(cart_lines, products):
+    """{product_id: total base units} for validated cart lines [(product_id, quantity, sale_unit_type)]."""
+    totals = defaultdict(float)
+    for product_id, quantity, sale_unit_type in cart_lines:
+        totals[product_id] += base_units(quantity, sale_unit_type, products[product_id].number_of_tabs)
+    return dict(totals)
+
+
+def restock(business_id, quantities):
+    """
+    Adds {product_id: base units} back to current_stock in one UPDATE (the
+    SQL-side addition cannot lose a concurrent change) and reloads the
+    products. Does not commit.
+    """
+    quantities = {product_id: float(quantity) for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    added = case(quantities, value=InventoryItem.id)
+    db.session.execute(
+        update(InventoryItem).where(
+            InventoryItem.business_id == business_id,
+            InventoryItem.id.in_(quantities)
+        ).values(current_stock=func.coalesce(InventoryItem.current_stock, 0.0) + added)
+        .execution_options(synchronize_session=False)
+    )
+    for product in lock_products(business_id, quantities).values():
+        product.last_updated = datetime.now()  # Marks it dirty so the mapper hooks recompute its flags
@@ -0,0 +1,117 @@
+# stock_valuation.py
+# SQL-side stock valuation shared by dashboard(), reports() and the JSON APIs.
+
+from sqlalchemy import case, func, Float
+
+from extensions import db
+from models import InventoryItem
+
+
+def _tabs_expression():
+    """number_of_tabs with the same `or 1` fallback the Python loops used."""
+    tabs = func.coalesce(InventoryItem.number_of_tabs, 0)
+    return case((tabs == 0, 1), else_=tabs)
+
+
+def _per_base_unit(price_expression, tabs):
+    """Divides a pack price by the number of tabs, 0 when tabs is negative."""
+    return case((tabs > 0, db.cast(price_expression, Float) / tabs), else_=0.0)
+
+
+def stock_valuation_columns():
+    """
+    Returns (stock, cost_value, sale_value) SQL expressions for one inventory row.
+
+    The sale value follows the per-tab pricing rules used across the app:
+    fixed price first, then the pharmacy markup on purchase price, then the
+    hardware per-piece price, and finally the pack sale price.
+    """
+    tabs = _tabs_expression()
+    stock = func.coalesce(InventoryItem.current_stock, 0.0)
+
+    cost_per_base_unit = _per_base_unit(InventoryItem.purchase_price, tabs)
+    pharmacy_price = InventoryItem.purchase_price * (
+        1 + func.coalesce(InventoryItem.markup_percentage_pharmacy, 0.0) / 100.0
+    )
+    sale_per_base_unit = case(
+        (InventoryItem.is_fixed_price == True, _per_base_unit(func.coalesce(InventoryItem.fixed_sale_price, 0.0), tabs)),
+        (InventoryItem.item_type == 'Pharmacy', _per_base_unit(pharmacy_price, tabs)),
+        (InventoryItem.item_type == 'Hardware Material', func.coalesce(InventoryItem.unit_price_per_tab, 0.0)),
+        else_=_per_base_unit(func.coalesce(InventoryItem.sale_price, 0.0), tabs),
+    )
+    return stock, stock * cost_per_base_unit, stock * sale_per_base_unit
+
+
+def _margin(cost_value, sale_value):
+    profit = sale_value - cost_value
+    margin = (profit / sale_value) * 100 if sale_value > 0 else 0.0
+    return profit, margin
+
+
+def _empty_bucket():
+    return {'item_count': 0, 'stock': 0.0, 'cost_value': 0.0, 'sale_value': 0.0}
+
+
+def _finish_bucket(bucket):
+    bucket['potential_gross_profit'], bucket['profit_margin'] = _margin(bucket['cost_value'], bucket['sale_value'])
+    return bucket
+
+
+def compute_stock_valuation(business_id):
+    """
+    Values all active inventory of a business in a single GROUP BY query.
+
+    Returns a dict with the business-wide totals plus `by_category` and
+    `by_item_type` breakdowns. Every bucket carries item_count, stock,
+    cost_value, sale_value, potential_gross_profit and profit_margin.
+    """
+    stock, cost_value, sale_value = stock_valuation_columns()
+    rows = db.session.query(
+        InventoryItem.category,
+        InventoryItem.item_type,
+        func.count(InventoryItem.id),
+        func.sum(stock),
+        func.sum(cost_value),
+        func.sum(sale_value),
+    ).filter(
+        InventoryItem.business_id == business_id,
+        InventoryItem.is_active == True
+    ).group_by(InventoryItem.category, InventoryItem.item_type).all()
+
+    totals = _empty_bucket()
+    by_category = {}
+    by_item_type = {}
+    for category, item_type, item_count, stock_sum, cost_sum, sale_sum in rows:
+        values = {
+            'item_count': item_count or 0,
+            'stock': float(stock_sum or 0.0),
+            'cost_value': float(cost_sum or 0.0),
+            'sale_value': float(sale_sum or 0.0),
+        }
+        for bucket in (
+            totals,
+            by_category.setdefault(category or 'Uncategorized', _empty_bucket()),
+            by_item_type.setdefault(item_type or 'Unknown', _empty_bucket()),
+        ):
+            for key, value in values.items():
+                bucket[key] += value
+
+    _finish_bucket(totals)
+    for bucket in list(by_category.values()) + list(by_item_type.values()):
+        _finish_bucket(bucket)
+
+    return {
+        'total_items': totals['item_count'],
+        'total_stock': totals['stock'],
+        'cost_value': totals['cost_value'],
+        'sale_value': totals['sale_value'],
+        'potential_gross_profit': totals['potential_gross_profit'],
+        'profit_margin': totals['profit_margin'],
+        'by_category': by_category,
+        'by_item_type': by_item_type,
+    }
+
+
+def stocks_by_category(valuation):
+    """Stock quantity per category, in the shape reports.html expects."""
+    return {category: bucket['stock'] for category, bucket in valuation['by_category'].items()}
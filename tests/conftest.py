@@ -0,0 +1,58 @@
+# tests/conftest.py
+# Shared fixtures: a bare Flask app bound to extensions.db over a file-backed
+# SQLite database per test, a business to hang rows on, and the full
+# application for route tests.
+
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# No background threads while testing
+os.environ.setdefault('SMS_WORKER_IN_PROCESS', 'false')
+os.environ.setdefault('DAILY_REPORT_SCHEDULER_IN_PROCESS', 'false')
+
+from extensions import db  # noqa: E402
+from models import Business  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'test.db')
+    app.config['TESTING'] = True
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def business(app):
+    business = Business(name='Test Pharmacy', type='Pharmacy')
+    db.session.add(business)
+    db.session.commit()
+    return business
+
+
+@pytest.fixture(scope='session')
+def full_app(tmp_path_factory):
+    """The real application (app.create_app) over a file-backed SQLite database."""
+    os.environ.pop('DB_TYPE', None)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(tmp_path_factory.mktemp('full_app') / 'app.db')
+    from app import create_app
+
+    application = create_app()
+    application.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.engine.dispose()
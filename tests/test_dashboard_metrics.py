@@ -0,0 +1,90 @@
+# tests/test_dashboard_metrics.py
+# Committed writes, ORM or bulk, bump the business's dashboard cache version;
+# rolled back ones do not.
+
+from datetime import date, timedelta
+
+from sqlalchemy import update
+
+import expiry_buckets
+from extensions import db
+from dashboard_metrics import dashboard_cache
+from expiry_buckets import OK, ensure_expiry_buckets_current
+from low_stock import rebuild_low_stock_flags
+from models import InventoryItem
+from sales_ingest import CREATED, ingest_sales
+from stock_checkout import decrement_stock, lock_products, restock
+
+
+def _item(business, name):
+    return InventoryItem(business_id=business.id, product_name=name, category='General', purchase_price=1.0,
+                         sale_price=2.0, current_stock=10.0, item_type='Pharmacy')
+
+
+def test_savepoint_rollback_keeps_the_outer_writes(business):
+    version = dashboard_cache.version(business.id)
+    db.session.add(_item(business, 'Kept'))
+    db.session.flush()
+    with db.session.begin_nested() as savepoint:
+        db.session.add(_item(business, 'Discarded'))
+        db.session.flush()
+        savepoint.rollback()
+    db.session.commit()
+    assert dashboard_cache.version(business.id) == version + 1
+
+
+def test_outer_rollback_discards_the_writes(business):
+    version = dashboard_cache.version(business.id)
+    db.session.add(_item(business, 'Discarded'))
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert dashboard_cache.version(business.id) == version
+
+
+def test_bulk_ingest_bumps_the_cache(business):
+    version = dashboard_cache.version(business.id)
+    results = ingest_sales(business.id, [{
+        'idempotency_key': 'terminal-1:0001',
+        'items': [{'product_name': 'Loose item', 'quantity_sold': 2, 'price_at_time_per_unit_sold': 3.0}],
+    }])
+    assert results[0]['status'] == CREATED
+    assert dashboard_cache.version(business.id) > version
+
+
+def test_bulk_stock_updates_bump_the_cache(business):
+    item = _item(business, 'Checked Out')
+    db.session.add(item)
+    db.session.commit()
+    version = dashboard_cache.version(business.id)
+
+    products = lock_products(business.id, [item.id])
+    assert decrement_stock(business.id, {item.id: 4.0}, products) == []
+    db.session.commit()
+    assert dashboard_cache.version(business.id) == version + 1
+
+    restock(business.id, {item.id: 1.0})
+    db.session.commit()
+    assert dashboard_cache.version(business.id) == version + 2
+
+
+def test_bulk_update_of_every_business_bumps_them_all(business):
+    version = dashboard_cache.version(business.id)
+    rebuild_low_stock_flags()
+    db.session.commit()
+    assert dashboard_cache.version(business.id) == version + 1
+
+
+def test_expiry_bucket_refresh_bumps_the_cache(business, monkeypatch):
+    monkeypatch.setattr(expiry_buckets, '_refreshed_on', {})
+    item = _item(business, 'Expired Yesterday')
+    item.expiry_date = date.today() - timedelta(days=1)
+    db.session.add(item)
+    db.session.commit()
+    db.session.execute(update(InventoryItem).values(expiry_bucket=OK))
+    db.session.commit()
+    version = dashboard_cache.version(business.id)
+
+    ensure_expiry_buckets_current(business.id)
+
+    assert dashboard_cache.version(business.id) > version
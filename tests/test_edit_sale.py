@@ -0,0 +1,50 @@
+# tests/test_edit_sale.py
+# A sale with returns cannot be edited: the edit would restock the returned
+# quantity a second time and reset quantity_returned on the rebuilt lines.
+
+import json
+import uuid
+from datetime import datetime
+
+from extensions import db
+from models import Business, InventoryItem, ReturnRecord, SalesLineItem, SalesRecord
+from sales_lines import apply_return_to_lines, write_sale_lines
+
+
+def test_sale_with_returns_is_not_edited(full_app):
+    business = Business(name='Edit Guard Pharmacy', type='Pharmacy')
+    db.session.add(business)
+    db.session.flush()
+    product = InventoryItem(business_id=business.id, product_name='Amoxicillin', category='Antibiotics',
+                            purchase_price=12.0, sale_price=18.0, current_stock=95.0, item_type='Pharmacy',
+                            number_of_tabs=1)
+    db.session.add(product)
+    db.session.flush()
+    item = {'product_id': product.id, 'product_name': 'Amoxicillin', 'quantity_sold': 5.0, 'sale_unit_type': 'pack',
+            'price_at_time_per_unit_sold': 18.0, 'item_total_amount': 90.0}
+    sale = SalesRecord(business_id=business.id, transaction_date=datetime.now(), sales_person_name='Tester',
+                       grand_total_amount=90.0, receipt_number='EDIT-' + uuid.uuid4().hex[:8])
+    sale.set_items_sold([item])
+    write_sale_lines(sale)
+    db.session.add(sale)
+    returned = dict(item, line_number=0, return_quantity=2.0, refund_amount=36.0)
+    db.session.add(ReturnRecord(business_id=business.id, original_receipt_number=sale.receipt_number,
+                                return_receipt_number='RET-' + uuid.uuid4().hex[:8], processed_by='Tester',
+                                total_refund_amount=36.0, returned_items_json=json.dumps([returned])))
+    apply_return_to_lines(sale, [returned])
+    product.current_stock += 2.0  # Restocked by the return
+    db.session.commit()
+    business_id, product_id, receipt_number = business.id, product.id, sale.receipt_number
+
+    client = full_app.test_client()
+    with client.session_transaction() as session:
+        session.update(username='tester', role='admin', business_id=business_id, business_type='Pharmacy')
+    response = client.post(f'/sales/edit_transaction/{receipt_number}', data={
+        'customer_phone': '', 'sales_person_name': 'Tester', 'cart_items_json': json.dumps([dict(item, quantity_sold=4.0)])
+    })
+
+    assert response.status_code == 302
+    db.session.remove()
+    assert db.session.get(InventoryItem, product_id).current_stock == 97.0
+    line = SalesLineItem.query.join(SalesRecord).filter(SalesRecord.receipt_number == receipt_number).one()
+    assert (line.quantity, line.quantity_returned) == (5.0, 2.0)
@@ -0,0 +1,53 @@
+# tests/test_expiry_buckets.py
+# The once-a-day refresh moves stale buckets without ending the caller's
+# transaction or marking the moved items as edited.
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import inspect, update
+
+import expiry_buckets
+from expiry_buckets import EXPIRED, OK, ensure_expiry_buckets_current, refresh_expiry_buckets
+from extensions import db
+from models import InventoryItem
+
+
+def test_refresh_leaves_the_session_transaction_alone(business, monkeypatch):
+    monkeypatch.setattr(expiry_buckets, '_refreshed_on', {})
+    item = InventoryItem(business_id=business.id, product_name='Old Stock', category='General', purchase_price=1.0,
+                         sale_price=2.0, current_stock=5.0, item_type='Pharmacy',
+                         expiry_date=date.today() - timedelta(days=3))
+    db.session.add(item)
+    db.session.commit()
+    db.session.execute(update(InventoryItem).values(expiry_bucket=OK))  # As stored before the date passed
+    db.session.commit()
+
+    business.name  # Loaded, in an open transaction
+    transaction = db.session().get_transaction()
+
+    ensure_expiry_buckets_current(business.id)
+
+    assert db.session().get_transaction() is transaction
+    assert 'name' not in inspect(business).expired_attributes
+    db.session.rollback()
+    assert db.session.get(InventoryItem, item.id).expiry_bucket == EXPIRED
+
+
+def test_refresh_keeps_last_updated(business, monkeypatch):
+    monkeypatch.setattr(expiry_buckets, '_refreshed_on', {})
+    edited = datetime(2026, 1, 5, 9, 0)
+    item = InventoryItem(business_id=business.id, product_name='Old Stock', category='General', purchase_price=1.0,
+                         sale_price=2.0, current_stock=5.0, item_type='Pharmacy',
+                         expiry_date=date.today() - timedelta(days=3))
+    db.session.add(item)
+    db.session.commit()
+    db.session.execute(update(InventoryItem).values(expiry_bucket=OK, last_updated=edited))
+    db.session.commit()
+
+    ensure_expiry_buckets_current(business.id)
+    assert refresh_expiry_buckets(business.id) == 0  # Already current
+
+    db.session.expire_all()
+    item = db.session.get(InventoryItem, item.id)
+    assert item.expiry_bucket == EXPIRED
+    assert item.last_updated == edited
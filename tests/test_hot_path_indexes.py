@@ -0,0 +1,101 @@
+# tests/test_hot_path_indexes.py
+# Migrations 9d4b6a1e8f30 and 5f2c8e1d7a93: the half-open day range on
+# sales_records and the (business_id, is_active, item_type) inventory filter
+# search the new indexes, where the date()-wrapped day filter they replaced
+# scans.
+
+import importlib.util
+import os
+from datetime import date
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from extensions import db
+from models import InventoryItem, SalesRecord
+from sales_rollups import day_bounds
+
+VERSIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations', 'versions')
+MIGRATIONS = ('9d4b6a1e8f30_add_hot_path_composite_indexes.py', '5f2c8e1d7a93_add_keyset_pagination_indexes.py')
+
+
+def _load_migration(filename):
+    spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(VERSIONS, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def migrations(app):
+    """The schema as it was before the migrations' indexes."""
+    hot_path, keyset = (_load_migration(filename) for filename in MIGRATIONS)
+    with db.engine.begin() as connection:
+        for name, _, _ in hot_path.INDEXES + keyset.INDEXES:
+            connection.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+    return hot_path, keyset
+
+
+@pytest.fixture
+def migrated(migrations):
+    """The same schema upgraded through both migrations."""
+    with db.engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            for migration in migrations:
+                migration.upgrade()
+    return migrations
+
+
+def _plan(query):
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')).all()
+    return ' | '.join(row[-1] for row in rows)
+
+
+def test_migrations_create_their_indexes(migrated):
+    hot_path, keyset = migrated
+    with db.engine.connect() as connection:
+        existing = {row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    superseded = keyset.SUPERSEDED[0]
+    assert superseded not in existing
+    assert {name for name, _, _ in hot_path.INDEXES + keyset.INDEXES} - {superseded} <= existing
+
+
+def _todays_sales_by_date_function():
+    """The predicate the day filters used before: the column wrapped in date()."""
+    return SalesRecord.query.filter_by(business_id='b').filter(
+        db.func.date(SalesRecord.transaction_date) == date(2026, 10, 18))
+
+
+def _todays_sales_by_half_open_range():
+    today_start, tomorrow_start = day_bounds(date(2026, 10, 18), date(2026, 10, 18))
+    return SalesRecord.query.filter_by(business_id='b').filter(
+        SalesRecord.transaction_date >= today_start,
+        SalesRecord.transaction_date < tomorrow_start
+    )
+
+
+def test_day_filter_scanned_sales_records_before(migrations):
+    plan = _plan(_todays_sales_by_date_function())
+    assert 'SCAN sales_records' in plan, plan
+
+
+def test_date_function_cannot_bound_the_index(migrated):
+    # Even with the composite index, date(transaction_date) leaves only the
+    # business_id prefix usable: every sale of the business is read.
+    plan = _plan(_todays_sales_by_date_function())
+    assert 'transaction_date' not in plan, plan
+
+
+def test_half_open_day_range_searches_the_date_index(migrated):
+    plan = _plan(_todays_sales_by_half_open_range())
+    assert 'SEARCH sales_records USING INDEX ix_sales_records_business_date_id' in plan, plan
+    assert 'transaction_date>' in plan and 'transaction_date<' in plan, plan
+
+
+def test_active_item_type_filter_searches_the_inventory_index(migrated):
+    plan = _plan(InventoryItem.query.filter_by(business_id='b', is_active=True, item_type='Pharmacy'))
+    assert 'SEARCH inventory_items USING INDEX ix_inventory_items_business_active_type' in plan, plan
+    assert 'item_type=' in plan, plan
@@ -0,0 +1,38 @@
+# tests/test_inventory_import.py
+# A product_name repeated within one upload is imported from its first row;
+# the later rows are reported, not silently written over it.
+
+import csv
+import io
+
+from inventory_import import import_inventory_csv
+from models import InventoryItem
+
+CSV = (
+    "product_name,category,purchase_price,current_stock\n"
+    "Paracetamol,General,5,100\n"
+    "Amoxicillin,Antibiotics,12,40\n"
+    "Paracetamol,General,6,7\n"
+)
+
+
+def test_repeated_product_name_is_reported(business, tmp_path):
+    report_path = tmp_path / 'report.csv'
+
+    totals = import_inventory_csv(business.id, io.BytesIO(CSV.encode()), 'Pharmacy', str(report_path), chunk_size=10)
+
+    assert totals == {'added': 2, 'updated': 0, 'errors': 1}
+    paracetamol = InventoryItem.query.filter_by(business_id=business.id, product_name='Paracetamol').one()
+    assert (paracetamol.purchase_price, paracetamol.current_stock) == (5.0, 100.0)
+    with open(report_path, newline='', encoding='utf-8') as f:
+        [error] = list(csv.DictReader(f))
+    assert error['line'] == '4' and 'Duplicate of line 2' in error['error']
+    assert error['current_stock'] == '7'
+
+
+def test_repeat_in_a_later_chunk_is_reported_too(business, tmp_path):
+    totals = import_inventory_csv(business.id, io.BytesIO(CSV.encode()), 'Pharmacy', str(tmp_path / 'report.csv'),
+                                  chunk_size=1)
+
+    assert totals == {'added': 2, 'updated': 0, 'errors': 1}
+    assert InventoryItem.query.filter_by(product_name='Paracetamol').one().current_stock == 100.0
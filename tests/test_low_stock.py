@@ -0,0 +1,67 @@
+# tests/test_low_stock.py
+# current_stock is in base units: it is compared to the reorder point as is,
+# by the mapper hook and by the SQL rebuild alike.
+
+import pytest
+
+from extensions import db
+from low_stock import is_low_stock, low_stock_query, rebuild_low_stock_flags
+from models import InventoryItem
+
+
+@pytest.fixture
+def items(business):
+    def item(name, **fields):
+        values = dict(category='General', purchase_price=10.0, sale_price=12.0, item_type='Pharmacy',
+                      number_of_tabs=10, reorder_point=20.0)
+        values.update(fields)
+        return InventoryItem(business_id=business.id, product_name=name, **values)
+
+    db.session.add_all([
+        item('Five Tabs Left', current_stock=5.0),                # 5 tabs, not 50
+        item('At Reorder Point', current_stock=20.0),
+        item('Plenty', current_stock=21.0),                       # Multiplied, 210 tabs
+        item('Default Point', current_stock=8.0, reorder_point=None, number_of_tabs=1),
+        item('Inactive', current_stock=0.0, is_active=False),
+    ])
+    db.session.commit()
+    return business
+
+
+def _low_names(business_id):
+    return sorted(item.product_name for item in low_stock_query(business_id))
+
+
+def test_flags_compare_base_units_to_the_reorder_point(items):
+    assert _low_names(items.id) == ['At Reorder Point', 'Default Point', 'Five Tabs Left']
+    for item in InventoryItem.query.filter_by(business_id=items.id):
+        assert item.is_low_stock == is_low_stock(item), item.product_name
+
+
+def test_rebuild_matches_the_mapper_hook(items):
+    db.session.execute(db.update(InventoryItem).values(is_low_stock=False))
+    db.session.commit()
+
+    rebuild_low_stock_flags(items.id)
+    db.session.commit()
+
+    assert _low_names(items.id) == ['At Reorder Point', 'Default Point', 'Five Tabs Left']
+
+
+def test_category_default_is_packs_times_tabs(business):
+    # Default of 10 packs: a 100-tab item is low at 1000 tabs, not at 10
+    db.session.add_all([
+        InventoryItem(business_id=business.id, product_name=name, category='General', purchase_price=10.0,
+                      sale_price=12.0, item_type='Pharmacy', number_of_tabs=100, current_stock=stock)
+        for name, stock in [('Five Packs Left', 500.0), ('Fifteen Packs Left', 1500.0)]
+    ])
+    db.session.commit()
+
+    assert _low_names(business.id) == ['Five Packs Left']
+
+    db.session.execute(db.update(InventoryItem).values(is_low_stock=False))
+    db.session.commit()
+    rebuild_low_stock_flags(business.id)
+    db.session.commit()
+
+    assert _low_names(business.id) == ['Five Packs Left']
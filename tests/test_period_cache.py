@@ -0,0 +1,62 @@
+# tests/test_period_cache.py
+# Caching a frozen period must not end the caller's transaction, and must not
+# store figures that changed while they were being computed.
+
+from datetime import date, datetime
+
+from sqlalchemy import inspect, update
+
+import period_cache
+from extensions import db
+from models import DailySalesRollup, PeriodAggregate, SalesRecord
+from period_cache import get_period_aggregates
+from sales_rollups import record_sale
+
+
+def test_caching_leaves_the_session_transaction_alone(business):
+    business.name  # Loaded, in an open transaction
+    transaction = db.session().get_transaction()
+
+    first = get_period_aggregates(business.id, date(2020, 1, 1), date(2020, 1, 31))
+
+    assert first['cached'] is False
+    assert db.session().get_transaction() is transaction
+    assert 'name' not in inspect(business).expired_attributes
+    assert PeriodAggregate.query.count() == 1
+    assert get_period_aggregates(business.id, date(2020, 1, 1), date(2020, 1, 31))['cached'] is True
+
+
+def _january_sale(business, **line):
+    sale = SalesRecord(business_id=business.id, transaction_date=datetime(2020, 1, 15, 10, 30), sales_person_name='Ama',
+                       grand_total_amount=20.0, receipt_number=f'JAN-{len(line)}')
+    sale.set_items_sold([dict({'product_name': 'Paracetamol', 'quantity_sold': 2.0, 'sale_unit_type': 'pack',
+                               'price_at_time_per_unit_sold': 10.0, 'item_total_amount': 20.0}, **line)])
+    db.session.add(sale)
+    record_sale(sale)
+    db.session.commit()
+
+
+def test_period_changed_while_computing_is_not_cached(business, monkeypatch):
+    _january_sale(business, cost_at_time_per_unit_sold=6.0)
+    compute = period_cache._period_aggregates
+
+    def compute_then_back_date_a_sale(*args):
+        result = compute(*args)
+        with db.engine.begin() as connection:  # Another request records a January return meanwhile
+            connection.execute(update(DailySalesRollup).values(
+                refund_count=DailySalesRollup.refund_count + 1, updated_at=datetime.utcnow()))
+        return result
+
+    monkeypatch.setattr(period_cache, '_period_aggregates', compute_then_back_date_a_sale)
+    assert get_period_aggregates(business.id, date(2020, 1, 1), date(2020, 1, 31))['cached'] is False
+    assert PeriodAggregate.query.count() == 0
+
+
+def test_period_with_legacy_lines_is_not_cached(business):
+    _january_sale(business)  # No cost snapshot: costed at current purchase prices
+
+    aggregates = get_period_aggregates(business.id, date(2020, 1, 1), date(2020, 1, 31))
+
+    assert aggregates['revenue'] == 20.0
+    assert PeriodAggregate.query.count() == 0
+    assert get_period_aggregates(business.id, date(2020, 1, 1), date(2020, 1, 31))['cached'] is False
@@ -0,0 +1,96 @@
+# tests/test_sales_page_queries.py
+# The sales page costs the same number of statements whatever the number of
+# sales (and sale lines) on it: no per-sale or per-line queries.
+
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import Business, InventoryItem, SalesRecord
+from sales_lines import write_sale_lines
+
+LINES_PER_SALE = 3
+
+
+@pytest.fixture
+def shop(full_app):
+    business = Business(name=f'Query Count Pharmacy {uuid.uuid4().hex[:8]}', type='Pharmacy')
+    db.session.add(business)
+    db.session.flush()
+    products = [InventoryItem(business_id=business.id, product_name=f'Product {n}', category='General',
+                              purchase_price=5.0, sale_price=8.0, current_stock=1000.0, item_type='Pharmacy',
+                              number_of_tabs=10, expiry_date=date.today() + timedelta(days=20 * n))
+                for n in range(1, 6)]
+    db.session.add_all(products)
+    db.session.commit()
+    return business.id, [product.id for product in products]
+
+
+def _add_sales(business_id, product_ids, count):
+    now = datetime.now()
+    for n in range(count):
+        sale = SalesRecord(id=str(uuid.uuid4()), business_id=business_id, transaction_date=now - timedelta(minutes=n),
+                           sales_person_name='Tester', grand_total_amount=24.0, receipt_number=uuid.uuid4().hex[:12])
+        sale.set_items_sold([{
+            'product_id': product_ids[(n + line) % len(product_ids)],
+            'product_name': f'Line {line}',
+            'quantity_sold': 1.0,
+            'sale_unit_type': 'pack',
+            'price_at_time_per_unit_sold': 8.0,
+            'item_total_amount': 8.0,
+        } for line in range(LINES_PER_SALE)])
+        write_sale_lines(sale)
+        db.session.add(sale)
+    db.session.commit()
+
+
+def _statements_for_sales_page(client, url='/sales?per_page=200'):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return response.get_data(as_text=True), statements
+
+
+def test_sales_page_statement_count_does_not_grow_with_sales(full_app, shop):
+    business_id, product_ids = shop
+    client = full_app.test_client()
+    with client.session_transaction() as session:
+        session.update(username='tester', role='admin', business_id=business_id, business_type='Pharmacy')
+
+    _add_sales(business_id, product_ids, 10)
+    client.get('/sales?per_page=200')  # Once-a-day work (expiry bucket refresh) out of the way
+    page, with_10 = _statements_for_sales_page(client)
+    assert page.count('Line 2') == 10
+
+    _add_sales(business_id, product_ids, 90)
+    page, with_100 = _statements_for_sales_page(client)
+    assert page.count('Line 2') == 100
+
+    assert len(with_10) == len(with_100), (with_10, with_100)
+
+
+def test_invalid_date_still_reads_one_page(full_app, shop):
+    business_id, product_ids = shop
+    client = full_app.test_client()
+    with client.session_transaction() as session:
+        session.update(username='tester', role='admin', business_id=business_id, business_type='Pharmacy')
+    _add_sales(business_id, product_ids, 30)
+
+    page, statements = _statements_for_sales_page(client, '/sales?per_page=10&start_date=not-a-date&end_date=2024-13-45')
+
+    assert 'Invalid start date format.' in page and 'Invalid end date format.' in page
+    assert page.count('Line 2') == 10
+    # Only the keyset page reads sale rows; nothing fetches every sale
+    ordered_reads = [sql for sql in statements if 'FROM sales_records' in sql and 'ORDER BY' in sql]
+    assert ordered_reads and all('LIMIT' in sql for sql in ordered_reads), ordered_reads
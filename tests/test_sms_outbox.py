@@ -0,0 +1,159 @@
+# tests/test_sms_outbox.py
+# The SMS dispatcher against a stub Arkesel gateway (http.server on localhost):
+# delivery status, retry with backoff on 5xx, dedupe keys and the per-business
+# rate limit.
+
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import sms_outbox
+from extensions import db
+from models import Business, SmsMessage
+from sms_outbox import FAILED, PENDING, SENT, SmsDispatcher, enqueue_sms
+
+OK_BODY = {'code': 'ok', 'message': 'Successfully Sent', 'balance': 100}
+
+
+class StubGateway:
+    """Answers each phone number from its scripted (status, body) list, then with success."""
+
+    def __init__(self):
+        self.requests = []
+        self.scripts = {}
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+                gateway.requests.append(params)
+                script = gateway.scripts.get(params.get('to'))
+                status, body = script.pop(0) if script else (200, OK_BODY)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/sms/api'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def sent_to(self, phone):
+        return [params for params in self.requests if params.get('to') == phone]
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    stub = StubGateway()
+    stub.thread.start()
+    monkeypatch.setattr(sms_outbox, 'ARKESEL_SMS_URL', stub.url)
+    monkeypatch.setattr(sms_outbox, 'ARKESEL_API_KEY', 'test-key')
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def dispatcher(app):
+    dispatcher = SmsDispatcher(app, concurrency=2)
+    yield dispatcher
+    dispatcher.executor.shutdown()
+
+
+def _reload(sms_id):
+    db.session.expire_all()
+    return db.session.get(SmsMessage, sms_id)
+
+
+def test_delivered_message_is_marked_sent(business, gateway, dispatcher):
+    sms, created = enqueue_sms(business.id, '024 123 4567', 'Thank you for your purchase.', 'sale_receipt')
+
+    assert created and sms.status == PENDING
+    assert dispatcher.dispatch_once() == 1
+
+    sms = _reload(sms.id)
+    assert (sms.status, sms.attempts, sms.last_error) == (SENT, 1, None)
+    assert sms.sent_at is not None and 'Successfully Sent' in sms.provider_response
+    [request] = gateway.requests
+    assert request['to'] == '233241234567'
+    assert (request['action'], request['api_key'], request['sms']) == ('send-sms', 'test-key', 'Thank you for your purchase.')
+
+
+def test_5xx_is_retried_after_a_backoff(business, gateway, dispatcher):
+    gateway.scripts['233241234567'] = [(503, {'message': 'Service unavailable'})]
+    sms, _ = enqueue_sms(business.id, '0241234567', 'Your order is ready.', 'future_order')
+
+    before = datetime.now()
+    assert dispatcher.dispatch_once() == 1
+    sms = _reload(sms.id)
+    assert (sms.status, sms.attempts, sms.last_error) == (PENDING, 1, 'HTTP 503')
+    # Backoff of RETRY_BASE_SECONDS with jitter, not an immediate retry
+    assert before + timedelta(seconds=sms_outbox.RETRY_BASE_SECONDS * 0.5) <= sms.next_attempt_at
+    assert sms.next_attempt_at <= datetime.now() + timedelta(seconds=sms_outbox.RETRY_BASE_SECONDS)
+    assert dispatcher.dispatch_once() == 0
+
+    sms.next_attempt_at = datetime.now() - timedelta(seconds=1)  # The backoff has elapsed
+    db.session.commit()
+    assert dispatcher.dispatch_once() == 1
+    sms = _reload(sms.id)
+    assert (sms.status, sms.attempts) == (SENT, 2)
+    assert len(gateway.sent_to('233241234567')) == 2
+
+
+def test_retries_stop_at_max_attempts_and_4xx_fails_at_once(business, gateway, dispatcher, monkeypatch):
+    monkeypatch.setattr(sms_outbox, 'MAX_ATTEMPTS', 2)
+    gateway.scripts['233200000001'] = [(500, {}), (502, {})]
+    gateway.scripts['233200000002'] = [(400, {'message': 'Invalid sender id'})]
+    flaky, _ = enqueue_sms(business.id, '0200000001', 'Flaky', 'test')
+    rejected, _ = enqueue_sms(business.id, '0200000002', 'Rejected', 'test')
+
+    dispatcher.dispatch_once()
+    assert _reload(rejected.id).status == FAILED
+    assert 'HTTP 400' in _reload(rejected.id).last_error
+    flaky = _reload(flaky.id)
+    flaky.next_attempt_at = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+    dispatcher.dispatch_once()
+
+    flaky = _reload(flaky.id)
+    assert (flaky.status, flaky.attempts, flaky.last_error) == (FAILED, 2, 'HTTP 502')
+    assert dispatcher.dispatch_once() == 0
+
+
+def test_dedupe_key_queues_and_sends_once(business, gateway, dispatcher):
+    first, created = enqueue_sms(business.id, '0241234567', 'Low stock: Amoxicillin', 'low_stock', dedupe_key='low_stock:1')
+    second, created_again = enqueue_sms(business.id, '0241234567', 'Low stock: Amoxicillin', 'low_stock',
+                                        dedupe_key='low_stock:1')
+
+    assert created and not created_again
+    assert second.id == first.id
+    assert SmsMessage.query.count() == 1
+    dispatcher.dispatch_once()
+    dispatcher.dispatch_once()
+    assert len(gateway.requests) == 1
+
+
+def test_rate_limit_is_per_business(business, gateway, dispatcher, monkeypatch):
+    monkeypatch.setattr(sms_outbox, 'RATE_PER_MINUTE', 3)
+    other = Business(name='Other Shop', type='Hardware')
+    db.session.add(other)
+    db.session.commit()
+    busy = [enqueue_sms(business.id, f'02000001{n:02d}', f'Message {n}', 'test')[0].id for n in range(5)]
+    quiet, _ = enqueue_sms(other.id, '0209999999', 'Hello', 'test')
+
+    assert dispatcher.dispatch_once() == 4
+    statuses = [_reload(sms_id).status for sms_id in busy]
+    assert statuses.count(SENT) == 3 and statuses.count(PENDING) == 2
+    assert _reload(quiet.id).status == SENT
+    # The budget is spent for this minute; the rest wait
+    assert dispatcher.dispatch_once() == 0
+    assert len(gateway.requests) == 4
@@ -0,0 +1,79 @@
+# tests/test_stock_checkout.py
+# Many cashiers selling the same SKU at once: the conditional decrement must
+# never oversell. Each thread checks out one unit at a time, as add_sale does,
+# against a file-backed SQLite database until the stock runs out.
+
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from extensions import db
+from models import InventoryItem, SalesRecord
+from stock_checkout import checkout_quantities, decrement_stock, lock_products
+
+THREADS = 8
+STARTING_STOCK = 200
+
+
+@pytest.fixture
+def sku(business):
+    item = InventoryItem(business_id=business.id, product_name='Hot Seller', category='General', purchase_price=1.0,
+                         sale_price=2.0, current_stock=float(STARTING_STOCK), item_type='Pharmacy', number_of_tabs=1)
+    db.session.add(item)
+    db.session.commit()
+    return business.id, item.id
+
+
+def _checkout(business_id, product_id):
+    """One single-unit sale: True if sold, False if out of stock. Raises OperationalError when SQLite is busy."""
+    try:
+        products = lock_products(business_id, [product_id])
+        quantities = checkout_quantities([(product_id, 1.0, 'piece')], products)
+        if decrement_stock(business_id, quantities, products):
+            db.session.rollback()
+            return False
+        db.session.add(SalesRecord(business_id=business_id, transaction_date=datetime.now(), sales_person_name='Cashier',
+                                   grand_total_amount=2.0))
+        db.session.commit()
+        return True
+    except OperationalError:
+        db.session.rollback()
+        raise
+
+
+def test_concurrent_checkouts_never_oversell(app, sku):
+    business_id, product_id = sku
+    sold, errors = [], []
+    start = threading.Barrier(THREADS)
+
+    def cashier():
+        with app.app_context():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        if not _checkout(business_id, product_id):
+                            return
+                    except OperationalError:
+                        continue  # SQLite allows one writer at a time; the cashier tries again
+                    sold.append(1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=cashier) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+
+    assert not errors, errors
+    assert not any(thread.is_alive() for thread in threads)
+    db.session.expire_all()
+    stock = db.session.get(InventoryItem, product_id).current_stock
+    sales = SalesRecord.query.filter_by(business_id=business_id).count()
+    assert stock == 0
+    assert sales == len(sold) == STARTING_STOCK
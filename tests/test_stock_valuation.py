@@ -0,0 +1,133 @@
+# tests/test_stock_valuation.py
+# The SQL valuation must match the per-item Python loop it replaced.
+
+import pytest
+
+from extensions import db
+from models import Business, InventoryItem
+from stock_valuation import compute_stock_valuation, stocks_by_category
+
+
+def legacy_sale_value_per_base_unit(item, number_of_tabs):
+    """The sale value rules of the loop in dashboard() / reports() before stock_valuation.py."""
+    if item.is_fixed_price:
+        return float(item.fixed_sale_price / number_of_tabs) if number_of_tabs > 0 else 0.0
+    if item.item_type == 'Pharmacy':
+        return float(item.purchase_price * (1 + (item.markup_percentage_pharmacy or 0) / 100) / number_of_tabs) \
+            if number_of_tabs > 0 else 0.0
+    if item.item_type == 'Hardware Material':
+        return item.unit_price_per_tab or 0.0
+    return float(item.sale_price / number_of_tabs) if number_of_tabs > 0 else 0.0
+
+
+def legacy_valuation(items):
+    """Totals, per category and per item_type, computed item by item."""
+    def bucket():
+        return {'item_count': 0, 'stock': 0.0, 'cost_value': 0.0, 'sale_value': 0.0}
+
+    totals, by_category, by_item_type = bucket(), {}, {}
+    for item in items:
+        current_stock = item.current_stock or 0.0
+        number_of_tabs = item.number_of_tabs or 1.0
+        cost_per_base_unit = float(item.purchase_price / number_of_tabs) if number_of_tabs > 0 else 0.0
+        values = {
+            'item_count': 1,
+            'stock': current_stock,
+            'cost_value': current_stock * cost_per_base_unit,
+            'sale_value': current_stock * legacy_sale_value_per_base_unit(item, number_of_tabs),
+        }
+        for target in (totals, by_category.setdefault(item.category or 'Uncategorized', bucket()),
+                       by_item_type.setdefault(item.item_type or 'Unknown', bucket())):
+            for key, value in values.items():
+                target[key] += value
+    return totals, by_category, by_item_type
+
+
+def _item(business, name, **fields):
+    defaults = dict(category='General', purchase_price=10.0, sale_price=15.0, current_stock=20.0,
+                    item_type='Pharmacy', number_of_tabs=1, unit_price_per_tab=0.0, is_fixed_price=False,
+                    fixed_sale_price=0.0, markup_percentage_pharmacy=0.0)
+    defaults.update(fields)
+    return InventoryItem(business_id=business.id, product_name=name, **defaults)
+
+
+@pytest.fixture
+def seeded(business):
+    other = Business(name='Other Business', type='Hardware')
+    db.session.add(other)
+    db.session.flush()
+    db.session.add_all([
+        # Pharmacy: priced by markup on purchase price, per tab
+        _item(business, 'Amoxicillin', category='Antibiotics', purchase_price=24.0, current_stock=300,
+              number_of_tabs=12, markup_percentage_pharmacy=35.0),
+        _item(business, 'Paracetamol', category='Analgesics', purchase_price=5.5, current_stock=1000,
+              number_of_tabs=10, markup_percentage_pharmacy=20.0),
+        _item(business, 'Vitamin C', category='Analgesics', purchase_price=8.0, current_stock=0,
+              number_of_tabs=20, markup_percentage_pharmacy=50.0),
+        # Fixed price wins over the item type's rule
+        _item(business, 'Cough Syrup', category='Syrups', purchase_price=12.0, current_stock=45,
+              number_of_tabs=1, is_fixed_price=True, fixed_sale_price=18.0, markup_percentage_pharmacy=90.0),
+        _item(business, 'Cement Bag', category='Building', item_type='Hardware Material', purchase_price=70.0,
+              current_stock=80, number_of_tabs=1, is_fixed_price=True, fixed_sale_price=85.0),
+        # Hardware: sold per piece at unit_price_per_tab
+        _item(business, 'Nails 2in', category='Building', item_type='Hardware Material', purchase_price=40.0,
+              current_stock=500, number_of_tabs=100, unit_price_per_tab=0.55),
+        _item(business, 'Roofing Sheet', category='Roofing', item_type='Hardware Material', purchase_price=55.0,
+              current_stock=37.5, number_of_tabs=1, unit_price_per_tab=68.0),
+        # Other types: pack sale price per tab; zero tabs falls back to 1
+        _item(business, 'Rice 5kg', category='Groceries', item_type='Supermarket', purchase_price=60.0,
+              sale_price=75.0, current_stock=14, number_of_tabs=1),
+        _item(business, 'Soap Pack', category='Groceries', item_type='Provision Store', purchase_price=18.0,
+              sale_price=24.0, current_stock=66, number_of_tabs=6),
+        _item(business, 'Loose Sweets', category='Snacks', item_type='Provision Store', purchase_price=3.0,
+              sale_price=4.0, current_stock=9, number_of_tabs=0),
+        # Excluded: inactive, and another business
+        _item(business, 'Discontinued', category='Antibiotics', purchase_price=99.0, current_stock=50,
+              is_active=False),
+        _item(other, 'Other Shop Item', category='Building', item_type='Hardware Material', purchase_price=1.0,
+              current_stock=1000, unit_price_per_tab=2.0),
+    ])
+    db.session.commit()
+    return business
+
+
+def _assert_bucket(actual, expected):
+    assert actual['item_count'] == expected['item_count']
+    for key in ('stock', 'cost_value', 'sale_value'):
+        assert actual[key] == pytest.approx(expected[key]), key
+    profit = expected['sale_value'] - expected['cost_value']
+    assert actual['potential_gross_profit'] == pytest.approx(profit)
+    assert actual['profit_margin'] == pytest.approx(profit / expected['sale_value'] * 100)
+
+
+def test_sql_valuation_matches_python_loop(seeded):
+    items = InventoryItem.query.filter_by(business_id=seeded.id, is_active=True).all()
+    totals, by_category, by_item_type = legacy_valuation(items)
+
+    valuation = compute_stock_valuation(seeded.id)
+
+    assert valuation['total_items'] == totals['item_count'] == 10
+    assert valuation['total_stock'] == pytest.approx(totals['stock'])
+    assert valuation['cost_value'] == pytest.approx(totals['cost_value'])
+    assert valuation['sale_value'] == pytest.approx(totals['sale_value'])
+    assert valuation['potential_gross_profit'] == pytest.approx(totals['sale_value'] - totals['cost_value'])
+
+    assert set(valuation['by_category']) == set(by_category)
+    for category, expected in by_category.items():
+        _assert_bucket(valuation['by_category'][category], expected)
+
+    assert set(valuation['by_item_type']) == set(by_item_type)
+    for item_type, expected in by_item_type.items():
+        _assert_bucket(valuation['by_item_type'][item_type], expected)
+
+    assert stocks_by_category(valuation) == pytest.approx(
+        {category: bucket['stock'] for category, bucket in by_category.items()}
+    )
+
+
+def test_empty_inventory(business):
+    valuation = compute_stock_valuation(business.id)
+    assert valuation['total_items'] == 0
+    assert valuation['sale_value'] == 0.0
+    assert valuation['profit_margin'] == 0.0
+    assert valuation['by_category'] == {}